@@ -1,19 +1,29 @@
 # assembler.py
+from collections import namedtuple
 from config import OPCODES
 
+# Result of assemble_program: machine code, label -> address, and for each
+# address the index of the source line it came from
+Program = namedtuple('Program', 'code symbols lines')
+
 def assemble(lines):
     """
     Assemble a list of assembly code lines into a list of integers (machine code).
     Supports Labels (e.g. "LOOP: JUMP LOOP") using a two-pass approach.
     """
+    return assemble_program(lines).code
+
+def assemble_program(lines):
+    """Like assemble(), but also returns the symbol table and line map (a Program)."""
     
     # --- Pass 1: Symbol Table Generation ---
     symbol_table = {}
     cleaned_lines = [] # Lines without labels and comments
+    source_lines = [] # Source line index of each cleaned line
     
     current_address = 0
     
-    for line in lines:
+    for line_index, line in enumerate(lines):
         # 1. Remove comments
         if ';' in line:
             line = line.split(';')[0]
@@ -36,11 +46,13 @@ def assemble(lines):
             # If there is code after label, keep it
             if instruction_part:
                 cleaned_lines.append(instruction_part)
+                source_lines.append(line_index)
                 current_address += 1
             # If line ends with label (e.g. "LOOP:"), don't increment address yet, 
             # next line will be at this address.
         else:
             cleaned_lines.append(line)
+            source_lines.append(line_index)
             current_address += 1
 
     # --- Pass 2: Code Generation ---
@@ -105,4 +117,4 @@ def assemble(lines):
         instruction = (opcode << 12) | operand_val
         machine_code.append(instruction)
         
-    return machine_code
+    return Program(machine_code, symbol_table, source_lines)
@@ -0,0 +1,292 @@
+# batch.py
+# Vectorized multi-instance engine: N independent MAC-1 machines stored as
+# NumPy arrays and stepped one instruction at a time in lockstep.
+# Each step groups the lanes by opcode and applies every group with array
+# operations, so the interpreter overhead is paid per opcode present rather
+# than per machine. Results match CPU.cycle() (and engine.FastEngine)
+# lane by lane, including the default 16-line direct-mapped cache that
+# holds stack words above the end of memory.
+import numpy as np
+
+from engine import FETCH_CYCLES, OPCODE_CYCLES, TYPE_F_CYCLES
+
+_OPCODE_COST = np.array(OPCODE_CYCLES, dtype=np.int64) + FETCH_CYCLES
+_TYPE_F_COST = np.array(TYPE_F_CYCLES, dtype=np.int64) + FETCH_CYCLES
+
+class BatchCPU:
+    def __init__(self, count, memory_size=4096, cache_size=16):
+        self.count = count
+        self.memory_size = memory_size
+        self.cache_size = cache_size
+
+        self.memory = np.zeros((count, memory_size), dtype=np.uint16)
+        self.pc = np.zeros(count, dtype=np.int64)
+        self.ac = np.zeros(count, dtype=np.int64)
+        self.sp = np.zeros(count, dtype=np.int64)
+        self.ir = np.zeros(count, dtype=np.int64)
+        self.mar = np.zeros(count, dtype=np.int64)
+        self.mbr = np.zeros(count, dtype=np.int64)
+        self.n = np.zeros(count, dtype=bool)
+        self.z = np.zeros(count, dtype=bool)
+        self.cycles = np.zeros(count, dtype=np.int64)
+        self.instructions = np.zeros(count, dtype=np.int64)
+        # Halt detection as in CPU: a JUMP to itself, or a jump back that sees
+        # the same registers, flags and memory as the last jump back to the
+        # same target (see CPU.loops_forever)
+        self.halted = np.zeros(count, dtype=bool)
+        self.mutations = np.zeros(count, dtype=np.int64) # Per-lane Memory.mutations
+        self.loop_states = {} # Jump target -> (5, count) array: ac, sp, n, z, mutations (-1: none yet)
+
+        # Per-lane model of hardware.Cache (direct mapped, one word per line)
+        self.cache_valid = np.zeros((count, cache_size), dtype=bool)
+        self.cache_tag = np.zeros((count, cache_size), dtype=np.int64)
+        self.cache_data = np.zeros((count, cache_size), dtype=np.int64)
+        self.last_hit = np.zeros(count, dtype=bool)
+
+    def load(self, image, base=0, lanes=None):
+        """Copies a program/data image into the memory of all lanes (or some)."""
+        words = np.asarray(image, dtype=np.int64) & 0xFFFF
+        end = base + len(words)
+        if base < 0 or end > self.memory_size:
+            raise ValueError(f"Image of {len(words)} words does not fit at address {base}")
+        rows = slice(None) if lanes is None else lanes
+        self.memory[rows, base:end] = words
+
+    def state(self, lane):
+        """Architectural state of one lane, in the CPU's terms."""
+        return {
+            'pc': int(self.pc[lane]), 'ac': int(self.ac[lane]), 'sp': int(self.sp[lane]),
+            'ir': int(self.ir[lane]), 'mar': int(self.mar[lane]), 'mbr': int(self.mbr[lane]),
+            'n_flag': bool(self.n[lane]), 'z_flag': bool(self.z[lane]),
+            'cycle_count': int(self.cycles[lane]),
+            'instruction_count': int(self.instructions[lane]),
+            'halted': bool(self.halted[lane]),
+        }
+
+    # --- Memory through the cache model ---
+    def _evictions(self, lanes, index, hit):
+        """
+        Lanes where a miss evicts a line holding a nonzero word above the end
+        of memory, which then is lost (counted in Memory.mutations).
+        """
+        old = self.cache_tag[lanes, index] * self.cache_size + index
+        return ~hit & self.cache_valid[lanes, index] & (old >= self.memory_size) & \
+            (self.cache_data[lanes, index] != 0)
+
+    def _read(self, lanes, addr):
+        index = addr % self.cache_size
+        tag = addr // self.cache_size
+        hit = self.cache_valid[lanes, index] & (self.cache_tag[lanes, index] == tag)
+        self.mutations[lanes] += self._evictions(lanes, index, hit)
+        inside = addr < self.memory_size
+        from_memory = np.where(inside, self.memory[lanes, np.minimum(addr, self.memory_size - 1)], 0)
+        val = np.where(hit, self.cache_data[lanes, index], from_memory)
+        # A miss allocates the line; a hit rewrites it with the same contents
+        self.cache_valid[lanes, index] = True
+        self.cache_tag[lanes, index] = tag
+        self.cache_data[lanes, index] = val
+        self.last_hit[lanes] = hit
+        return val
+
+    def _write(self, lanes, addr, val):
+        index = addr % self.cache_size
+        tag = addr // self.cache_size
+        hit = self.cache_valid[lanes, index] & (self.cache_tag[lanes, index] == tag)
+        self.last_hit[lanes] = hit
+        inside = addr < self.memory_size
+        # The word changes in memory, or above it in the line only
+        old = np.where(inside, self.memory[lanes, np.minimum(addr, self.memory_size - 1)],
+                       np.where(hit, self.cache_data[lanes, index], 0))
+        self.mutations[lanes] += (old != val) + self._evictions(lanes, index, hit)
+        self.memory[lanes[inside], addr[inside]] = val[inside]
+        # Write-through, write-allocate
+        self.cache_valid[lanes, index] = True
+        self.cache_tag[lanes, index] = tag
+        self.cache_data[lanes, index] = val
+
+    # --- Execution ---
+    def step(self):
+        """
+        Executes one instruction on every lane that has not halted.
+        Returns the number of lanes that ran.
+        """
+        lanes = np.flatnonzero(~self.halted)
+        if lanes.size == 0:
+            return 0
+
+        # Fetch
+        mar = self.pc[lanes]
+        ir = self._read(lanes, mar)
+        pc = (mar + 1) & 0xFFFF
+        mbr = ir.copy()
+        ac = self.ac[lanes]
+        sp = self.sp[lanes]
+        n = self.n[lanes]
+        z = self.z[lanes]
+        opcode = ir >> 12
+        arg = ir & 0xFFF
+        cost = _OPCODE_COST[opcode]
+        halts = np.zeros(lanes.size, dtype=bool)
+        jumped = np.zeros(lanes.size, dtype=bool) # Took a (conditional) jump
+
+        def set_flags(m, res):
+            n[m] = res > 0x7FFF
+            z[m] = res == 0
+
+        for op in np.unique(opcode):
+            m = opcode == op
+            sub = lanes[m]
+            a = arg[m]
+            if op == 0x0: # LODD
+                mar[m] = a
+                val = self._read(sub, a)
+                mbr[m] = val
+                ac[m] = val
+                set_flags(m, val)
+            elif op == 0x1: # STOD
+                mar[m] = a
+                mbr[m] = ac[m]
+                self._write(sub, a, ac[m])
+            elif op in (0x2, 0x3): # ADDD / SUBD
+                mar[m] = a
+                val = self._read(sub, a)
+                mbr[m] = val
+                res = (ac[m] + val if op == 0x2 else ac[m] - val) & 0xFFFF
+                ac[m] = res
+                set_flags(m, res)
+            elif op == 0x4: # JPOS
+                take = m & ~n & ~z
+                pc[take] = arg[take]
+                jumped |= take
+            elif op == 0x5: # JZER
+                take = m & z
+                pc[take] = arg[take]
+                jumped |= take
+            elif op == 0x6: # JUMP
+                pc[m] = a
+                halts[m] = a == mar[m]
+                jumped |= m
+            elif op == 0x7: # LOCO
+                ac[m] = a
+                set_flags(m, a)
+            elif op in (0x8, 0x9, 0xA, 0xB): # Local addressing
+                addr = (sp[m] + a) & 0xFFF
+                mar[m] = addr
+                if op == 0x9: # STOL
+                    mbr[m] = ac[m]
+                    self._write(sub, addr, ac[m])
+                else:
+                    val = self._read(sub, addr)
+                    mbr[m] = val
+                    if op == 0x8: # LODL
+                        res = val
+                    elif op == 0xA: # ADDL
+                        res = (ac[m] + val) & 0xFFFF
+                    else: # SUBL
+                        res = (ac[m] - val) & 0xFFFF
+                    ac[m] = res
+                    set_flags(m, res)
+            elif op == 0xC: # JNEG
+                take = m & n
+                pc[take] = arg[take]
+                jumped |= take
+            elif op == 0xD: # JNZE
+                take = m & ~z
+                pc[take] = arg[take]
+                jumped |= take
+            elif op == 0xE: # CALL
+                new_sp = (sp[m] - 1) & 0xFFFF
+                sp[m] = new_sp
+                mar[m] = new_sp
+                mbr[m] = pc[m]
+                self._write(sub, new_sp, pc[m])
+                pc[m] = a
+            else: # Type F
+                self._type_f(m, lanes, arg, pc, ac, sp, mar, mbr)
+                cost[m] = _TYPE_F_COST[arg[m] >> 8]
+
+        # MAR still holds the address of the jump
+        halts |= self._loops_forever(lanes, jumped & ~halts & (pc <= mar), pc, ac, sp, n, z)
+
+        self.pc[lanes] = pc
+        self.ac[lanes] = ac
+        self.sp[lanes] = sp
+        self.ir[lanes] = ir
+        self.mar[lanes] = mar
+        self.mbr[lanes] = mbr
+        self.n[lanes] = n
+        self.z[lanes] = z
+        self.cycles[lanes] += cost
+        self.instructions[lanes] += 1
+        self.halted[lanes] |= halts
+        return lanes.size
+
+    def _loops_forever(self, lanes, back, pc, ac, sp, n, z):
+        """
+        CPU.loops_forever for the lanes (of `lanes`) where `back` is set.
+        Returns a mask over `lanes`: True where the last jump back to the same
+        target saw the same registers, flags and memory.
+        """
+        result = np.zeros(lanes.size, dtype=bool)
+        taken = np.flatnonzero(back)
+        targets = pc[taken]
+        for target in np.unique(targets):
+            k = taken[targets == target]
+            rows = lanes[k]
+            states = self.loop_states.get(int(target))
+            if states is None:
+                states = self.loop_states[int(target)] = np.full((5, self.count), -1, dtype=np.int64)
+            key = np.stack((ac[k], sp[k], n[k], z[k], self.mutations[rows]))
+            result[k] = (states[:, rows] == key).all(axis=0)
+            states[:, rows] = key
+        return result
+
+    def _type_f(self, m, lanes, arg, pc, ac, sp, mar, mbr):
+        sub_opcode = arg >> 8
+        for code in np.unique(sub_opcode[m]):
+            s = m & (sub_opcode == code)
+            sub = lanes[s]
+            if code == 0x0: # PSHI
+                new_sp = (sp[s] - 1) & 0xFFFF
+                sp[s] = new_sp
+                val = self._read(sub, ac[s])
+                mbr[s] = val
+                mar[s] = new_sp
+                self._write(sub, new_sp, val)
+            elif code == 0x2: # POPI
+                val = self._read(sub, sp[s])
+                mbr[s] = val
+                mar[s] = ac[s]
+                self._write(sub, ac[s], val)
+                sp[s] = (sp[s] + 1) & 0xFFFF
+            elif code == 0x4: # PUSH
+                new_sp = (sp[s] - 1) & 0xFFFF
+                sp[s] = new_sp
+                mar[s] = new_sp
+                mbr[s] = ac[s]
+                self._write(sub, new_sp, ac[s])
+            elif code in (0x6, 0x8): # POP / RETN
+                mar[s] = sp[s]
+                val = self._read(sub, sp[s])
+                mbr[s] = val
+                if code == 0x6:
+                    ac[s] = val
+                else:
+                    pc[s] = val
+                sp[s] = (sp[s] + 1) & 0xFFFF
+            elif code == 0xA: # SWAP
+                ac[s], sp[s] = sp[s], ac[s].copy()
+            elif code == 0xC: # INSP
+                sp[s] = (sp[s] + (arg[s] & 0xFF)) & 0xFFFF
+            elif code == 0xE: # DESP
+                sp[s] = (sp[s] - (arg[s] & 0xFF)) & 0xFFFF
+
+    def run(self, max_steps):
+        """
+        Steps until every lane halted or max_steps instructions ran.
+        Returns the number of steps taken.
+        """
+        for steps in range(max_steps):
+            if self.step() == 0:
+                return steps
+        return max_steps
@@ -0,0 +1,231 @@
+# bench.py
+# Reproducible simulator benchmarks: execution speed of every engine on
+# the examples and on synthetic workloads, assembler throughput and GUI
+# frame rate (SDL dummy driver). Results can be saved as a JSON baseline
+# and later runs compared against it; a metric that drops by more than
+# the threshold is reported as a regression (exit code 1).
+#
+# Every metric is a rate (higher is better) and the best of --repeat
+# runs is kept, which is the most stable number on a busy machine.
+import argparse
+import glob
+import json
+import os
+import platform
+import sys
+import time
+
+import runner
+from assembler import assemble
+
+DEFAULT_CYCLES = 200_000
+DEFAULT_REPEAT = 3
+DEFAULT_THRESHOLD = 0.10
+ASSEMBLE_LINES = 4000
+GUI_FRAMES = 60
+
+# Synthetic workloads. None of them halts: each runs for the cycle budget.
+WORKLOADS = {
+    # Load/add/store on one counter and jump back
+    'laco': """
+        LOCO 1
+        STOD 201
+LOOP:   LODD 200
+        ADDD 201
+        STOD 200
+        JUMP LOOP
+""",
+    # Argument passing on the stack, CALL/RETN on every iteration
+    'pilha': """
+        LOCO 4000
+        SWAP            ; SP = 4000
+        LOCO 1
+        STOD 201
+LOOP:   LODD 200
+        PUSH
+        CALL INC
+        INSP 1
+        STOD 200
+        JUMP LOOP
+INC:    LODL 1
+        ADDD 201
+        RETN
+""",
+    # Reads 16 words apart, so every access maps to the same line of the
+    # default direct-mapped cache and misses
+    'stride': """
+        LOCO 4000
+        SWAP
+        LOCO 16
+        STOD 201
+LOOP:   LODD 200
+        PSHI            ; Reads Mem[AC]
+        POP
+        LODD 200
+        ADDD 201
+        STOD 200
+        JUMP LOOP
+""",
+}
+
+def load_workloads(example_dir):
+    """name -> machine code for the synthetic workloads and the example programs."""
+    programs = {name: assemble(source.splitlines()) for name, source in WORKLOADS.items()}
+    for path in sorted(glob.glob(os.path.join(example_dir, '*.asm'))):
+        name = os.path.splitext(os.path.basename(path))[0]
+        programs[name] = runner.load_program(path)
+    return programs
+
+def measure_engine(code, engine, cycles):
+    """
+    Runs the program (from a fresh CPU each time it halts) for about
+    `cycles` micro-cycles. Returns (cycles/s, instructions/s).
+    """
+    spent = instructions = 0
+    elapsed = 0.0
+    while spent < cycles:
+        cpu = runner.make_cpu(code)
+        start = time.perf_counter()
+        runner.run(cpu, cycles - spent, engine)
+        elapsed += time.perf_counter() - start
+        if cpu.cycle_count == 0:
+            break
+        spent += cpu.cycle_count
+        instructions += cpu.instruction_count
+    elapsed = max(elapsed, 1e-9)
+    return spent / elapsed, instructions / elapsed
+
+def assembler_source(lines):
+    """A large program: labels, comments and every kind of operand."""
+    source = []
+    mnemonics = ('LODD 500', 'STOD 501', 'ADDD 0x1F4', 'SUBD 502', 'LOCO 7', 'LODL 1', 'PUSH', 'POP')
+    for i in range(lines):
+        if i % 16 == 0:
+            source.append(f"L{i}:  JUMP L{(i + 16) % lines}   ; salto")
+        else:
+            source.append(f"      {mnemonics[i % len(mnemonics)]}   ; comentario {i}")
+    return source
+
+def measure_assembler(lines, repeat):
+    """Source lines assembled per second."""
+    source = assembler_source(lines)
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        assemble(source)
+        best = min(best, time.perf_counter() - start)
+    return lines / max(best, 1e-9)
+
+def measure_gui(code, frames, repeat):
+    """GUI.draw_cpu frames per second under the SDL dummy driver, or None without pygame."""
+    os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+    try:
+        import pygame
+        from gui import GUI
+    except ImportError:
+        return None
+    cpu = runner.make_cpu(code)
+    gui = GUI()
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(frames):
+            cpu.cycle()
+            gui.draw_cpu(cpu)
+        best = min(best, time.perf_counter() - start)
+    pygame.quit()
+    return frames / max(best, 1e-9)
+
+def run_benchmarks(engines=runner.ENGINES, cycles=DEFAULT_CYCLES, repeat=DEFAULT_REPEAT,
+                   example_dir='examples', gui=True):
+    """Returns {metric: {'value': rate, 'unit': unit}}."""
+    results = {}
+    for name, code in load_workloads(example_dir).items():
+        for engine in engines:
+            best = max(measure_engine(code, engine, cycles) for _ in range(repeat))
+            results[f"{name}/{engine}/ciclos"] = {'value': best[0], 'unit': 'ciclos/s'}
+            results[f"{name}/{engine}/instrucoes"] = {'value': best[1], 'unit': 'instr/s'}
+    results['assembler'] = {'value': measure_assembler(ASSEMBLE_LINES, repeat), 'unit': 'linhas/s'}
+    if gui:
+        fps = measure_gui(assemble(WORKLOADS['laco'].splitlines()), GUI_FRAMES, repeat)
+        if fps is not None:
+            results['gui/draw_cpu'] = {'value': fps, 'unit': 'quadros/s'}
+    return results
+
+def regressions(results, baseline, threshold=DEFAULT_THRESHOLD):
+    """[(metric, baseline value, new value)] for every metric that dropped by more than threshold."""
+    found = []
+    for name, entry in results.items():
+        old = baseline.get(name)
+        if old is not None and entry['value'] < old['value'] * (1 - threshold):
+            found.append((name, old['value'], entry['value']))
+    return found
+
+def save_baseline(path, results):
+    data = {
+        'meta': {
+            'python': platform.python_version(),
+            'machine': platform.machine(),
+            'platform': platform.platform(),
+            'date': time.strftime('%Y-%m-%d %H:%M:%S'),
+        },
+        'results': results,
+    }
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=2)
+
+def load_baseline(path):
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)['results']
+
+def format_results(results, baseline=None):
+    lines = [f"{'Medida':<36} {'Valor':>14} {'Unidade':<10}" + (f" {'Base':>14} {'Variacao':>9}" if baseline else "")]
+    for name, entry in results.items():
+        line = f"{name:<36} {entry['value']:>14,.0f} {entry['unit']:<10}"
+        old = baseline.get(name) if baseline else None
+        if old is not None:
+            change = 100 * (entry['value'] / old['value'] - 1) if old['value'] else 0.0
+            line += f" {old['value']:>14,.0f} {change:>+8.1f}%"
+        lines.append(line)
+    return lines
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Mede o desempenho do simulador.")
+    parser.add_argument("--engines", default=",".join(runner.ENGINES),
+                        help="modos de execucao a medir (padrao: %(default)s)")
+    parser.add_argument("--cycles", type=int, default=DEFAULT_CYCLES, help="ciclos por medida")
+    parser.add_argument("--repeat", type=int, default=DEFAULT_REPEAT, help="repeticoes (vale a melhor)")
+    parser.add_argument("--examples", default="examples", help="diretorio com programas .asm")
+    parser.add_argument("--no-gui", action="store_true", help="nao mede a interface grafica")
+    parser.add_argument("--save", metavar="ARQUIVO", help="grava os resultados como base JSON")
+    parser.add_argument("--compare", metavar="ARQUIVO", help="compara com uma base JSON")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="queda relativa considerada regressao (padrao: %(default)s)")
+    args = parser.parse_args(argv)
+
+    engines = args.engines.split(',')
+    unknown = [engine for engine in engines if engine not in runner.ENGINES]
+    if unknown:
+        print(f"Erro: modo desconhecido: {', '.join(unknown)}", file=sys.stderr)
+        return 2
+    try:
+        baseline = load_baseline(args.compare) if args.compare else None
+    except (OSError, ValueError, KeyError) as e:
+        print(f"Erro: {e}", file=sys.stderr)
+        return 2
+
+    results = run_benchmarks(engines, args.cycles, args.repeat, args.examples, not args.no_gui)
+    print("\n".join(format_results(results, baseline)))
+    if args.save:
+        save_baseline(args.save, results)
+
+    if baseline is not None:
+        found = regressions(results, baseline, args.threshold)
+        for name, old, new in found:
+            print(f"REGRESSAO {name}: {old:,.0f} -> {new:,.0f}")
+        if found:
+            return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,242 @@
+# cachesim.py
+# Cache design-space exploration from an address trace. The references a
+# program sends through Cache.read/Cache.write are recorded once, then the
+# LRU stack distance of every reference gives the hit rate of all
+# associativities for a given number of sets in a single pass (Mattson's
+# stack algorithm), instead of re-running the program per configuration.
+#
+# A reference with stack distance d inside its set (d = number of distinct
+# blocks of that set used since its last use) hits in an LRU cache of that
+# set count iff d < ways. FIFO and random replacement are not stack
+# algorithms; use hardware.Cache directly for those.
+#
+# AccessCounter keeps per-address counts instead of the whole stream
+# (the memory heatmap of the GUI).
+import argparse
+import itertools
+import json
+import sys
+from array import array
+
+import runner
+
+class TraceRecorder:
+    """
+    Records every address the CPU reads or writes through its cache
+    (instruction fetches included). Wraps cache.read/cache.write like the
+    watchpoints do, so start it after arming any watchpoints.
+    """
+    def __init__(self, cpu):
+        self.cpu = cpu
+        self.addresses = array('H')
+        self.writes = bytearray() # 1 where the reference was a write
+
+    def __len__(self):
+        return len(self.addresses)
+
+    def start(self):
+        cache = self.cpu.cache
+        read, write = cache.read, cache.write
+        append_addr = self.addresses.append
+        append_kind = self.writes.append
+
+        def traced_read(addr):
+            append_addr(addr)
+            append_kind(0)
+            return read(addr)
+
+        def traced_write(addr, val):
+            append_addr(addr)
+            append_kind(1)
+            write(addr, val)
+
+        cache.read = traced_read
+        cache.write = traced_write
+        return self
+
+    def stop(self):
+        vars(self.cpu.cache).pop('read', None)
+        vars(self.cpu.cache).pop('write', None)
+        self.cpu.update_watch_hooks()
+
+ADDRESSES = 0x10000
+
+class AccessCounter:
+    """
+    Per-address access statistics: read and write counts, when each
+    address was last accessed (numbered in access order, 0 = never) and
+    whether that access hit the cache. Hooks the cache like TraceRecorder.
+    """
+    def __init__(self, cpu):
+        self.cpu = cpu
+        # 64-bit counters: long runs go past 2**32 accesses
+        self.reads = array('Q', bytes(8 * ADDRESSES))
+        self.writes = array('Q', bytes(8 * ADDRESSES))
+        self.last = array('Q', bytes(8 * ADDRESSES))
+        self.hit = bytearray(ADDRESSES)
+        self._tick = itertools.count(1).__next__
+        self._hooks = (None, None)
+
+    def now(self):
+        """A number after every access so far (takes one from the access numbering)."""
+        return self._tick()
+
+    def start(self):
+        cache = self.cpu.cache
+        read, write = cache.read, cache.write
+        reads, writes, last, hit = self.reads, self.writes, self.last, self.hit
+        tick = self._tick
+
+        def counted_read(addr):
+            val = read(addr)
+            reads[addr] += 1
+            last[addr] = tick()
+            hit[addr] = cache.last_access_type == "HIT"
+            return val
+
+        def counted_write(addr, val):
+            write(addr, val)
+            writes[addr] += 1
+            last[addr] = tick()
+            hit[addr] = cache.last_access_type == "HIT"
+
+        cache.read = counted_read
+        cache.write = counted_write
+        self._hooks = (counted_read, counted_write)
+        return self
+
+    def attached(self):
+        """False once the hooks were removed (e.g. by CPU.update_watch_hooks)."""
+        return vars(self.cpu.cache).get('read') is self._hooks[0]
+
+    def stop(self):
+        vars(self.cpu.cache).pop('read', None)
+        vars(self.cpu.cache).pop('write', None)
+        self.cpu.update_watch_hooks()
+
+def record_program(machine_code, max_cycles=runner.DEFAULT_MAX_CYCLES, engine='fast'):
+    """Runs a program and returns (status, recorder) with its reference stream."""
+    cpu = runner.make_cpu(machine_code)
+    recorder = TraceRecorder(cpu).start()
+    status = runner.run(cpu, max_cycles, engine)
+    recorder.stop()
+    return status, recorder
+
+def stack_distances(addresses, num_sets, block_size=1, depth=64):
+    """
+    Histogram of LRU stack distances for a cache with num_sets sets.
+    Returns a list of depth counts; references whose distance is depth or
+    more (including first uses) are not counted, as they miss in every
+    cache with at most depth ways.
+    """
+    stacks = [[] for _ in range(num_sets)] # Per set, most recently used block first
+    hist = [0] * depth
+    for addr in addresses:
+        block = addr // block_size
+        stack = stacks[block % num_sets]
+        try:
+            distance = stack.index(block)
+        except ValueError:
+            stack.insert(0, block)
+            if len(stack) > depth:
+                stack.pop()
+            continue
+        if distance:
+            del stack[distance]
+            stack.insert(0, block)
+        hist[distance] += 1
+    return hist
+
+def miss_ratios(addresses, sizes, ways, block_size=1):
+    """
+    Miss ratio of every LRU cache with `size` lines of block_size words and
+    `w` ways, for size in sizes and w in ways (None = fully associative).
+    Returns {(size, ways): ratio}; geometries that do not divide are skipped.
+    One trace pass per distinct number of sets.
+    """
+    configs = {}
+    for size in sizes:
+        for w in ways:
+            w = size if w is None else w
+            if w <= size and size % w == 0:
+                configs.setdefault(size // w, set()).add(w)
+
+    total = len(addresses)
+    result = {}
+    for num_sets, set_ways in sorted(configs.items()):
+        hist = stack_distances(addresses, num_sets, block_size, max(set_ways))
+        hits = 0
+        cumulative = [] # cumulative[w - 1] = hits with w ways
+        for count in hist:
+            hits += count
+            cumulative.append(hits)
+        for w in set_ways:
+            result[(num_sets * w, w)] = 1 - cumulative[w - 1] / total if total else 0.0
+    return result
+
+def parse_ways(text):
+    """"1,2,4,full" -> [1, 2, 4, None]"""
+    return [None if item.strip().lower() == 'full' else int(item) for item in text.split(',')]
+
+def format_curve(name, ratios, sizes, ways, block_size):
+    """Miss-ratio table: one row per cache size, one column per associativity."""
+    headers = ['total' if w is None else f"{w}-way" for w in ways]
+    lines = [f"{name} (bloco de {block_size} palavra{'s' if block_size > 1 else ''}, taxa de faltas %)"]
+    lines.append(f"{'Linhas':>7} " + " ".join(f"{h:>8}" for h in headers))
+    for size in sizes:
+        cells = []
+        for w in ways:
+            ratio = ratios.get((size, size if w is None else w))
+            cells.append(f"{'-':>8}" if ratio is None else f"{100 * ratio:8.2f}")
+        lines.append(f"{size:>7} " + " ".join(cells))
+    return lines
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Curvas de taxa de faltas da cache (LRU) para varios tamanhos e associatividades, "
+                    "a partir de uma unica execucao de cada programa.")
+    parser.add_argument("programs", nargs="+", help="arquivos .asm")
+    parser.add_argument("--sizes", default="1,2,4,8,16,32,64,128,256",
+                        help="numeros de linhas (padrao: %(default)s)")
+    parser.add_argument("--ways", default="1,2,4,8,full",
+                        help="associatividades; 'full' = totalmente associativa (padrao: %(default)s)")
+    parser.add_argument("--blocks", default="1", help="palavras por linha (padrao: %(default)s)")
+    parser.add_argument("--max-cycles", type=int, default=runner.DEFAULT_MAX_CYCLES)
+    parser.add_argument("--engine", choices=runner.ENGINES, default='fast')
+    parser.add_argument("--json", metavar="ARQUIVO", help="grava as curvas em JSON")
+    args = parser.parse_args(argv)
+
+    try:
+        sizes = [int(item) for item in args.sizes.split(',')]
+        ways = parse_ways(args.ways)
+        blocks = [int(item) for item in args.blocks.split(',')]
+    except ValueError as e:
+        print(f"Erro: {e}", file=sys.stderr)
+        return 2
+
+    report = {}
+    for path in args.programs:
+        try:
+            status, trace = record_program(runner.load_program(path), args.max_cycles, args.engine)
+        except (OSError, ValueError) as e:
+            print(f"Erro: {path}: {e}", file=sys.stderr)
+            return 2
+        print(f"{path}: {status}, {len(trace)} acessos ({sum(trace.writes)} escritas)")
+        report[path] = {'status': status, 'references': len(trace), 'curves': []}
+        for block_size in blocks:
+            ratios = miss_ratios(trace.addresses, sizes, ways, block_size)
+            print("\n".join(format_curve(path, ratios, sizes, ways, block_size)))
+            print()
+            report[path]['curves'].append({
+                'block_size': block_size,
+                'miss_ratio': [{'lines': size, 'ways': w, 'ratio': ratio}
+                               for (size, w), ratio in sorted(ratios.items())],
+            })
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
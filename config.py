@@ -27,6 +27,7 @@ COLOR_CACHE_MISS = (200, 0, 0)       # Red
 SCREEN_WIDTH = 1200
 SCREEN_HEIGHT = 800
 FPS = 60
+HISTORY_CAPACITY = 1_000_000 # Entries kept by the execution history (ring buffer)
 
 # Layout Constants
 REG_WIDTH = 160
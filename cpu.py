@@ -1,9 +1,41 @@
 # cpu.py
+import time
+from collections import namedtuple
 from hardware import Register, Memory, Cache, ALU
 from config import OPCODES
+from decoder import MPC, OPERAND, SUB_OPCODE
+
+# Datapath components, one bit each in CPU.active
+PATH_PC = 0x001
+PATH_AC = 0x002
+PATH_SP = 0x004
+PATH_IR = 0x008
+PATH_TIR = 0x010
+PATH_MAR = 0x020
+PATH_MBR = 0x040
+PATH_ALU = 0x080
+PATH_CACHE = 0x100
+PATH_BITS = {
+    'PC': PATH_PC, 'AC': PATH_AC, 'SP': PATH_SP, 'IR': PATH_IR, 'TIR': PATH_TIR,
+    'MAR': PATH_MAR, 'MBR': PATH_MBR, 'ALU': PATH_ALU, 'Cache': PATH_CACHE
+}
+
+# Memory operation of the last micro-instruction (CPU.mem_op)
+MEM_NONE = 0
+MEM_READ = 1
+MEM_WRITE = 2
+
+# State right after a micro-instruction: everything its description needs
+MicroState = namedtuple('MicroState', 'mpc pc ac sp ir mar mbr n z')
+
+# Micro-cycles between wall-clock checks in CPU.run
+TIME_CHECK_CYCLES = 4096
+
+class BreakpointHit(Exception):
+    """Raised by CPU.checked_fetch to leave a fast execution loop."""
 
 class CPU:
-    def __init__(self):
+    def __init__(self, cache_options=None):
         # Registers
         self.pc = Register("PC")
         self.ac = Register("AC")
@@ -15,513 +47,777 @@ class CPU:
         
         # Hardware
         self.memory = Memory()
-        self.cache = Cache(self.memory)
+        self.cache = Cache(self.memory, **(cache_options or {})) # See hardware.Cache for the options
         self.alu = ALU()
         
         # Control State
         self.mpc = 0 # Micro Program Counter
+        self.cycle_count = 0 # Micro-instructions executed
+        self.instruction_count = 0 # MAC-1 instructions fetched
+
+        # Halt detection. MAC-1 has no HALT: programs end in a JUMP to
+        # itself or in a loop that no longer changes anything.
+        self.halted = False
+        self.loop_states = {} # Jump target -> state at the last backward jump there
+
+        # Debugging. Breakpoints stop before the instruction at a PC or the
+        # micro-instruction at an MPC; watchpoints stop after an access to a
+        # memory address. Nothing is checked while all of them are empty.
+        self.breakpoints = set()
+        self.micro_breakpoints = set()
+        self.read_watches = set()
+        self.write_watches = set()
+        self.break_reason = None # ("PC" | "MPC" | "READ" | "WRITE", value) of the last stop
+        self.break_cycle = None # cycle_count at that stop
+        self.watch_hit = None
+        self._resuming = False
         
-        # Signals for GUI visualization
-        self.signals = {
-            'read_mem': False,
-            'write_mem': False,
-            'alu_op': None,
-            'active_path': [] # List of components active
-        }
-        self.last_action_desc = "CPU Inicializada"
+        # Signals of the last micro-instruction (read by the GUI).
+        # Kept compact so headless runs pay no allocation per cycle;
+        # `signals` and `last_action_desc` are built only when asked for.
+        self.active = 0 # PATH_* bitmask
+        self.mem_op = MEM_NONE
+        self.alu_op = None
+        self.last_mpc = None # MPC of the last executed micro-instruction
+        self._action_desc = "CPU Inicializada"
 
     def reset_signals(self):
-        self.signals = {
-            'read_mem': False,
-            'write_mem': False,
-            'alu_op': None,
-            'active_path': []
+        self.active = 0
+        self.mem_op = MEM_NONE
+        self.alu_op = None
+
+    @property
+    def signals(self):
+        """Signals of the last micro-instruction as a dict."""
+        active = self.active
+        return {
+            'read_mem': self.mem_op == MEM_READ,
+            'write_mem': self.mem_op == MEM_WRITE,
+            'alu_op': self.alu_op,
+            'active_path': [name for name, bit in PATH_BITS.items() if active & bit]
         }
 
+    def is_active(self, name):
+        """True if the datapath component was used by the last micro-instruction."""
+        return (self.active & PATH_BITS[name]) != 0
+
+    def snapshot(self):
+        return MicroState(self.last_mpc, self.pc.read(), self.ac.read(), self.sp.read(),
+                          self.ir.read(), self.mar.read(), self.mbr.read(),
+                          self.alu.n_flag, self.alu.z_flag)
+
+    @property
+    def last_action_desc(self):
+        """
+        Description of the last micro-instruction. Formatted on demand from
+        the current state, so it must be read before the next cycle.
+        """
+        if self.last_mpc is None:
+            return self._action_desc
+        return describe(self.snapshot())
+
+    @last_action_desc.setter
+    def last_action_desc(self, text):
+        self.last_mpc = None
+        self._action_desc = text
+
+    def loops_forever(self, pc, ac, sp, n, z):
+        """
+        Called on a taken jump back to pc. True if the previous jump back to pc
+        saw the same registers and flags and memory has not changed since:
+        the machine is in a fixed point and will only repeat itself.
+        """
+        key = (ac, sp, n, z, self.memory.mutations)
+        if self.loop_states.get(pc) == key:
+            return True
+        self.loop_states[pc] = key
+        return False
+
+    def _jumped(self, target):
+        # Taken jump; MAR still holds the address of the jump itself
+        if target <= self.mar.read() and self.loops_forever(
+                target, self.ac.read(), self.sp.read(), self.alu.n_flag, self.alu.z_flag):
+            self.halted = True
+
+    def run(self, max_cycles, max_time=None, observer=None):
+        """
+        Micro-steps until the program halts, max_cycles micro-instructions
+        ran, max_time seconds passed or a breakpoint/watchpoint is hit
+        (see break_reason). observer, if given, is called with the CPU
+        after every micro-instruction (e.g. to keep an execution history).
+        Returns "HALTED", "BUDGET", "TIMEOUT" or "BREAK".
+        """
+        deadline = None if max_time is None else time.perf_counter() + max_time
+        cycle = self.cycle
+        if observer is not None:
+            def cycle(step=cycle):
+                step()
+                observer(self)
+        checked = self.debug_armed
+        self._start_debug_run()
+        remaining = max_cycles
+        while not self.halted:
+            if remaining <= 0:
+                return "BUDGET"
+            if deadline is not None and time.perf_counter() >= deadline:
+                return "TIMEOUT"
+            chunk = min(remaining, TIME_CHECK_CYCLES)
+            remaining -= chunk
+            if checked:
+                for _ in range(chunk):
+                    if self._checked_cycle(cycle):
+                        self.break_cycle = self.cycle_count
+                        return "BREAK"
+                    if self.halted:
+                        break
+            else:
+                for _ in range(chunk):
+                    cycle()
+                    if self.halted:
+                        break
+        return "HALTED"
+
+    # --- Breakpoints and watchpoints ---
+    @property
+    def debug_armed(self):
+        return bool(self.breakpoints or self.micro_breakpoints
+                    or self.read_watches or self.write_watches)
+
+    def add_watchpoint(self, addr, read=True, write=True):
+        if read:
+            self.read_watches.add(addr)
+        if write:
+            self.write_watches.add(addr)
+        self.update_watch_hooks()
+
+    def remove_watchpoint(self, addr):
+        self.read_watches.discard(addr)
+        self.write_watches.discard(addr)
+        self.update_watch_hooks()
+
+    def clear_breakpoints(self):
+        self.breakpoints.clear()
+        self.micro_breakpoints.clear()
+        self.read_watches.clear()
+        self.write_watches.clear()
+        self.update_watch_hooks()
+
+    def update_watch_hooks(self):
+        """
+        Wraps cache.read/cache.write to record accesses to watched addresses
+        (instruction fetches included). Must be called after changing the
+        watch sets directly; without watchpoints the cache is left untouched.
+        """
+        cache = self.cache
+        vars(cache).pop('read', None)
+        vars(cache).pop('write', None)
+        if self.read_watches:
+            read, read_watches = cache.read, self.read_watches
+            def watched_read(addr):
+                if addr in read_watches:
+                    self.watch_hit = ("READ", addr)
+                return read(addr)
+            cache.read = watched_read
+        if self.write_watches:
+            write, write_watches = cache.write, self.write_watches
+            def watched_write(addr, val):
+                write(addr, val)
+                if addr in write_watches:
+                    self.watch_hit = ("WRITE", addr)
+            cache.write = watched_write
+
+    def _start_debug_run(self):
+        # Do not stop again right where the last run stopped
+        self._resuming = self.break_reason is not None and self.break_cycle == self.cycle_count
+        self.break_reason = None
+        self.watch_hit = None
+
+    def _take_watch_hit(self):
+        self.break_reason = self.watch_hit
+        self.watch_hit = None
+
+    def breakpoint_reason(self):
+        """Breakpoint at the current PC/MPC, i.e. before the next cycle(), or None."""
+        mpc = self.mpc
+        if mpc == 0 and self.pc.read() in self.breakpoints:
+            return ("PC", self.pc.read())
+        if mpc in self.micro_breakpoints:
+            return ("MPC", mpc)
+        return None
+
+    def pending_break(self):
+        """
+        For callers stepping with cycle(): returns (and records in
+        break_reason) a watchpoint hit by the last cycle or a breakpoint
+        before the next one. None if execution can go on.
+        """
+        if self.watch_hit is not None:
+            self._take_watch_hit()
+        else:
+            self.break_reason = self.breakpoint_reason()
+        self.break_cycle = self.cycle_count
+        return self.break_reason
+
+    def checked_fetch(self, addr):
+        """
+        Instruction fetch used by the fast engines while debugging is armed.
+        Raises BreakpointHit, before touching the cache, when execution must
+        stop at this instruction boundary.
+        """
+        if self.watch_hit is not None:
+            self._take_watch_hit()
+            raise BreakpointHit
+        if addr in self.breakpoints and not self._resuming:
+            self.break_reason = ("PC", addr)
+            raise BreakpointHit
+        self._resuming = False
+        return self.cache.read(addr)
+
+    def _checked_cycle(self, cycle):
+        """cycle() with breakpoint and watchpoint checks. True if it stopped instead."""
+        if not self._resuming:
+            self.break_reason = self.breakpoint_reason()
+            if self.break_reason is not None:
+                return True
+        self._resuming = False
+        cycle()
+        if self.watch_hit is not None:
+            self._take_watch_hit()
+            return True
+        return False
+
     def decode_instruction(self, ir_value):
         """
-        Maps the opcode (high 4 bits of IR) to the starting MPC address
-        of the corresponding microroutine.
+        Maps an instruction word to the starting MPC address of the
+        microroutine of its opcode (see decoder.MPC).
         """
-        opcode = (ir_value >> 12) & 0xF
-        
-        # Mapping based on Tanenbaum's MIC-1 (Standard)
-        mapping = {
-            0x0: 10, # LODD
-            0x1: 15, # STOD
-            0x2: 20, # ADDD
-            0x3: 25, # SUBD
-            0x4: 30, # JPOS
-            0x5: 35, # JZER
-            0x6: 40, # JUMP
-            0x7: 45, # LOCO
-            0x8: 50, # LODL
-            0x9: 55, # STOL
-            0xA: 60, # ADDL
-            0xB: 65, # SUBL
-            0xC: 70, # JNEG
-            0xD: 75, # JNZE
-            0xE: 80, # CALL
-            0xF: 90  # PSHI/POP/etc (Special decoding needed)
-        }
-        
-        return mapping.get(opcode, 0) # Default to 0 (reset) if unknown
+        return MPC[ir_value & 0xFFFF]
 
     def cycle(self):
         """
         Executes ONE micro-instruction step.
-        Returns True if running, False if halted (not really used here).
+        The control store maps the current MPC to its micro-instruction,
+        which updates the datapath and sets the next MPC.
         """
         self.reset_signals()
+        self.cycle_count += 1
         
-        match self.mpc:
-            # --- FETCH CYCLE (0-2) ---
-            case 0:
-                # MAR <- PC; MPC = 1
-                self.mar.write(self.pc.read())
-                self.signals['active_path'] = ['PC', 'MAR']
-                self.last_action_desc = f"Busca: MAR <- PC ({self.pc.read()})"
-                self.mpc = 1
-                
-            case 1:
-                # PC <- PC + 1; MBR <- Memory[MAR]; MPC = 2
-                old_pc = self.pc.read()
-                self.pc.write(old_pc + 1)
-                val = self.cache.read(self.mar.read())
-                self.mbr.write(val)
-                
-                self.signals['read_mem'] = True
-                self.signals['active_path'] = ['PC', 'ALU', 'PC', 'Cache', 'MBR']
-                self.last_action_desc = f"Busca: PC incrementado ({old_pc}->{self.pc.read()}), MBR <- Mem[{self.mar.read()}] ({val})"
-                self.mpc = 2
-                
-            case 2:
-                # IR <- MBR; MPC = decode(IR)
-                self.ir.write(self.mbr.read())
-                self.signals['active_path'] = ['MBR', 'IR']
-                self.last_action_desc = f"Busca: IR <- MBR ({self.mbr.read()}). Decodificando..."
-                self.mpc = self.decode_instruction(self.ir.read())
-
-            # --- LODD (Load Direct) ---
-            case 10:
-                addr = self.ir.read() & 0xFFF
-                self.mar.write(addr)
-                self.signals['active_path'] = ['IR', 'MAR']
-                self.last_action_desc = f"LODD: MAR <- Endereço ({addr})"
-                self.mpc = 11
-            case 11:
-                val = self.cache.read(self.mar.read())
-                self.mbr.write(val)
-                self.ac.write(val)
-                # Update Flags (Pass through ALU logic conceptually)
-                self.alu.update_flags(val)
-                self.signals['read_mem'] = True
-                self.signals['active_path'] = ['Cache', 'MBR', 'AC']
-                self.last_action_desc = f"LODD: AC <- Mem[{self.mar.read()}] ({val})"
-                self.mpc = 0
-
-            # --- LODL (Load Local) ---
-            case 50:
-                offset = self.ir.read() & 0xFFF
-                # Simulate ALU addition: SP + offset
-                addr = (self.sp.read() + offset) & 0xFFF
-                self.mar.write(addr)
-                self.signals['alu_op'] = 'ADD'
-                self.signals['active_path'] = ['SP', 'IR', 'ALU', 'MAR']
-                self.last_action_desc = f"LODL: MAR <- SP + {offset} ({addr})"
-                self.mpc = 51
-            case 51:
-                val = self.cache.read(self.mar.read())
-                self.mbr.write(val)
-                self.ac.write(val)
-                # Update Flags
-                self.alu.update_flags(val)
-                self.signals['read_mem'] = True
-                self.signals['active_path'] = ['Cache', 'MBR', 'AC']
-                self.last_action_desc = f"LODL: AC <- Mem[{self.mar.read()}] ({val})"
-                self.mpc = 0
-
-            # --- STOL (Store Local) ---
-            case 55:
-                offset = self.ir.read() & 0xFFF
-                addr = (self.sp.read() + offset) & 0xFFF
-                self.mar.write(addr)
-                self.signals['alu_op'] = 'ADD'
-                self.signals['active_path'] = ['SP', 'IR', 'ALU', 'MAR']
-                self.last_action_desc = f"STOL: MAR <- SP + {offset} ({addr})"
-                self.mpc = 56
-            case 56:
-                self.mbr.write(self.ac.read())
-                self.cache.write(self.mar.read(), self.mbr.read())
-                self.signals['write_mem'] = True
-                self.signals['active_path'] = ['AC', 'MBR', 'Cache']
-                self.last_action_desc = f"STOL: Mem[{self.mar.read()}] <- AC ({self.ac.read()})"
-                self.mpc = 0
-
-            # --- ADDL (Add Local) ---
-            case 60:
-                offset = self.ir.read() & 0xFFF
-                addr = (self.sp.read() + offset) & 0xFFF
-                self.mar.write(addr)
-                self.signals['alu_op'] = 'ADD'
-                self.signals['active_path'] = ['SP', 'IR', 'ALU', 'MAR']
-                self.last_action_desc = f"ADDL: MAR <- SP + {offset} ({addr})"
-                self.mpc = 61
-            case 61:
-                val = self.cache.read(self.mar.read())
-                self.mbr.write(val)
-                self.signals['read_mem'] = True
-                self.signals['active_path'] = ['Cache', 'MBR']
-                self.last_action_desc = f"ADDL: MBR <- Mem[{self.mar.read()}] ({val})"
-                self.mpc = 62
-            case 62:
-                old_ac = self.ac.read()
-                res = self.alu.add(old_ac, self.mbr.read())
-                self.ac.write(res)
-                self.signals['alu_op'] = 'ADD'
-                self.signals['active_path'] = ['AC', 'MBR', 'ALU', 'AC']
-                self.last_action_desc = f"ADDL: AC <- {old_ac} + {self.mbr.read()} = {res}"
-                self.mpc = 0
-
-            # --- SUBL (Sub Local) ---
-            case 65:
-                offset = self.ir.read() & 0xFFF
-                addr = (self.sp.read() + offset) & 0xFFF
-                self.mar.write(addr)
-                self.signals['alu_op'] = 'ADD'
-                self.signals['active_path'] = ['SP', 'IR', 'ALU', 'MAR']
-                self.last_action_desc = f"SUBL: MAR <- SP + {offset} ({addr})"
-                self.mpc = 66
-            case 66:
-                val = self.cache.read(self.mar.read())
-                self.mbr.write(val)
-                self.signals['read_mem'] = True
-                self.signals['active_path'] = ['Cache', 'MBR']
-                self.last_action_desc = f"SUBL: MBR <- Mem[{self.mar.read()}] ({val})"
-                self.mpc = 67
-            case 67:
-                old_ac = self.ac.read()
-                res = self.alu.sub(old_ac, self.mbr.read())
-                self.ac.write(res)
-                self.signals['alu_op'] = 'SUB'
-                self.signals['active_path'] = ['AC', 'MBR', 'ALU', 'AC']
-                self.last_action_desc = f"SUBL: AC <- {old_ac} - {self.mbr.read()} = {res}"
-                self.mpc = 0
-
-            # --- STOD (Store Direct) ---
-            case 15:
-                addr = self.ir.read() & 0xFFF
-                self.mar.write(addr)
-                self.signals['active_path'] = ['IR', 'MAR']
-                self.last_action_desc = f"STOD: MAR <- Endereço ({addr})"
-                self.mpc = 16
-            case 16:
-                self.mbr.write(self.ac.read())
-                self.cache.write(self.mar.read(), self.mbr.read())
-                self.signals['write_mem'] = True
-                self.signals['active_path'] = ['AC', 'MBR', 'Cache']
-                self.last_action_desc = f"STOD: Mem[{self.mar.read()}] <- AC ({self.ac.read()})"
-                self.mpc = 0
-
-            # --- ADDD (Add Direct) ---
-            case 20:
-                addr = self.ir.read() & 0xFFF
-                self.mar.write(addr)
-                self.signals['active_path'] = ['IR', 'MAR']
-                self.last_action_desc = f"ADDD: MAR <- Endereço ({addr})"
-                self.mpc = 21
-            case 21:
-                val = self.cache.read(self.mar.read())
-                self.mbr.write(val)
-                self.signals['read_mem'] = True
-                self.signals['active_path'] = ['Cache', 'MBR']
-                self.last_action_desc = f"ADDD: MBR <- Mem[{self.mar.read()}] ({val})"
-                self.mpc = 22
-            case 22:
-                old_ac = self.ac.read()
-                res = self.alu.add(old_ac, self.mbr.read())
-                self.ac.write(res)
-                self.signals['alu_op'] = 'ADD'
-                self.signals['active_path'] = ['AC', 'MBR', 'ALU', 'AC']
-                self.last_action_desc = f"ADDD: AC <- {old_ac} + {self.mbr.read()} = {res}"
-                self.mpc = 0
-
-            # --- SUBD (Sub Direct) ---
-            case 25:
-                addr = self.ir.read() & 0xFFF
-                self.mar.write(addr)
-                self.signals['active_path'] = ['IR', 'MAR']
-                self.last_action_desc = f"SUBD: MAR <- Endereço ({addr})"
-                self.mpc = 26
-            case 26:
-                val = self.cache.read(self.mar.read())
-                self.mbr.write(val)
-                self.signals['read_mem'] = True
-                self.signals['active_path'] = ['Cache', 'MBR']
-                self.last_action_desc = f"SUBD: MBR <- Mem[{self.mar.read()}] ({val})"
-                self.mpc = 27
-            case 27:
-                old_ac = self.ac.read()
-                res = self.alu.sub(old_ac, self.mbr.read())
-                self.ac.write(res)
-                self.signals['alu_op'] = 'SUB'
-                self.signals['active_path'] = ['AC', 'MBR', 'ALU', 'AC']
-                self.last_action_desc = f"SUBD: AC <- {old_ac} - {self.mbr.read()} = {res}"
-                self.mpc = 0
-
-            # --- JPOS (Jump if Positive) ---
-            # --- JPOS (Jump if Positive) ---
-            case 30:
-                jumped = False
-                self.signals['active_path'] = ['AC'] # Visually still related to AC/Flags
-                # Use ALU flags: Positive means NOT Negative and NOT Zero
-                if not self.alu.n_flag and not self.alu.z_flag:
-                     self.pc.write(self.ir.read() & 0xFFF)
-                     jumped = True
-                     self.signals['active_path'] = ['AC', 'IR', 'PC']
-                self.last_action_desc = f"JPOS: {'Pulou' if jumped else 'Não pulou'} (N={self.alu.n_flag}, Z={self.alu.z_flag})"
-                self.mpc = 0
-
-            # --- JZER (Jump if Zero) ---
-            # --- JZER (Jump if Zero) ---
-            case 35:
-                jumped = False
-                self.signals['active_path'] = ['AC']
-                if self.alu.z_flag:
-                    self.pc.write(self.ir.read() & 0xFFF)
-                    jumped = True
-                    self.signals['active_path'] = ['AC', 'IR', 'PC']
-                self.last_action_desc = f"JZER: {'Pulou' if jumped else 'Não pulou'} (Z={self.alu.z_flag})"
-                self.mpc = 0
-
-            # --- JNEG (Jump if Negative) ---
-            # --- JNEG (Jump if Negative) ---
-            case 70:
-                jumped = False
-                self.signals['active_path'] = ['AC']
-                if self.alu.n_flag:
-                     self.pc.write(self.ir.read() & 0xFFF)
-                     jumped = True
-                     self.signals['active_path'] = ['AC', 'IR', 'PC']
-                self.last_action_desc = f"JNEG: {'Pulou' if jumped else 'Não pulou'} (N={self.alu.n_flag})"
-                self.mpc = 0
-
-            # --- JNZE (Jump if Non-Zero) ---
-            # --- JNZE (Jump if Non-Zero) ---
-            case 75:
-                jumped = False
-                self.signals['active_path'] = ['AC']
-                if not self.alu.z_flag:
-                    self.pc.write(self.ir.read() & 0xFFF)
-                    jumped = True
-                    self.signals['active_path'] = ['AC', 'IR', 'PC']
-                self.last_action_desc = f"JNZE: {'Pulou' if jumped else 'Não pulou'} (Z={self.alu.z_flag})"
-                self.mpc = 0
-
-            # --- JUMP (Unconditional) ---
-            case 40:
-                addr = self.ir.read() & 0xFFF
-                self.pc.write(addr)
-                self.signals['active_path'] = ['IR', 'PC']
-                self.last_action_desc = f"JUMP: PC <- {addr}"
-                self.mpc = 0
-
-            # --- LOCO (Load Constant) ---
-            # --- LOCO (Load Constant) ---
-            case 45:
-                val = self.ir.read() & 0xFFF
-                self.ac.write(val)
-                self.alu.update_flags(val)
-                self.signals['active_path'] = ['IR', 'AC']
-                self.last_action_desc = f"LOCO: AC <- Constante {val}"
-                self.mpc = 0
-            
-            # --- CALL (Call Subroutine) ---
-            case 80:
-                self.sp.write(self.sp.read() - 1)
-                self.signals['active_path'] = ['SP']
-                self.last_action_desc = f"CALL: Decrementa SP ({self.sp.read()})"
-                self.mpc = 81
-            case 81:
-                self.mar.write(self.sp.read())
-                self.mbr.write(self.pc.read())
-                self.signals['active_path'] = ['SP', 'MAR', 'PC', 'MBR']
-                self.last_action_desc = f"CALL: MAR <- SP, MBR <- PC ({self.pc.read()})"
-                self.mpc = 82
-            case 82:
-                self.cache.write(self.mar.read(), self.mbr.read())
-                self.signals['write_mem'] = True
-                self.signals['active_path'] = ['MBR', 'Cache']
-                self.last_action_desc = f"CALL: Salva PC na Pilha (Mem[{self.mar.read()}])"
-                self.mpc = 83
-            case 83:
-                addr = self.ir.read() & 0xFFF
-                self.pc.write(addr)
-                self.signals['active_path'] = ['IR', 'PC']
-                self.last_action_desc = f"CALL: PC <- Endereço Subrotina ({addr})"
-                self.mpc = 0
-
-            # --- Type F (Stack / Special) ---
-            # --- Type F (Stack / Special) ---
-            case 90:
-                # Use bits 11-8 of the 12-bit address field as discriminator
-                # IR: [Opcode 4][Addr 12]
-                # Addr 12: [Discriminator 4][Operand 8]
-                # low_bits = IR & 0xFFF
-                low_bits = self.ir.read() & 0xFFF
-                sub_opcode = (low_bits >> 8) & 0xF
-                operand = low_bits & 0xFF
-
-                if sub_opcode == 0x0: # PSHI (0x000)
-                    # Mem[SP-1] <- Mem[AC]; SP <- SP-1
-                    self.sp.write(self.sp.read() - 1)
-                    self.signals['active_path'] = ['SP']
-                    self.last_action_desc = "PSHI: Decrementa SP"
-                    self.mpc = 100 # Jump to PSHI routine
-                
-                elif sub_opcode == 0x2: # POPI (0x200)
-                    # Mem[AC] <- Mem[SP]; SP <- SP+1
-                    self.mar.write(self.sp.read())
-                    self.signals['active_path'] = ['SP', 'MAR']
-                    self.last_action_desc = "POPI: MAR <- SP"
-                    self.mpc = 105 # Jump to POPI routine
-
-                elif sub_opcode == 0x4: # PUSH (0x400)
-                    self.sp.write(self.sp.read() - 1)
-                    self.signals['active_path'] = ['SP']
-                    self.last_action_desc = "PUSH: Decrementa SP"
-                    self.mpc = 91
-
-                elif sub_opcode == 0x6: # POP (0x600)
-                    self.mar.write(self.sp.read())
-                    self.signals['active_path'] = ['SP', 'MAR']
-                    self.last_action_desc = "POP: MAR <- SP"
-                    self.mpc = 94
-
-                elif sub_opcode == 0x8: # RETN (0x800)
-                    self.mar.write(self.sp.read())
-                    self.signals['active_path'] = ['SP', 'MAR']
-                    self.last_action_desc = "RETN: MAR <- SP"
-                    self.mpc = 97
-
-                elif sub_opcode == 0xA: # SWAP (0xA00)
-                    tmp = self.ac.read()
-                    self.ac.write(self.sp.read())
-                    self.sp.write(tmp)
-                    self.signals['active_path'] = ['AC', 'SP']
-                    self.last_action_desc = "SWAP: Troca AC e SP"
-                    self.mpc = 0
-
-                elif sub_opcode == 0xC: # INSP (0xC00)
-                    # INSP: SP <- SP + operand
-                    self.sp.write(self.sp.read() + operand)
-                    self.signals['active_path'] = ['SP', 'IR', 'ALU', 'SP']
-                    self.last_action_desc = f"INSP: SP <- SP + {operand}"
-                    self.mpc = 0
-
-                elif sub_opcode == 0xE: # DESP (0xE00)
-                    # DESP: SP <- SP - operand
-                    self.sp.write(self.sp.read() - operand)
-                    self.signals['active_path'] = ['SP', 'IR', 'ALU', 'SP']
-                    self.last_action_desc = f"DESP: SP <- SP - {operand}"
-                    self.mpc = 0
-                else:
-                    self.last_action_desc = f"Instrução F Desconhecida (Sub: {sub_opcode:X})"
-                    self.mpc = 0
-
-            # --- PSHI Implementation ---
-            case 100:
-                # Need to read Mem[AC]. So MAR <- AC
-                self.mar.write(self.ac.read())
-                self.signals['active_path'] = ['AC', 'MAR']
-                self.last_action_desc = "PSHI: MAR <- AC"
-                self.mpc = 101
-            case 101:
-                val = self.cache.read(self.mar.read())
-                self.mbr.write(val)
-                self.signals['read_mem'] = True
-                self.signals['active_path'] = ['Cache', 'MBR']
-                self.last_action_desc = f"PSHI: MBR <- Mem[AC] ({val})"
-                self.mpc = 102
-            case 102:
-                # Now write MBR to Mem[SP] (SP was decremented in case 90)
-                self.mar.write(self.sp.read())
-                self.signals['active_path'] = ['SP', 'MAR']
-                self.last_action_desc = "PSHI: MAR <- SP"
-                self.mpc = 103
-            case 103:
-                self.cache.write(self.mar.read(), self.mbr.read())
-                self.signals['write_mem'] = True
-                self.signals['active_path'] = ['MBR', 'Cache']
-                self.last_action_desc = f"PSHI: Mem[SP] <- MBR ({self.mbr.read()})"
-                self.mpc = 0
-
-            # --- POPI Implementation ---
-            case 105:
-                # MAR <- SP (done in 90). Read Mem[SP]
-                val = self.cache.read(self.mar.read())
-                self.mbr.write(val)
-                self.signals['read_mem'] = True
-                self.signals['active_path'] = ['Cache', 'MBR']
-                self.last_action_desc = f"POPI: MBR <- Mem[SP] ({val})"
-                self.mpc = 106
-            case 106:
-                # Now write MBR to Mem[AC]
-                self.mar.write(self.ac.read())
-                self.signals['active_path'] = ['AC', 'MAR']
-                self.last_action_desc = "POPI: MAR <- AC"
-                self.mpc = 107
-            case 107:
-                self.cache.write(self.mar.read(), self.mbr.read())
-                self.sp.write(self.sp.read() + 1) # Increment SP
-                self.signals['write_mem'] = True
-                self.signals['active_path'] = ['MBR', 'Cache', 'SP']
-                self.last_action_desc = f"POPI: Mem[AC] <- MBR ({self.mbr.read()}), Inc SP"
-                self.mpc = 0
-
-            # --- PUSH Implementation ---
-            case 91:
-                self.mar.write(self.sp.read())
-                self.mbr.write(self.ac.read())
-                self.signals['active_path'] = ['SP', 'MAR', 'AC', 'MBR']
-                self.last_action_desc = "PUSH: MAR <- SP, MBR <- AC"
-                self.mpc = 92
-            case 92:
-                self.cache.write(self.mar.read(), self.mbr.read())
-                self.signals['write_mem'] = True
-                self.last_action_desc = f"PUSH: Mem[{self.mar.read()}] <- AC ({self.ac.read()})"
-                self.mpc = 0
-
-            # --- POP Implementation ---
-            case 94:
-                val = self.cache.read(self.mar.read())
-                self.mbr.write(val)
-                self.signals['read_mem'] = True
-                self.signals['active_path'] = ['Cache', 'MBR']
-                self.last_action_desc = f"POP: MBR <- Mem[{self.mar.read()}] ({val})"
-                self.mpc = 95
-            case 95:
-                self.ac.write(self.mbr.read())
-                self.sp.write(self.sp.read() + 1)
-                self.signals['active_path'] = ['MBR', 'AC', 'SP']
-                self.last_action_desc = f"POP: AC <- MBR, Incrementa SP"
-                self.mpc = 0
-
-            # --- RETN Implementation ---
-            case 97:
-                val = self.cache.read(self.mar.read())
-                self.mbr.write(val)
-                self.signals['read_mem'] = True
-                self.signals['active_path'] = ['Cache', 'MBR']
-                self.last_action_desc = f"RETN: MBR <- Mem[{self.mar.read()}] ({val})"
-                self.mpc = 98
-            case 98:
-                self.pc.write(self.mbr.read())
-                self.sp.write(self.sp.read() + 1)
-                self.signals['active_path'] = ['MBR', 'PC', 'SP']
-                self.last_action_desc = f"RETN: PC <- MBR ({self.mbr.read()}), Incrementa SP"
-                self.mpc = 0
-
-            case _:
-                self.last_action_desc = "Ciclo Desconhecido"
-                self.mpc = 0
+        mpc = self.mpc
+        self.last_mpc = mpc
+        if mpc < CONTROL_STORE_SIZE:
+            CONTROL_STORE[mpc](self)
+        else:
+            self._unknown()
+
+    # --- FETCH CYCLE (0-2) ---
+    def _fetch0(self):
+        # MAR <- PC; MPC = 1
+        self.mar.write(self.pc.read())
+        self.active = PATH_PC | PATH_MAR
+        self.mpc = 1
+
+    def _fetch1(self):
+        # PC <- PC + 1; MBR <- Memory[MAR]; MPC = 2
+        self.pc.write(self.pc.read() + 1)
+        self.mbr.write(self.cache.read(self.mar.read()))
+        self.mem_op = MEM_READ
+        self.active = PATH_PC | PATH_ALU | PATH_CACHE | PATH_MBR
+        self.mpc = 2
+
+    def _fetch2(self):
+        # IR <- MBR; MPC = decode(IR)
+        self.ir.write(self.mbr.read())
+        self.instruction_count += 1
+        self.active = PATH_MBR | PATH_IR
+        self.mpc = MPC[self.ir.read()]
+
+    # --- LODD (Load Direct) ---
+    def _lodd10(self):
+        addr = self.ir.read() & 0xFFF
+        self.mar.write(addr)
+        self.active = PATH_IR | PATH_MAR
+        self.mpc = 11
+
+    def _lodd11(self):
+        val = self.cache.read(self.mar.read())
+        self.mbr.write(val)
+        self.ac.write(val)
+        # Update Flags (Pass through ALU logic conceptually)
+        self.alu.update_flags(val)
+        self.mem_op = MEM_READ
+        self.active = PATH_CACHE | PATH_MBR | PATH_AC
+        self.mpc = 0
+
+    # --- STOD (Store Direct) ---
+    def _stod15(self):
+        addr = self.ir.read() & 0xFFF
+        self.mar.write(addr)
+        self.active = PATH_IR | PATH_MAR
+        self.mpc = 16
+
+    def _stod16(self):
+        self.mbr.write(self.ac.read())
+        self.cache.write(self.mar.read(), self.mbr.read())
+        self.mem_op = MEM_WRITE
+        self.active = PATH_AC | PATH_MBR | PATH_CACHE
+        self.mpc = 0
+
+    # --- ADDD (Add Direct) ---
+    def _addd20(self):
+        addr = self.ir.read() & 0xFFF
+        self.mar.write(addr)
+        self.active = PATH_IR | PATH_MAR
+        self.mpc = 21
+
+    def _addd21(self):
+        self.mbr.write(self.cache.read(self.mar.read()))
+        self.mem_op = MEM_READ
+        self.active = PATH_CACHE | PATH_MBR
+        self.mpc = 22
+
+    def _addd22(self):
+        self.ac.write(self.alu.add(self.ac.read(), self.mbr.read()))
+        self.alu_op = 'ADD'
+        self.active = PATH_AC | PATH_MBR | PATH_ALU
+        self.mpc = 0
+
+    # --- SUBD (Sub Direct) ---
+    def _subd25(self):
+        addr = self.ir.read() & 0xFFF
+        self.mar.write(addr)
+        self.active = PATH_IR | PATH_MAR
+        self.mpc = 26
+
+    def _subd26(self):
+        self.mbr.write(self.cache.read(self.mar.read()))
+        self.mem_op = MEM_READ
+        self.active = PATH_CACHE | PATH_MBR
+        self.mpc = 27
+
+    def _subd27(self):
+        self.ac.write(self.alu.sub(self.ac.read(), self.mbr.read()))
+        self.alu_op = 'SUB'
+        self.active = PATH_AC | PATH_MBR | PATH_ALU
+        self.mpc = 0
+
+    # --- JPOS (Jump if Positive) ---
+    def _jpos30(self):
+        self.active = PATH_AC # Visually still related to AC/Flags
+        # Use ALU flags: Positive means NOT Negative and NOT Zero
+        if not self.alu.n_flag and not self.alu.z_flag:
+            self.pc.write(self.ir.read() & 0xFFF)
+            self.active = PATH_AC | PATH_IR | PATH_PC
+            self._jumped(self.pc.read())
+        self.mpc = 0
+
+    # --- JZER (Jump if Zero) ---
+    def _jzer35(self):
+        self.active = PATH_AC
+        if self.alu.z_flag:
+            self.pc.write(self.ir.read() & 0xFFF)
+            self.active = PATH_AC | PATH_IR | PATH_PC
+            self._jumped(self.pc.read())
+        self.mpc = 0
+
+    # --- JUMP (Unconditional) ---
+    def _jump40(self):
+        addr = self.ir.read() & 0xFFF
+        self.pc.write(addr)
+        self.active = PATH_IR | PATH_PC
+        if addr == self.mar.read():
+            self.halted = True # JUMP to itself
+        else:
+            self._jumped(addr)
+        self.mpc = 0
+
+    # --- LOCO (Load Constant) ---
+    def _loco45(self):
+        val = self.ir.read() & 0xFFF
+        self.ac.write(val)
+        self.alu.update_flags(val)
+        self.active = PATH_IR | PATH_AC
+        self.mpc = 0
+
+    # --- LODL (Load Local) ---
+    def _lodl50(self):
+        offset = self.ir.read() & 0xFFF
+        # Simulate ALU addition: SP + offset
+        addr = (self.sp.read() + offset) & 0xFFF
+        self.mar.write(addr)
+        self.alu_op = 'ADD'
+        self.active = PATH_SP | PATH_IR | PATH_ALU | PATH_MAR
+        self.mpc = 51
+
+    def _lodl51(self):
+        val = self.cache.read(self.mar.read())
+        self.mbr.write(val)
+        self.ac.write(val)
+        # Update Flags
+        self.alu.update_flags(val)
+        self.mem_op = MEM_READ
+        self.active = PATH_CACHE | PATH_MBR | PATH_AC
+        self.mpc = 0
+
+    # --- STOL (Store Local) ---
+    def _stol55(self):
+        offset = self.ir.read() & 0xFFF
+        addr = (self.sp.read() + offset) & 0xFFF
+        self.mar.write(addr)
+        self.alu_op = 'ADD'
+        self.active = PATH_SP | PATH_IR | PATH_ALU | PATH_MAR
+        self.mpc = 56
+
+    def _stol56(self):
+        self.mbr.write(self.ac.read())
+        self.cache.write(self.mar.read(), self.mbr.read())
+        self.mem_op = MEM_WRITE
+        self.active = PATH_AC | PATH_MBR | PATH_CACHE
+        self.mpc = 0
+
+    # --- ADDL (Add Local) ---
+    def _addl60(self):
+        offset = self.ir.read() & 0xFFF
+        addr = (self.sp.read() + offset) & 0xFFF
+        self.mar.write(addr)
+        self.alu_op = 'ADD'
+        self.active = PATH_SP | PATH_IR | PATH_ALU | PATH_MAR
+        self.mpc = 61
+
+    def _addl61(self):
+        self.mbr.write(self.cache.read(self.mar.read()))
+        self.mem_op = MEM_READ
+        self.active = PATH_CACHE | PATH_MBR
+        self.mpc = 62
+
+    def _addl62(self):
+        self.ac.write(self.alu.add(self.ac.read(), self.mbr.read()))
+        self.alu_op = 'ADD'
+        self.active = PATH_AC | PATH_MBR | PATH_ALU
+        self.mpc = 0
+
+    # --- SUBL (Sub Local) ---
+    def _subl65(self):
+        offset = self.ir.read() & 0xFFF
+        addr = (self.sp.read() + offset) & 0xFFF
+        self.mar.write(addr)
+        self.alu_op = 'ADD'
+        self.active = PATH_SP | PATH_IR | PATH_ALU | PATH_MAR
+        self.mpc = 66
+
+    def _subl66(self):
+        self.mbr.write(self.cache.read(self.mar.read()))
+        self.mem_op = MEM_READ
+        self.active = PATH_CACHE | PATH_MBR
+        self.mpc = 67
+
+    def _subl67(self):
+        self.ac.write(self.alu.sub(self.ac.read(), self.mbr.read()))
+        self.alu_op = 'SUB'
+        self.active = PATH_AC | PATH_MBR | PATH_ALU
+        self.mpc = 0
+
+    # --- JNEG (Jump if Negative) ---
+    def _jneg70(self):
+        self.active = PATH_AC
+        if self.alu.n_flag:
+            self.pc.write(self.ir.read() & 0xFFF)
+            self.active = PATH_AC | PATH_IR | PATH_PC
+            self._jumped(self.pc.read())
+        self.mpc = 0
+
+    # --- JNZE (Jump if Non-Zero) ---
+    def _jnze75(self):
+        self.active = PATH_AC
+        if not self.alu.z_flag:
+            self.pc.write(self.ir.read() & 0xFFF)
+            self.active = PATH_AC | PATH_IR | PATH_PC
+            self._jumped(self.pc.read())
+        self.mpc = 0
+
+    # --- CALL (Call Subroutine) ---
+    def _call80(self):
+        self.sp.write(self.sp.read() - 1)
+        self.active = PATH_SP
+        self.mpc = 81
+
+    def _call81(self):
+        self.mar.write(self.sp.read())
+        self.mbr.write(self.pc.read())
+        self.active = PATH_SP | PATH_MAR | PATH_PC | PATH_MBR
+        self.mpc = 82
+
+    def _call82(self):
+        self.cache.write(self.mar.read(), self.mbr.read())
+        self.mem_op = MEM_WRITE
+        self.active = PATH_MBR | PATH_CACHE
+        self.mpc = 83
+
+    def _call83(self):
+        addr = self.ir.read() & 0xFFF
+        self.pc.write(addr)
+        self.active = PATH_IR | PATH_PC
+        self.mpc = 0
+
+    # --- Type F (Stack / Special) ---
+    def _type_f90(self):
+        # Bits 11-8 of IR select the instruction, bits 7-0 are its operand
+        # IR: [Opcode 4][Discriminator 4][Operand 8]
+        word = self.ir.read()
+        TYPE_F_STORE[SUB_OPCODE[word]](self, OPERAND[word])
+
+    def _pshi90(self, operand):
+        # Mem[SP-1] <- Mem[AC]; SP <- SP-1
+        self.sp.write(self.sp.read() - 1)
+        self.active = PATH_SP
+        self.mpc = 100 # Jump to PSHI routine
+
+    def _popi90(self, operand):
+        # Mem[AC] <- Mem[SP]; SP <- SP+1
+        self.mar.write(self.sp.read())
+        self.active = PATH_SP | PATH_MAR
+        self.mpc = 105 # Jump to POPI routine
+
+    def _push90(self, operand):
+        self.sp.write(self.sp.read() - 1)
+        self.active = PATH_SP
+        self.mpc = 91
+
+    def _pop90(self, operand):
+        self.mar.write(self.sp.read())
+        self.active = PATH_SP | PATH_MAR
+        self.mpc = 94
+
+    def _retn90(self, operand):
+        self.mar.write(self.sp.read())
+        self.active = PATH_SP | PATH_MAR
+        self.mpc = 97
+
+    def _swap90(self, operand):
+        tmp = self.ac.read()
+        self.ac.write(self.sp.read())
+        self.sp.write(tmp)
+        self.active = PATH_AC | PATH_SP
+        self.mpc = 0
+
+    def _insp90(self, operand):
+        # INSP: SP <- SP + operand
+        self.sp.write(self.sp.read() + operand)
+        self.active = PATH_SP | PATH_IR | PATH_ALU
+        self.mpc = 0
+
+    def _desp90(self, operand):
+        # DESP: SP <- SP - operand
+        self.sp.write(self.sp.read() - operand)
+        self.active = PATH_SP | PATH_IR | PATH_ALU
+        self.mpc = 0
+
+    def _unknown_f90(self, operand):
+        self.mpc = 0
+
+    # --- PUSH Implementation ---
+    def _push91(self):
+        self.mar.write(self.sp.read())
+        self.mbr.write(self.ac.read())
+        self.active = PATH_SP | PATH_MAR | PATH_AC | PATH_MBR
+        self.mpc = 92
+
+    def _push92(self):
+        self.cache.write(self.mar.read(), self.mbr.read())
+        self.mem_op = MEM_WRITE
+        self.mpc = 0
+
+    # --- POP Implementation ---
+    def _pop94(self):
+        self.mbr.write(self.cache.read(self.mar.read()))
+        self.mem_op = MEM_READ
+        self.active = PATH_CACHE | PATH_MBR
+        self.mpc = 95
+
+    def _pop95(self):
+        self.ac.write(self.mbr.read())
+        self.sp.write(self.sp.read() + 1)
+        self.active = PATH_MBR | PATH_AC | PATH_SP
+        self.mpc = 0
+
+    # --- RETN Implementation ---
+    def _retn97(self):
+        self.mbr.write(self.cache.read(self.mar.read()))
+        self.mem_op = MEM_READ
+        self.active = PATH_CACHE | PATH_MBR
+        self.mpc = 98
+
+    def _retn98(self):
+        self.pc.write(self.mbr.read())
+        self.sp.write(self.sp.read() + 1)
+        self.active = PATH_MBR | PATH_PC | PATH_SP
+        self.mpc = 0
+
+    # --- PSHI Implementation ---
+    def _pshi100(self):
+        # Need to read Mem[AC]. So MAR <- AC
+        self.mar.write(self.ac.read())
+        self.active = PATH_AC | PATH_MAR
+        self.mpc = 101
+
+    def _pshi101(self):
+        self.mbr.write(self.cache.read(self.mar.read()))
+        self.mem_op = MEM_READ
+        self.active = PATH_CACHE | PATH_MBR
+        self.mpc = 102
+
+    def _pshi102(self):
+        # Now write MBR to Mem[SP] (SP was decremented at MPC 90)
+        self.mar.write(self.sp.read())
+        self.active = PATH_SP | PATH_MAR
+        self.mpc = 103
+
+    def _pshi103(self):
+        self.cache.write(self.mar.read(), self.mbr.read())
+        self.mem_op = MEM_WRITE
+        self.active = PATH_MBR | PATH_CACHE
+        self.mpc = 0
+
+    # --- POPI Implementation ---
+    def _popi105(self):
+        # MAR <- SP (done at MPC 90). Read Mem[SP]
+        self.mbr.write(self.cache.read(self.mar.read()))
+        self.mem_op = MEM_READ
+        self.active = PATH_CACHE | PATH_MBR
+        self.mpc = 106
+
+    def _popi106(self):
+        # Now write MBR to Mem[AC]
+        self.mar.write(self.ac.read())
+        self.active = PATH_AC | PATH_MAR
+        self.mpc = 107
+
+    def _popi107(self):
+        self.cache.write(self.mar.read(), self.mbr.read())
+        self.sp.write(self.sp.read() + 1) # Increment SP
+        self.mem_op = MEM_WRITE
+        self.active = PATH_MBR | PATH_CACHE | PATH_SP
+        self.mpc = 0
+
+    def _unknown(self):
+        self.mpc = 0
+
+# --- Control Store ---
+# Micro-instruction executed at each MPC address. Unused addresses fall
+# back to CPU._unknown, which restarts the fetch cycle.
+CONTROL_STORE_SIZE = 108
+CONTROL_STORE = [CPU._unknown] * CONTROL_STORE_SIZE
+for _mpc, _micro in {
+    0: CPU._fetch0, 1: CPU._fetch1, 2: CPU._fetch2,
+    10: CPU._lodd10, 11: CPU._lodd11,
+    15: CPU._stod15, 16: CPU._stod16,
+    20: CPU._addd20, 21: CPU._addd21, 22: CPU._addd22,
+    25: CPU._subd25, 26: CPU._subd26, 27: CPU._subd27,
+    30: CPU._jpos30,
+    35: CPU._jzer35,
+    40: CPU._jump40,
+    45: CPU._loco45,
+    50: CPU._lodl50, 51: CPU._lodl51,
+    55: CPU._stol55, 56: CPU._stol56,
+    60: CPU._addl60, 61: CPU._addl61, 62: CPU._addl62,
+    65: CPU._subl65, 66: CPU._subl66, 67: CPU._subl67,
+    70: CPU._jneg70,
+    75: CPU._jnze75,
+    80: CPU._call80, 81: CPU._call81, 82: CPU._call82, 83: CPU._call83,
+    90: CPU._type_f90,
+    91: CPU._push91, 92: CPU._push92,
+    94: CPU._pop94, 95: CPU._pop95,
+    97: CPU._retn97, 98: CPU._retn98,
+    100: CPU._pshi100, 101: CPU._pshi101, 102: CPU._pshi102, 103: CPU._pshi103,
+    105: CPU._popi105, 106: CPU._popi106, 107: CPU._popi107,
+}.items():
+    CONTROL_STORE[_mpc] = _micro
+del _mpc, _micro
+
+# First micro-instruction of each type F instruction, executed at MPC 90.
+# Indexed by the sub-opcode (bits 11-8 of IR); odd sub-opcodes are unknown.
+TYPE_F_STORE = (
+    CPU._pshi90, CPU._unknown_f90, # 0x0 PSHI
+    CPU._popi90, CPU._unknown_f90, # 0x2 POPI
+    CPU._push90, CPU._unknown_f90, # 0x4 PUSH
+    CPU._pop90, CPU._unknown_f90,  # 0x6 POP
+    CPU._retn90, CPU._unknown_f90, # 0x8 RETN
+    CPU._swap90, CPU._unknown_f90, # 0xA SWAP
+    CPU._insp90, CPU._unknown_f90, # 0xC INSP
+    CPU._desp90, CPU._unknown_f90, # 0xE DESP
+)
+
+# --- Descriptions ---
+# Text shown in the history log for each micro-instruction, rebuilt from the
+# state right after it executed (see MicroState).
+def _describe_type_f(s):
+    sub_opcode = SUB_OPCODE[s.ir]
+    match sub_opcode:
+        case 0x0: return "PSHI: Decrementa SP"
+        case 0x2: return "POPI: MAR <- SP"
+        case 0x4: return "PUSH: Decrementa SP"
+        case 0x6: return "POP: MAR <- SP"
+        case 0x8: return "RETN: MAR <- SP"
+        case 0xA: return "SWAP: Troca AC e SP"
+        case 0xC: return f"INSP: SP <- SP + {s.ir & 0xFF}"
+        case 0xE: return f"DESP: SP <- SP - {s.ir & 0xFF}"
+    return f"Instrução F Desconhecida (Sub: {sub_opcode:X})"
+
+def _jump_text(jumped):
+    return 'Pulou' if jumped else 'Não pulou'
+
+DESCRIPTIONS = {
+    0: lambda s: f"Busca: MAR <- PC ({s.pc})",
+    1: lambda s: f"Busca: PC incrementado ({(s.pc - 1) & 0xFFFF}->{s.pc}), MBR <- Mem[{s.mar}] ({s.mbr})",
+    2: lambda s: f"Busca: IR <- MBR ({s.mbr}). Decodificando...",
+    10: lambda s: f"LODD: MAR <- Endereço ({s.ir & 0xFFF})",
+    11: lambda s: f"LODD: AC <- Mem[{s.mar}] ({s.mbr})",
+    15: lambda s: f"STOD: MAR <- Endereço ({s.ir & 0xFFF})",
+    16: lambda s: f"STOD: Mem[{s.mar}] <- AC ({s.ac})",
+    20: lambda s: f"ADDD: MAR <- Endereço ({s.ir & 0xFFF})",
+    21: lambda s: f"ADDD: MBR <- Mem[{s.mar}] ({s.mbr})",
+    22: lambda s: f"ADDD: AC <- {(s.ac - s.mbr) & 0xFFFF} + {s.mbr} = {s.ac}",
+    25: lambda s: f"SUBD: MAR <- Endereço ({s.ir & 0xFFF})",
+    26: lambda s: f"SUBD: MBR <- Mem[{s.mar}] ({s.mbr})",
+    27: lambda s: f"SUBD: AC <- {(s.ac + s.mbr) & 0xFFFF} - {s.mbr} = {s.ac}",
+    30: lambda s: f"JPOS: {_jump_text(not s.n and not s.z)} (N={s.n}, Z={s.z})",
+    35: lambda s: f"JZER: {_jump_text(s.z)} (Z={s.z})",
+    40: lambda s: f"JUMP: PC <- {s.ir & 0xFFF}",
+    45: lambda s: f"LOCO: AC <- Constante {s.ir & 0xFFF}",
+    50: lambda s: f"LODL: MAR <- SP + {s.ir & 0xFFF} ({s.mar})",
+    51: lambda s: f"LODL: AC <- Mem[{s.mar}] ({s.mbr})",
+    55: lambda s: f"STOL: MAR <- SP + {s.ir & 0xFFF} ({s.mar})",
+    56: lambda s: f"STOL: Mem[{s.mar}] <- AC ({s.ac})",
+    60: lambda s: f"ADDL: MAR <- SP + {s.ir & 0xFFF} ({s.mar})",
+    61: lambda s: f"ADDL: MBR <- Mem[{s.mar}] ({s.mbr})",
+    62: lambda s: f"ADDL: AC <- {(s.ac - s.mbr) & 0xFFFF} + {s.mbr} = {s.ac}",
+    65: lambda s: f"SUBL: MAR <- SP + {s.ir & 0xFFF} ({s.mar})",
+    66: lambda s: f"SUBL: MBR <- Mem[{s.mar}] ({s.mbr})",
+    67: lambda s: f"SUBL: AC <- {(s.ac + s.mbr) & 0xFFFF} - {s.mbr} = {s.ac}",
+    70: lambda s: f"JNEG: {_jump_text(s.n)} (N={s.n})",
+    75: lambda s: f"JNZE: {_jump_text(not s.z)} (Z={s.z})",
+    80: lambda s: f"CALL: Decrementa SP ({s.sp})",
+    81: lambda s: f"CALL: MAR <- SP, MBR <- PC ({s.pc})",
+    82: lambda s: f"CALL: Salva PC na Pilha (Mem[{s.mar}])",
+    83: lambda s: f"CALL: PC <- Endereço Subrotina ({s.ir & 0xFFF})",
+    90: _describe_type_f,
+    91: lambda s: "PUSH: MAR <- SP, MBR <- AC",
+    92: lambda s: f"PUSH: Mem[{s.mar}] <- AC ({s.ac})",
+    94: lambda s: f"POP: MBR <- Mem[{s.mar}] ({s.mbr})",
+    95: lambda s: "POP: AC <- MBR, Incrementa SP",
+    97: lambda s: f"RETN: MBR <- Mem[{s.mar}] ({s.mbr})",
+    98: lambda s: f"RETN: PC <- MBR ({s.mbr}), Incrementa SP",
+    100: lambda s: "PSHI: MAR <- AC",
+    101: lambda s: f"PSHI: MBR <- Mem[AC] ({s.mbr})",
+    102: lambda s: "PSHI: MAR <- SP",
+    103: lambda s: f"PSHI: Mem[SP] <- MBR ({s.mbr})",
+    105: lambda s: f"POPI: MBR <- Mem[SP] ({s.mbr})",
+    106: lambda s: "POPI: MAR <- AC",
+    107: lambda s: f"POPI: Mem[AC] <- MBR ({s.mbr}), Inc SP",
+}
+
+def describe(state):
+    """Formats the description of the micro-instruction in a MicroState."""
+    fmt = DESCRIPTIONS.get(state.mpc)
+    if fmt is None:
+        return "Ciclo Desconhecido"
+    return fmt(state)
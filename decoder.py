@@ -0,0 +1,59 @@
+# decoder.py
+# Decode table for all 65536 instruction words, built once at import.
+# For each word it gives the first micro-instruction of its routine, its
+# operand, its type F sub-opcode, its mnemonic and its disassembly text,
+# so decoding in the CPU and disassembling memory or traces are lookups.
+
+# Start of the microroutine for each opcode (high 4 bits of IR).
+# Mapping based on Tanenbaum's MIC-1 (Standard)
+OPCODE_MPC = (
+    10, # 0x0 LODD
+    15, # 0x1 STOD
+    20, # 0x2 ADDD
+    25, # 0x3 SUBD
+    30, # 0x4 JPOS
+    35, # 0x5 JZER
+    40, # 0x6 JUMP
+    45, # 0x7 LOCO
+    50, # 0x8 LODL
+    55, # 0x9 STOL
+    60, # 0xA ADDL
+    65, # 0xB SUBL
+    70, # 0xC JNEG
+    75, # 0xD JNZE
+    80, # 0xE CALL
+    90, # 0xF PSHI/POP/etc (Special decoding at MPC 90)
+)
+
+OPCODE_NAMES = (
+    'LODD', 'STOD', 'ADDD', 'SUBD', 'JPOS', 'JZER', 'JUMP', 'LOCO',
+    'LODL', 'STOL', 'ADDL', 'SUBL', 'JNEG', 'JNZE', 'CALL', None,
+)
+# Type F instructions by sub-opcode (bits 11-8); odd sub-opcodes are unknown
+TYPE_F_NAMES = (
+    'PSHI', None, 'POPI', None, 'PUSH', None, 'POP', None,
+    'RETN', None, 'SWAP', None, 'INSP', None, 'DESP', None,
+)
+UNKNOWN = '???'
+
+def _type_f_text(word):
+    name = TYPE_F_NAMES[(word >> 8) & 0xF]
+    if name is None:
+        return f"{UNKNOWN} 0x{word:04X}"
+    operand = word & 0xFF
+    # INSP/DESP always take an operand; the others only show stray low bits
+    return f"{name} {operand}" if operand or name in ('INSP', 'DESP') else name
+
+# Built 4096 words (one opcode) at a time: the word is the index
+_LOW = range(0x1000)
+_TYPE_F = range(0xF000, 0x10000)
+_NUMBERS = [str(arg) for arg in _LOW]
+
+MPC = b"".join(bytes([mpc]) * 0x1000 for mpc in OPCODE_MPC)
+OPERAND = tuple(_LOW) * 15 + tuple(arg & 0xFF for arg in _LOW)
+SUB_OPCODE = bytes(arg >> 8 for arg in _LOW) * 16 # Meaningful for type F only
+MNEMONIC = tuple(name for name in OPCODE_NAMES[:15] for _ in _LOW) + \
+           tuple(TYPE_F_NAMES[arg >> 8] or UNKNOWN for arg in _LOW)
+TEXT = tuple(f"{name} " + number for name in OPCODE_NAMES[:15] for number in _NUMBERS) + \
+       tuple(_type_f_text(word) for word in _TYPE_F)
+del _LOW, _TYPE_F, _NUMBERS
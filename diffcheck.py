@@ -0,0 +1,320 @@
+# diffcheck.py
+# Lockstep differential checker. Runs the same program on two machine
+# configurations (execution engine + cache model) side by side, compares
+# the architectural state whenever both reach the same cycle count and
+# reports the first divergence with a state diff.
+#
+# A configuration is written "engine[:cache]": "micro", "block",
+# "fast:direct" (no cache, every access goes to memory) or
+# "micro:size=32,associativity=4,write_back=1" (hardware.Cache options).
+#
+# The coarser side leads: block steps one translated block, fast one
+# instruction and micro one instruction's micro-instructions; the other
+# side then runs up to the same cycle count.
+import argparse
+import os
+import random
+import sys
+from collections import deque, namedtuple
+
+from assembler import assemble
+from cpu import CPU
+from decoder import MNEMONIC
+from engine import FastEngine
+from hardware import Cache
+from translator import TranslatingEngine
+
+DEFAULT_MAX_CYCLES = 20_000
+DEFAULT_PAIRS = (('micro', 'fast'), ('micro', 'block'))
+HISTORY = 8 # Units of work remembered on each side for the report
+GRANULARITY = {'micro': 0, 'fast': 1, 'block': 2}
+
+Config = namedtuple('Config', 'engine cache')
+Divergence = namedtuple('Divergence', 'cycle instruction diff history_a history_b')
+
+class UncachedMemory:
+    """Stands in for hardware.Cache: every access goes straight to memory."""
+    def __init__(self, memory):
+        self.memory = memory
+        self.last_access_type = "NONE"
+        self.on_write = None
+
+    def peek(self, addr):
+        return self.memory.read(addr)
+
+    def read(self, addr):
+        self.last_access_type = "MISS"
+        return self.memory.read(addr)
+
+    def write(self, addr, val):
+        self.last_access_type = "MISS"
+        self.memory.write(addr, val)
+        if self.on_write is not None:
+            self.on_write(addr)
+
+    def flush(self):
+        pass
+
+def parse_config(text):
+    """ "engine[:cache]" -> Config. cache is None (default), "direct" or Cache options."""
+    engine, _, cache = text.partition(':')
+    if engine not in GRANULARITY:
+        raise ValueError(f"Unknown engine: {engine}")
+    if not cache or cache == 'default':
+        return Config(engine, None)
+    if cache == 'direct':
+        return Config(engine, 'direct')
+    options = {}
+    for item in cache.split(','):
+        key, _, value = item.partition('=')
+        if key == 'replacement':
+            options[key] = value
+        elif key in ('size', 'associativity', 'block_size', 'seed'):
+            options[key] = int(value)
+        elif key == 'write_back':
+            options[key] = value.lower() in ('1', 'true', 'yes', '')
+        else:
+            raise ValueError(f"Unknown cache option: {key}")
+    return Config(engine, tuple(sorted(options.items())))
+
+def format_config(config):
+    if config.cache is None:
+        return config.engine
+    if config.cache == 'direct':
+        return f"{config.engine}:direct"
+    return config.engine + ":" + ",".join(f"{k}={v}" for k, v in config.cache)
+
+def cached_words(cpu):
+    """{addr: val} for every word held in a valid cache line."""
+    cache = cpu.cache
+    words = {}
+    if isinstance(cache, Cache):
+        bs = cache.block_size
+        for line in range(cache.size):
+            if cache.valid[line]:
+                base = cache.line_address(line)
+                for offset in range(bs):
+                    words[base + offset] = cache.data[line * bs + offset]
+    return words
+
+def visible_memory(cpu):
+    """
+    Memory as the program sees it: memory words overlaid with the cached
+    ones (newer than memory with write-back), plus {addr: val} for nonzero
+    words that only live in lines above the end of memory.
+    """
+    words = cpu.memory.dump()
+    above = {}
+    for addr, val in cached_words(cpu).items():
+        if addr < len(words):
+            words[addr] = val
+        elif val:
+            above[addr] = val
+    return words, above
+
+class Side:
+    """One configuration being checked: a CPU and the engine that drives it."""
+    def __init__(self, config, image, sp=0):
+        self.config = config
+        cpu = CPU(dict(config.cache) if isinstance(config.cache, tuple) else None)
+        if config.cache == 'direct':
+            cpu.cache = UncachedMemory(cpu.memory)
+        cpu.memory.load(image)
+        cpu.sp.write(sp)
+        self.cpu = cpu
+        if config.engine == 'fast':
+            self.executor = FastEngine(cpu)
+        elif config.engine == 'block':
+            self.executor = TranslatingEngine(cpu)
+        else:
+            self.executor = None
+        self.history = deque(maxlen=HISTORY) # (cycle, pc, word) at the start of each unit
+
+    def _mark(self):
+        cpu = self.cpu
+        pc = cpu.pc.read()
+        self.history.append((cpu.cycle_count, pc, cpu.cache.peek(pc)))
+
+    def step(self):
+        """Runs one unit of work (see the module comment)."""
+        cpu = self.cpu
+        if cpu.halted:
+            return
+        self._mark()
+        if self.executor is None:
+            cpu.cycle()
+            while cpu.mpc != 0 and not cpu.halted:
+                cpu.cycle()
+        elif self.config.engine == 'block':
+            block = self.executor.block_cache.lookup(cpu.pc.read())
+            self.executor.run(block.cycles if block is not None else 1)
+        else:
+            self.executor.run(1)
+
+    def run_to(self, target):
+        """Runs until the cycle count reaches target (or the program halts)."""
+        cpu = self.cpu
+        while cpu.cycle_count < target and not cpu.halted:
+            if self.executor is None:
+                if cpu.mpc == 0:
+                    self._mark()
+                cpu.cycle()
+            else:
+                self._mark()
+                self.executor.run(1 if self.config.engine == 'fast' else target - cpu.cycle_count)
+
+    def registers(self):
+        cpu = self.cpu
+        return (cpu.pc.read(), cpu.ac.read(), cpu.sp.read(), cpu.ir.read(), cpu.mar.read(),
+                cpu.mbr.read(), int(cpu.alu.n_flag), int(cpu.alu.z_flag), cpu.mpc,
+                cpu.cycle_count, cpu.instruction_count)
+
+    def quick_key(self, detail):
+        """Cheap summary that is equal on both sides when their states are (memory aside)."""
+        cpu = self.cpu
+        if not detail:
+            return self.registers(), cached_words(cpu)
+        cache = cpu.cache
+        if isinstance(cache, Cache): # Same model on both sides: compare the raw line arrays
+            return self.registers(), cpu.halted, cache.valid, cache.tags, cache.data
+        return self.registers(), cpu.halted
+
+    def snapshot(self, detail):
+        """
+        (registers, cached words, extra); with detail, extra holds the halt
+        flag and the cache lines. Memory itself is compared separately.
+        """
+        cpu = self.cpu
+        registers = self.registers()
+        extra = {}
+        if detail:
+            extra['HALTED'] = cpu.halted
+            cache = cpu.cache
+            if isinstance(cache, Cache):
+                bs = cache.block_size
+                for line in range(cache.size):
+                    if cache.valid[line]:
+                        extra[f"Cache[{line}]"] = (cache.tags[line],
+                                                   tuple(cache.data[line * bs:(line + 1) * bs]))
+        return registers, cached_words(cpu), extra
+
+REGISTER_NAMES = ('PC', 'AC', 'SP', 'IR', 'MAR', 'MBR', 'N', 'Z', 'MPC', 'CICLOS', 'INSTRUCOES')
+
+def state_diff(a, b, detail):
+    """[(field, value in a, value in b)] for every field where two sides differ."""
+    if a.cpu.memory.data == b.cpu.memory.data and a.quick_key(detail) == b.quick_key(detail):
+        return []
+    sa, sb = a.snapshot(detail), b.snapshot(detail)
+    diff = [(name, va, vb) for name, va, vb in zip(REGISTER_NAMES, sa[0], sb[0]) if va != vb]
+    (words_a, above_a), (words_b, above_b) = visible_memory(a.cpu), visible_memory(b.cpu)
+    diff += [(f"Mem[{addr}]", va, vb) for addr, (va, vb) in enumerate(zip(words_a, words_b)) if va != vb]
+    for addr in sorted(above_a.keys() | above_b.keys()):
+        if above_a.get(addr, 0) != above_b.get(addr, 0):
+            diff.append((f"Mem[{addr}]", above_a.get(addr, 0), above_b.get(addr, 0)))
+    for key in sorted(sa[2].keys() | sb[2].keys()):
+        if sa[2].get(key) != sb[2].get(key):
+            diff.append((key, sa[2].get(key), sb[2].get(key)))
+    return diff
+
+def compare(image, config_a, config_b, max_cycles=DEFAULT_MAX_CYCLES, sp=0):
+    """Runs both configurations in lockstep. Returns the first Divergence or None."""
+    a = Side(config_a, image, sp)
+    b = Side(config_b, image, sp)
+    detail = config_a.cache == config_b.cache
+    leader, follower = (b, a) if GRANULARITY[config_b.engine] >= GRANULARITY[config_a.engine] else (a, b)
+
+    while leader.cpu.cycle_count < max_cycles:
+        before = leader.cpu.cycle_count
+        leader.step()
+        follower.run_to(leader.cpu.cycle_count)
+        diff = state_diff(a, b, detail)
+        if diff:
+            return Divergence(leader.cpu.cycle_count, leader.cpu.instruction_count, diff,
+                              list(a.history), list(b.history))
+        if leader.cpu.cycle_count == before: # Halted
+            break
+    return None
+
+def random_program(rng, length=48):
+    """Random MAC-1 code with its data area right after it."""
+    words = []
+    for _ in range(length):
+        opcode = rng.choice((0, 0, 1, 1, 2, 3, 4, 5, 6, 7, 7, 8, 9, 0xA, 0xB, 0xC, 0xD, 0xE, 0xF, 0xF))
+        if opcode == 0xF:
+            arg = (rng.choice((0x0, 0x2, 0x4, 0x6, 0x8, 0xA, 0xC, 0xE)) << 8) | rng.randrange(256)
+        elif opcode in (4, 5, 6, 0xC, 0xD, 0xE):
+            arg = rng.randrange(length) # Jump inside the program
+        elif opcode in (8, 9, 0xA, 0xB):
+            arg = rng.randrange(16)
+        elif opcode == 7:
+            arg = rng.randrange(4096)
+        else:
+            arg = rng.choice((rng.randrange(length, length + 32), rng.randrange(4096)))
+        words.append((opcode << 12) | arg)
+    return words + [rng.randrange(0x10000) for _ in range(32)]
+
+def find_programs(paths):
+    programs = []
+    for path in paths:
+        if os.path.isdir(path):
+            programs.extend(os.path.join(path, name) for name in sorted(os.listdir(path))
+                            if name.lower().endswith('.asm'))
+        else:
+            programs.append(path)
+    return programs
+
+def format_divergence(div, config_a, config_b):
+    lines = [f"  primeira divergencia no ciclo {div.cycle} (instrucao {div.instruction})"]
+    for name, history in (("A", div.history_a), ("B", div.history_b)):
+        steps = ", ".join(f"{pc:03X}:{MNEMONIC[word]}" for _, pc, word in history)
+        lines.append(f"  ultimos passos {name}: {steps}")
+    lines.append(f"  {'campo':<14} {format_config(config_a):>22} {format_config(config_b):>22}")
+    for key, va, vb in div.diff[:20]:
+        lines.append(f"  {key:<14} {str(va):>22} {str(vb):>22}")
+    if len(div.diff) > 20:
+        lines.append(f"  ... mais {len(div.diff) - 20} campos")
+    return lines
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Executa programas em duas configuracoes lado a lado e mostra a primeira divergencia.")
+    parser.add_argument("paths", nargs="*", default=["examples"], help="arquivos .asm ou diretorios")
+    parser.add_argument("--pair", nargs=2, action="append", metavar=("A", "B"),
+                        help="configuracoes a comparar, ex.: micro block, micro:direct micro "
+                             "(padrao: micro fast e micro block)")
+    parser.add_argument("--random", type=int, default=0, metavar="N", help="tambem testa N programas aleatorios")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--sp", type=lambda text: int(text, 0), default=None,
+                        help="SP inicial (padrao: 0 nos arquivos, aleatorio nos programas aleatorios)")
+    parser.add_argument("--max-cycles", type=int, default=DEFAULT_MAX_CYCLES)
+    args = parser.parse_args(argv)
+
+    try:
+        pairs = [(parse_config(a), parse_config(b)) for a, b in (args.pair or DEFAULT_PAIRS)]
+        cases = []
+        for path in find_programs(args.paths):
+            with open(path, encoding='utf-8') as f:
+                cases.append((path, assemble(f.read().splitlines()), args.sp or 0))
+    except (OSError, ValueError) as e:
+        print(f"Erro: {e}", file=sys.stderr)
+        return 2
+    rng = random.Random(args.seed)
+    for i in range(args.random):
+        sp = args.sp if args.sp is not None else rng.choice((0, 2000, 4000))
+        cases.append((f"aleatorio #{i} (seed {args.seed})", random_program(rng), sp))
+
+    failures = 0
+    for config_a, config_b in pairs:
+        print(f"{format_config(config_a)} x {format_config(config_b)}")
+        for name, image, sp in cases:
+            div = compare(image, config_a, config_b, args.max_cycles, sp)
+            if div is not None:
+                failures += 1
+                print(f"DIVERGE {name}")
+                print("\n".join(format_divergence(div, config_a, config_b)))
+        print(f"  {len(cases)} programas verificados")
+    print(f"{failures} divergencias")
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,54 @@
+# disassembler.py
+# Turns MAC-1 machine code back into assembly text using the decode table
+# (decoder.TEXT). Known instructions disassemble to text the assembler
+# turns back into the same word.
+import argparse
+import sys
+from array import array
+
+from assembler import assemble_program
+from decoder import TEXT
+
+def disassemble(word):
+    return TEXT[word & 0xFFFF]
+
+def listing(words, base=0, symbols=None):
+    """One "addr: word  [LABEL:] text" line per word, starting at address base."""
+    labels = {addr: label for label, addr in (symbols or {}).items()}
+    lines = []
+    for offset, word in enumerate(words):
+        addr = base + offset
+        label = f"{labels[addr]}:" if addr in labels else ""
+        lines.append(f"{addr:04X}: {word & 0xFFFF:04X}  {label:<10} {TEXT[word & 0xFFFF]}")
+    return lines
+
+def read_words(path):
+    """Machine code of a .asm file (with its labels) or of a raw little-endian binary."""
+    if path.lower().endswith('.asm'):
+        with open(path, encoding='utf-8') as f:
+            program = assemble_program(f.read().splitlines())
+        return program.code, program.symbols
+    words = array('H')
+    with open(path, 'rb') as f:
+        data = f.read()
+    words.frombytes(data[:len(data) - len(data) % 2])
+    if sys.byteorder == 'big':
+        words.byteswap()
+    return words.tolist(), {}
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Desmonta codigo de maquina MAC-1.")
+    parser.add_argument("file", help="arquivo .asm ou binario (palavras de 16 bits, little endian)")
+    parser.add_argument("--base", type=lambda text: int(text, 0), default=0,
+                        help="endereco da primeira palavra")
+    args = parser.parse_args(argv)
+    try:
+        words, symbols = read_words(args.file)
+    except (OSError, ValueError) as e:
+        print(f"Erro: {e}", file=sys.stderr)
+        return 2
+    print("\n".join(listing(words, args.base, symbols)))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,277 @@
+# engine.py
+# Instruction-level execution engine.
+# Runs one whole MAC-1 instruction per dispatch on plain integers instead of
+# stepping the microcode, while keeping the architectural state (PC, AC, SP,
+# memory, N/Z flags) bit-identical to CPU.cycle() and counting the
+# micro-cycles the micro-stepper would have spent.
+from cpu import BreakpointHit
+
+FETCH_CYCLES = 3 # MPC 0, 1, 2
+
+# Execute micro-cycles per opcode (without fetch). Type F is resolved
+# through TYPE_F_CYCLES (MPC 90 plus the sub-routine).
+OPCODE_CYCLES = (
+    2, # LODD  10-11
+    2, # STOD  15-16
+    3, # ADDD  20-22
+    3, # SUBD  25-27
+    1, # JPOS  30
+    1, # JZER  35
+    1, # JUMP  40
+    1, # LOCO  45
+    2, # LODL  50-51
+    2, # STOL  55-56
+    3, # ADDL  60-62
+    3, # SUBL  65-67
+    1, # JNEG  70
+    1, # JNZE  75
+    4, # CALL  80-83
+    0, # Type F (see TYPE_F_CYCLES)
+)
+
+# Indexed by sub-opcode (bits 11-8). Odd sub-opcodes are unknown and only
+# spend MPC 90.
+TYPE_F_CYCLES = (
+    5, 1, # PSHI  90, 100-103
+    4, 1, # POPI  90, 105-107
+    3, 1, # PUSH  90, 91-92
+    3, 1, # POP   90, 94-95
+    3, 1, # RETN  90, 97-98
+    1, 1, # SWAP  90
+    1, 1, # INSP  90
+    1, 1, # DESP  90
+)
+
+def instruction_cycles(word):
+    """Micro-cycles (fetch included) the micro-stepper spends on an instruction."""
+    opcode = (word >> 12) & 0xF
+    if opcode == 0xF:
+        return FETCH_CYCLES + TYPE_F_CYCLES[(word >> 8) & 0xF]
+    return FETCH_CYCLES + OPCODE_CYCLES[opcode]
+
+class FastEngine:
+    """
+    Executes whole instructions on the state of an existing CPU.
+    Memory accesses still go through cpu.cache, so hits/misses and the
+    contents of the cache stay the same as with the micro-stepper.
+    """
+    def __init__(self, cpu):
+        self.cpu = cpu
+
+    def finish_instruction(self, max_cycles):
+        """Micro-steps until the CPU is at an instruction boundary (MPC = 0)."""
+        cpu = self.cpu
+        spent = 0
+        while cpu.mpc != 0 and spent < max_cycles:
+            cpu.cycle()
+            spent += 1
+        return spent
+
+    def run(self, max_cycles, pc_below=0):
+        """
+        Runs until the program halts (see CPU.loops_forever) or at least
+        max_cycles micro-cycles were spent. Only whole instructions are
+        executed, so the budget can be overshot by less than one instruction.
+        Breakpoints stop before the instruction at their PC and watchpoints
+        at the end of the instruction that made the access.
+        Also stops, with "BUDGET", before an instruction at a PC below
+        pc_below (used by translator.TranslatingEngine outside memory).
+        Returns "HALTED", "BUDGET" or "BREAK".
+        """
+        cpu = self.cpu
+        if cpu.micro_breakpoints:
+            return cpu.run(max_cycles) # MPC breakpoints need the micro-stepper
+        cpu._start_debug_run()
+        max_cycles -= self.finish_instruction(max_cycles)
+        if cpu.mpc != 0:
+            return "BUDGET"
+        if cpu.halted:
+            return "HALTED"
+
+        read = cpu.cache.read
+        write = cpu.cache.write
+        # Breakpoints and watchpoints are checked by the fetch, only when armed
+        fetch = cpu.checked_fetch if cpu.debug_armed else read
+        loops_forever = cpu.loops_forever
+        pc, ac, sp, ir, mar, mbr, n, z = self.load_state()
+        cycles = 0
+        count = 0
+        status = "BUDGET"
+
+        try:
+            while cycles < max_cycles and pc >= pc_below:
+                # Fetch (MPC 0-2)
+                mbr = fetch(pc)
+                mar = pc
+                pc = (pc + 1) & 0xFFFF
+                ir = mbr
+                count += 1
+                opcode = ir >> 12
+                addr = ir & 0xFFF
+
+                if opcode == 0x0: # LODD
+                    mar = addr
+                    mbr = read(mar)
+                    ac = mbr
+                    z = ac == 0
+                    n = (ac & 0x8000) != 0
+                    cycles += 5
+                elif opcode == 0x1: # STOD
+                    mar = addr
+                    mbr = ac
+                    write(mar, mbr)
+                    cycles += 5
+                elif opcode == 0x2: # ADDD
+                    mar = addr
+                    mbr = read(mar)
+                    ac = (ac + mbr) & 0xFFFF
+                    z = ac == 0
+                    n = (ac & 0x8000) != 0
+                    cycles += 6
+                elif opcode == 0x3: # SUBD
+                    mar = addr
+                    mbr = read(mar)
+                    ac = (ac - mbr) & 0xFFFF
+                    z = ac == 0
+                    n = (ac & 0x8000) != 0
+                    cycles += 6
+                elif opcode == 0x4: # JPOS
+                    cycles += 4
+                    if not n and not z:
+                        pc = addr
+                        if pc <= mar and loops_forever(pc, ac, sp, n, z):
+                            status = "HALTED"
+                            break
+                elif opcode == 0x5: # JZER
+                    cycles += 4
+                    if z:
+                        pc = addr
+                        if pc <= mar and loops_forever(pc, ac, sp, n, z):
+                            status = "HALTED"
+                            break
+                elif opcode == 0x6: # JUMP
+                    pc = addr
+                    cycles += 4
+                    if pc <= mar and (pc == mar or loops_forever(pc, ac, sp, n, z)):
+                        status = "HALTED"
+                        break
+                elif opcode == 0x7: # LOCO
+                    ac = addr
+                    z = ac == 0
+                    n = False
+                    cycles += 4
+                elif opcode == 0x8: # LODL
+                    mar = (sp + addr) & 0xFFF
+                    mbr = read(mar)
+                    ac = mbr
+                    z = ac == 0
+                    n = (ac & 0x8000) != 0
+                    cycles += 5
+                elif opcode == 0x9: # STOL
+                    mar = (sp + addr) & 0xFFF
+                    mbr = ac
+                    write(mar, mbr)
+                    cycles += 5
+                elif opcode == 0xA: # ADDL
+                    mar = (sp + addr) & 0xFFF
+                    mbr = read(mar)
+                    ac = (ac + mbr) & 0xFFFF
+                    z = ac == 0
+                    n = (ac & 0x8000) != 0
+                    cycles += 6
+                elif opcode == 0xB: # SUBL
+                    mar = (sp + addr) & 0xFFF
+                    mbr = read(mar)
+                    ac = (ac - mbr) & 0xFFFF
+                    z = ac == 0
+                    n = (ac & 0x8000) != 0
+                    cycles += 6
+                elif opcode == 0xC: # JNEG
+                    cycles += 4
+                    if n:
+                        pc = addr
+                        if pc <= mar and loops_forever(pc, ac, sp, n, z):
+                            status = "HALTED"
+                            break
+                elif opcode == 0xD: # JNZE
+                    cycles += 4
+                    if not z:
+                        pc = addr
+                        if pc <= mar and loops_forever(pc, ac, sp, n, z):
+                            status = "HALTED"
+                            break
+                elif opcode == 0xE: # CALL
+                    sp = (sp - 1) & 0xFFFF
+                    mar = sp
+                    mbr = pc
+                    write(mar, mbr)
+                    pc = addr
+                    cycles += 7
+                else: # Type F
+                    sub_opcode = addr >> 8
+                    if sub_opcode == 0x0: # PSHI
+                        sp = (sp - 1) & 0xFFFF
+                        mar = ac
+                        mbr = read(mar)
+                        mar = sp
+                        write(mar, mbr)
+                    elif sub_opcode == 0x2: # POPI
+                        mar = sp
+                        mbr = read(mar)
+                        mar = ac
+                        write(mar, mbr)
+                        sp = (sp + 1) & 0xFFFF
+                    elif sub_opcode == 0x4: # PUSH
+                        sp = (sp - 1) & 0xFFFF
+                        mar = sp
+                        mbr = ac
+                        write(mar, mbr)
+                    elif sub_opcode == 0x6: # POP
+                        mar = sp
+                        mbr = read(mar)
+                        ac = mbr
+                        sp = (sp + 1) & 0xFFFF
+                    elif sub_opcode == 0x8: # RETN
+                        mar = sp
+                        mbr = read(mar)
+                        pc = mbr
+                        sp = (sp + 1) & 0xFFFF
+                    elif sub_opcode == 0xA: # SWAP
+                        ac, sp = sp, ac
+                    elif sub_opcode == 0xC: # INSP
+                        sp = (sp + (addr & 0xFF)) & 0xFFFF
+                    elif sub_opcode == 0xE: # DESP
+                        sp = (sp - (addr & 0xFF)) & 0xFFFF
+                    cycles += FETCH_CYCLES + TYPE_F_CYCLES[sub_opcode]
+        except BreakpointHit:
+            status = "BREAK" # Stopped before fetching from pc
+        if status == "BUDGET" and cpu.watch_hit is not None:
+            cpu._take_watch_hit()
+            status = "BREAK"
+
+        self.store_state(pc, ac, sp, ir, mar, mbr, n, z, cycles, count)
+        cpu.halted = status == "HALTED"
+        if status == "BREAK":
+            cpu.break_cycle = cpu.cycle_count
+        return status
+
+    def load_state(self):
+        """Registers and flags as plain integers/booleans."""
+        cpu = self.cpu
+        return (cpu.pc.read(), cpu.ac.read(), cpu.sp.read(), cpu.ir.read(),
+                cpu.mar.read(), cpu.mbr.read(), cpu.alu.n_flag, cpu.alu.z_flag)
+
+    def store_state(self, pc, ac, sp, ir, mar, mbr, n, z, cycles, count):
+        """Writes the state back to the CPU and accounts the work done."""
+        cpu = self.cpu
+        cpu.pc.write(pc)
+        cpu.ac.write(ac)
+        cpu.sp.write(sp)
+        cpu.ir.write(ir)
+        cpu.mar.write(mar)
+        cpu.mbr.write(mbr)
+        cpu.alu.set_flags(n, z)
+        cpu.cycle_count += cycles
+        cpu.instruction_count += count
+        cpu.reset_signals()
+        cpu.last_action_desc = f"Execução rápida: {count} instruções"
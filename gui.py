@@ -1,7 +1,108 @@
+import time
+from collections import OrderedDict, deque
+
 import pygame
+from cachesim import AccessCounter
 from config import *
-
-class Button:
+from hardware import ALU
+from history import History
+
+try:
+    import numpy as np
+except ImportError: # The memory heatmap needs NumPy (pygame.surfarray)
+    np = None
+
+# Rendered text surfaces kept between frames; most labels and values are
+# the same from one frame to the next
+TEXT_CACHE_SIZE = 2048
+
+class TextCache:
+    """
+    Font objects and rendered text surfaces, shared by every widget.
+    Surfaces are keyed by (font, text, colour) and the least recently
+    used one is dropped once the cache holds max_surfaces.
+    """
+    def __init__(self, max_surfaces=TEXT_CACHE_SIZE):
+        self.max_surfaces = max_surfaces
+        self.fonts = {}
+        self.surfaces = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def font(self, name, size, bold=False):
+        key = (name, size, bold)
+        font = self.fonts.get(key)
+        if font is None:
+            font = self.fonts[key] = pygame.font.SysFont(name, size, bold=bold)
+        return font
+
+    def render(self, font, text, color):
+        key = (font, text, color)
+        surf = self.surfaces.get(key)
+        if surf is not None:
+            self.hits += 1
+            self.surfaces.move_to_end(key)
+            return surf
+        self.misses += 1
+        surf = self.surfaces[key] = font.render(text, True, color)
+        if len(self.surfaces) > self.max_surfaces:
+            self.surfaces.popitem(last=False)
+        return surf
+
+    def render_fit(self, font, text, color, max_width):
+        """Like render, scaled down to max_width when the text is wider."""
+        key = (font, text, color, max_width)
+        surf = self.surfaces.get(key)
+        if surf is not None:
+            self.hits += 1
+            self.surfaces.move_to_end(key)
+            return surf
+        surf = self.render(font, text, color)
+        if surf.get_width() > max_width:
+            scale_factor = max_width / surf.get_width()
+            surf = pygame.transform.smoothscale(
+                surf, (int(surf.get_width() * scale_factor), int(surf.get_height() * scale_factor)))
+        self.surfaces[key] = surf
+        if len(self.surfaces) > self.max_surfaces:
+            self.surfaces.popitem(last=False)
+        return surf
+
+    def clear(self):
+        """Forgets everything (fonts do not survive pygame.quit())."""
+        self.fonts.clear()
+        self.surfaces.clear()
+
+text_cache = TextCache()
+
+class Panel:
+    """
+    A part of the screen that is redrawn only when it is dirty: marked so
+    (by an event or new content) or showing a different state than at its
+    last draw. Subclasses set `area` and implement draw().
+    """
+    dirty = True
+    shown = None
+
+    def refresh(self, screen, state, *args):
+        """Draws the panel if needed; returns the area redrawn or None."""
+        if not self.dirty and state == self.shown:
+            return None
+        self.dirty = False
+        self.shown = state
+        screen.fill(COLOR_BACKGROUND, self.area)
+        self.draw(screen, *args)
+        return self.area
+
+class Region(Panel):
+    """A panel drawn by a GUI method (registers, cache box, status bar...)."""
+    def __init__(self, area, draw):
+        self.area = pygame.Rect(area)
+        self.draw_func = draw
+
+    def draw(self, screen, *args):
+        self.draw_func(*args)
+
+class Button(Panel):
     def __init__(self, x, y, w, h, text, action_name):
         self.rect = pygame.Rect(x, y, w, h)
         self.text = text
@@ -9,14 +110,18 @@ class Button:
         self.color = (70, 70, 70)
         self.hover_color = (100, 100, 100)
         self.text_color = COLOR_TEXT
-        self.font = pygame.font.SysFont("Arial", 14, bold=True)
+        self.font = text_cache.font("Arial", 14, bold=True)
+
+    @property
+    def area(self):
+        return self.rect
 
     def draw(self, screen, mouse_pos):
         color = self.hover_color if self.rect.collidepoint(mouse_pos) else self.color
         pygame.draw.rect(screen, color, self.rect)
         pygame.draw.rect(screen, COLOR_REGISTER_BORDER, self.rect, 2)
         
-        text_surf = self.font.render(self.text, True, self.text_color)
+        text_surf = text_cache.render(self.font, self.text, self.text_color)
         text_rect = text_surf.get_rect(center=self.rect.center)
         screen.blit(text_surf, text_rect)
 
@@ -26,16 +131,64 @@ class Button:
                 return True
         return False
 
-class Editor:
+# Editor syntax colours
+SYNTAX_COLORS = {
+    'number': (130, 130, 130),   # Line number
+    'label': COLOR_HIGHLIGHT,
+    'mnemonic': (110, 180, 255),
+    'error': (255, 90, 90),      # Unknown mnemonic
+    'operand': COLOR_TEXT,
+    'comment': (110, 160, 110),
+}
+
+def syntax_segments(line):
+    """
+    Splits a source line, as the assembler reads it, into (text, kind)
+    pieces: label, mnemonic (or error), operand and comment. The pieces
+    joined give back the line.
+    """
+    code, sep, comment = line.partition(';')
+    segments = []
+    if ':' in code:
+        label, _, code = code.partition(':')
+        segments.append((label + ':', 'label'))
+    stripped = code.lstrip()
+    if stripped:
+        end = len(code) - len(stripped) + len(stripped.split(None, 1)[0])
+        word = code[:end]
+        segments.append((word, 'mnemonic' if word.strip().upper() in OPCODES else 'error'))
+        code = code[end:]
+    if code:
+        segments.append((code, 'operand'))
+    if sep:
+        segments.append((sep + comment, 'comment'))
+    return segments
+
+class Editor(Panel):
     def __init__(self, x, y, w, h):
         self.rect = pygame.Rect(x, y, w, h)
         self.lines = ["LOCO 10", "STOD 500", "LODD 500", "ADDD 500", "JUMP 0"] # Codigo padrao
-        self.font = pygame.font.SysFont("Consolas", 16)
+        self.font = text_cache.font("Consolas", 16)
+        self.title_font = text_cache.font("Arial", 16, bold=True)
         self.active = False
         self.cursor_line = 0
         self.cursor_col = 0
         self.line_height = 20
         self.scroll_y = 0
+        self.breakpoints = set() # Line indices marked with F9 / click on the margin
+        # Rendered lines: index -> (text, surface); a line whose text changed is rendered again
+        self.line_cache = {}
+        self.cursor_cache = (None, 0) # ((line, text, col), x offset of the cursor)
+
+    @property
+    def area(self):
+        # The title sits above the box
+        return pygame.Rect(self.rect.x, self.rect.y - 25, self.rect.width, self.rect.height + 25)
+
+    def view_state(self, current_pc):
+        """Everything shown besides the text, which only changes through events."""
+        cursor_on = self.active and (pygame.time.get_ticks() // 500) % 2 == 0
+        return (current_pc, self.active, cursor_on)
 
     def ensure_cursor_visible(self):
         cursor_y = 10 + self.cursor_line * self.line_height
@@ -94,6 +247,9 @@ class Editor:
             print(f"Erro ao colar: {e}")
 
     def handle_event(self, event):
+        """Returns "BREAKPOINTS" if the event marked or unmarked a line."""
+        if event.type in (pygame.MOUSEBUTTONDOWN, pygame.MOUSEWHEEL, pygame.KEYDOWN):
+            self.dirty = True
         if event.type == pygame.MOUSEBUTTONDOWN:
             if self.rect.collidepoint(event.pos):
                 self.active = True
@@ -102,6 +258,9 @@ class Editor:
                 self.cursor_line = max(0, min(len(self.lines) - 1, int(rel_y // self.line_height)))
                 self.cursor_col = len(self.lines[self.cursor_line])
                 self.ensure_cursor_visible()
+                if event.pos[0] < self.rect.x + 10:
+                    self.toggle_breakpoint(self.cursor_line)
+                    return "BREAKPOINTS"
             else:
                 self.active = False
         
@@ -115,6 +274,9 @@ class Editor:
         if self.active and event.type == pygame.KEYDOWN:
             ctrl = event.mod & pygame.KMOD_CTRL
             
+            if event.key == pygame.K_F9:
+                self.toggle_breakpoint(self.cursor_line)
+                return "BREAKPOINTS"
             if ctrl and event.key == pygame.K_c:
                 self.copy()
             elif ctrl and event.key == pygame.K_x:
@@ -189,18 +351,25 @@ class Editor:
                     self.lines[self.cursor_line] = line[:self.cursor_col] + event.unicode + line[self.cursor_col:]
                     self.cursor_col += 1
 
+    def toggle_breakpoint(self, line):
+        if line in self.breakpoints:
+            self.breakpoints.remove(line)
+        else:
+            self.breakpoints.add(line)
+        self.dirty = True
+
     def draw(self, screen, current_pc=None):
         pygame.draw.rect(screen, (40, 40, 40), self.rect)
         pygame.draw.rect(screen, COLOR_REGISTER_BORDER, self.rect, 2)
         
-        font_title = pygame.font.SysFont("Arial", 16, bold=True)
-        title = font_title.render("Editor de Código (Assembly)", True, COLOR_TEXT)
+        title = text_cache.render(self.title_font, "Editor de Código (Assembly)", COLOR_TEXT)
         screen.blit(title, (self.rect.x, self.rect.y - 25))
 
-        for i, line in enumerate(self.lines):
+        # Only the lines inside the box, from the scroll position
+        first, last = self.visible_range()
+        for i in range(first, last):
+            line = self.lines[i]
             y = self.rect.y + 10 + i * self.line_height - self.scroll_y
-            if y < self.rect.y: continue
-            if y > self.rect.bottom - 20: break 
             
             if current_pc is not None and i == current_pc:
                 pygame.draw.rect(screen, (60, 60, 0), (self.rect.x + 2, y, self.rect.width - 4, self.line_height))
@@ -208,55 +377,192 @@ class Editor:
             if getattr(self, 'select_all_active', False):
                  pygame.draw.rect(screen, (0, 0, 100), (self.rect.x + 2, y, self.rect.width - 4, self.line_height))
 
-            text_surf = self.font.render(f"{i:02}: {line}", True, COLOR_TEXT)
-            screen.blit(text_surf, (self.rect.x + 10, y))
+            if i in self.breakpoints:
+                pygame.draw.circle(screen, COLOR_CACHE_MISS, (self.rect.x + 6, y + self.line_height // 2), 4)
+
+            screen.blit(self.line_surface(i, line), (self.rect.x + 10, y))
 
             if self.active and i == self.cursor_line:
-                prefix = f"{i:02}: "
-                prefix_width, _ = self.font.size(prefix)
-                content_before_cursor = line[:self.cursor_col]
-                content_width, _ = self.font.size(content_before_cursor)
-                cursor_x = self.rect.x + 10 + prefix_width + content_width
-                
+                cursor_x = self.rect.x + 10 + self.cursor_offset(i, line)
                 if (pygame.time.get_ticks() // 500) % 2 == 0:
                     pygame.draw.line(screen, COLOR_ACCENT, (cursor_x, y), (cursor_x, y + self.line_height), 2)
 
+        # Keep the cache to about the lines around the view
+        visible = last - first
+        if len(self.line_cache) > 4 * visible + 16:
+            keep = range(first - visible, last + visible)
+            self.line_cache = {i: entry for i, entry in self.line_cache.items() if i in keep}
+
+    def visible_range(self):
+        """[first, last) indices of the lines drawn at the current scroll_y."""
+        lh = self.line_height
+        first = max(0, -(-(self.scroll_y - 10) // lh))   # y >= rect.y
+        last = min(len(self.lines), (self.rect.height - 30 + self.scroll_y) // lh + 1) # y <= bottom - 20
+        return first, max(first, last)
+
+    def line_surface(self, i, line):
+        """The numbered, syntax-coloured line, rendered once per text."""
+        entry = self.line_cache.get(i)
+        if entry is not None and entry[0] == line:
+            return entry[1]
+        prefix = f"{i:02}: "
+        font = self.font
+        width, height = font.size(prefix + line)
+        surf = pygame.Surface((max(width, 1), height), pygame.SRCALPHA)
+        # Each piece goes where it falls in the whole line, so the cursor lines up
+        before = ""
+        for piece, kind in [(prefix, 'number')] + syntax_segments(line):
+            surf.blit(font.render(piece, True, SYNTAX_COLORS[kind]), (font.size(before)[0], 0))
+            before += piece
+        self.line_cache[i] = (line, surf)
+        return surf
+
+    def cursor_offset(self, i, line):
+        key = (i, line, self.cursor_col)
+        if self.cursor_cache[0] != key:
+            self.cursor_cache = (key, self.font.size(f"{i:02}: " + line[:self.cursor_col])[0])
+        return self.cursor_cache[1]
+
     def get_text(self):
         return self.lines
 
-class HistoryLog:
-    def __init__(self, x, y, w, h):
+class HistoryLog(Panel):
+    """
+    Execution history (history.History ring buffer) with the newest entry
+    at the bottom. The mouse wheel scrolls back; Ctrl+F or a click on the
+    box opens a search line (Enter finds the previous match, Esc closes).
+    A search runs for at most SEARCH_BUDGET seconds per frame, so a long
+    history never freezes the window.
+    """
+    SCROLL_LINES = 3
+    SEARCH_CHUNK = 500
+    SEARCH_BUDGET = 0.008
+
+    def __init__(self, x, y, w, h, capacity=HISTORY_CAPACITY):
         self.rect = pygame.Rect(x, y, w, h)
-        self.logs = []
-        self.font = pygame.font.SysFont("Consolas", 14)
+        self.history = History(capacity)
+        self.font = text_cache.font("Consolas", 14)
+        self.title_font = text_cache.font("Arial", 14, bold=True)
         # Calculate max logs based on height (minus title padding)
         self.line_height = 18
         self.max_logs = (h - 25) // self.line_height
+        self.last_seen = None # (cpu, cycle_count) of the last entry recorded
+        self.scroll = 0 # Entries hidden below the view (0 = follow the newest)
+        self.searching = False
+        self.query = ""
+        self.match = None # Entry number of the last match
+        self.search_from = None # Next entry to look at while a search is running
+        self.search_note = ""
+
+    @property
+    def area(self):
+        # The title sits above the box
+        return pygame.Rect(self.rect.x, self.rect.y - 20, self.rect.width, self.rect.height + 20)
+
+    @property
+    def rows(self):
+        return self.max_logs - 1 if self.searching else self.max_logs
+
+    def add_log(self, message, cycle=0):
+        if message:
+            self.history.add_text(cycle, message)
+
+    def record(self, cpu):
+        """
+        Adds the last micro-instruction of cpu if it ran since the last call.
+        Called once per frame, and as the observer of CPU.run at fixed speeds.
+        """
+        seen = (cpu, cpu.cycle_count)
+        if seen == self.last_seen:
+            return
+        self.last_seen = seen
+        if cpu.last_mpc is None:
+            self.history.add_text(cpu.cycle_count, cpu.last_action_desc)
+        else:
+            self.history.add_state(cpu.cycle_count, cpu.snapshot())
+
+    def clamp_scroll(self):
+        self.scroll = max(0, min(self.scroll, len(self.history) - self.rows))
 
-    def add_log(self, message):
-        if not message: return
-        if self.logs and self.logs[-1] == message:
+    def handle_event(self, event):
+        """True if the event was used by the history (search typing, scrolling)."""
+        if event.type == pygame.MOUSEWHEEL and self.rect.collidepoint(pygame.mouse.get_pos()):
+            self.scroll += event.y * self.SCROLL_LINES
+            self.clamp_scroll()
+            return True
+        if event.type == pygame.MOUSEBUTTONDOWN and event.button in (1, 2, 3):
+            self.searching = self.rect.collidepoint(event.pos)
+            return self.searching
+        if event.type != pygame.KEYDOWN:
+            return False
+        if event.key == pygame.K_f and event.mod & pygame.KMOD_CTRL:
+            self.searching = True
+            return True
+        if not self.searching:
+            return False
+        if event.key == pygame.K_ESCAPE:
+            self.searching = False
+            self.search_from = None
+        elif event.key in (pygame.K_RETURN, pygame.K_KP_ENTER, pygame.K_F3):
+            self.start_search()
+        elif event.key == pygame.K_BACKSPACE:
+            self.query = self.query[:-1]
+        elif event.unicode and event.unicode.isprintable():
+            self.query += event.unicode
+        return True
+
+    def start_search(self):
+        if not self.query:
+            return
+        history = self.history
+        if self.match is not None and self.match >= history.first:
+            self.search_from = self.match - 1
+        else:
+            self.search_from = history.count - 1 - self.scroll
+        self.match = None
+        self.search_note = "buscando..."
+
+    def step_search(self):
+        """Continues a running search for one frame."""
+        if self.search_from is None:
             return
-        self.logs.append(message)
-        # Keep only the last N logs that fit
-        if len(self.logs) > self.max_logs:
-            self.logs = self.logs[-self.max_logs:]
+        history = self.history
+        deadline = time.perf_counter() + self.SEARCH_BUDGET
+        found = None
+        while found is None and self.search_from >= history.first and time.perf_counter() < deadline:
+            found, self.search_from = history.find(self.query, self.search_from, self.SEARCH_CHUNK)
+        if found is not None:
+            self.match = found
+            self.search_from = None
+            self.search_note = f"ciclo {history.cycle(found)}"
+            # Show the match in the middle of the box
+            self.scroll = history.count - 1 - found - self.rows // 2
+            self.clamp_scroll()
+        elif self.search_from < history.first:
+            self.search_from = None
+            self.search_note = "não encontrado"
+
+    def view_state(self):
+        cursor_on = self.searching and (pygame.time.get_ticks() // 500) % 2 == 0
+        return (self.history.count, self.scroll, self.searching, cursor_on, self.query, self.match,
+                self.search_note)
 
     def draw(self, screen):
         pygame.draw.rect(screen, (20, 20, 20), self.rect)
         pygame.draw.rect(screen, COLOR_REGISTER_BORDER, self.rect, 2)
         
-        title_font = pygame.font.SysFont("Arial", 14, bold=True)
-        title = title_font.render("Histórico de Execução", True, (200, 200, 200))
+        title = text_cache.render(self.title_font, "Histórico de Execução", (200, 200, 200))
         screen.blit(title, (self.rect.x + 5, self.rect.y - 20))
 
+        history = self.history
+        newest = history.count - 1
+        rows = min(self.rows, len(history))
         y = self.rect.y + 5
-        for i, log in enumerate(self.logs):
-            # Fade out older logs
-            alpha = 255 if i == len(self.logs) - 1 else 150
-            color = (200, 255, 200) if i == len(self.logs) - 1 else (150, 150, 150)
-            
-            log_surf = self.font.render(f"> {log}", True, color)
+        for number in range(newest - self.scroll - rows + 1, newest - self.scroll + 1):
+            if number == self.match:
+                pygame.draw.rect(screen, (70, 70, 20), (self.rect.x + 2, y, self.rect.width - 4, self.line_height))
+            color = (200, 255, 200) if number == newest else (150, 150, 150)
+            log_surf = text_cache.render(self.font, f"{history.cycle(number):>9} > {history.text(number)}", color)
             # Clip text if too long
             if log_surf.get_width() > self.rect.width - 10:
                 area = pygame.Rect(0, 0, self.rect.width - 10, self.line_height)
@@ -264,14 +570,35 @@ class HistoryLog:
             else:
                 screen.blit(log_surf, (self.rect.x + 5, y))
             y += self.line_height
+
+        if self.searching:
+            y = self.rect.bottom - self.line_height - 4
+            pygame.draw.line(screen, (100, 100, 100), (self.rect.x + 5, y - 2), (self.rect.right - 5, y - 2))
+            cursor = "_" if (pygame.time.get_ticks() // 500) % 2 == 0 else " "
+            text = f"Buscar: {self.query}{cursor}   {self.search_note}"
+            screen.blit(text_cache.render(self.font, text, COLOR_HIGHLIGHT), (self.rect.x + 5, y))
+        elif self.scroll:
+            note = text_cache.render(self.font, f"-{self.scroll}", COLOR_INACTIVE)
+            screen.blit(note, (self.rect.right - note.get_width() - 8, self.rect.y + 5))
             
-class MemoryView:
+class MemoryView(Panel):
     def __init__(self, x, y, w, h):
         self.rect = pygame.Rect(x, y, w, h)
-        self.font = pygame.font.SysFont("Consolas", 14)
-        self.title_font = pygame.font.SysFont("Arial", 14, bold=True)
+        self.font = text_cache.font("Consolas", 14)
+        self.title_font = text_cache.font("Arial", 14, bold=True)
         self.scroll_y = 0
         self.total_lines = 4096 # Total memory size
+        self.line_height = 18
+
+    @property
+    def area(self):
+        return self.rect
+
+    def view_state(self, memory, last_access_addr=None):
+        """First line, highlighted address and the words on screen."""
+        start_idx = int(self.scroll_y)
+        lines_visible = (self.rect.height - 50) // self.line_height
+        return (start_idx, last_access_addr, memory.data[start_idx:start_idx + lines_visible + 1].tolist())
 
     def handle_event(self, event):
         if event.type == pygame.MOUSEWHEEL:
@@ -286,17 +613,17 @@ class MemoryView:
         pygame.draw.rect(screen, COLOR_REGISTER_BORDER, self.rect, 2)
         
         # Title
-        title = self.title_font.render("Memória (RAM)", True, COLOR_TEXT)
+        title = text_cache.render(self.title_font, "Memória (RAM)", COLOR_TEXT)
         screen.blit(title, (self.rect.x + 5, self.rect.y + 5))
         
         # Header
-        header = self.font.render("Endereço | Valor", True, (150, 150, 150))
+        header = text_cache.render(self.font, "Endereço | Valor", (150, 150, 150))
         screen.blit(header, (self.rect.x + 5, self.rect.y + 25))
         pygame.draw.line(screen, (100, 100, 100), (self.rect.x + 5, self.rect.y + 42), (self.rect.right - 5, self.rect.y + 42))
         
         # Content
         y_start = self.rect.y + 45
-        line_h = 18
+        line_h = self.line_height
         lines_visible = (self.rect.height - 50) // line_h
         
         start_idx = int(self.scroll_y)
@@ -320,32 +647,116 @@ class MemoryView:
                 color = COLOR_TEXT
 
             text = f"{addr:04} ({addr:03X}) | {val:05} (0x{val:04X})"
-            surf = self.font.render(text, True, color)
+            surf = text_cache.render(self.font, text, color)
             screen.blit(surf, (self.rect.x + 5, y))
             y += line_h
 
+class HeatmapView(Panel):
+    """
+    All 4096 memory words as a 64x64 grid, one cell per address, row by
+    row: blue for reads and red for writes, brighter the more frequent;
+    recently accessed addresses glow green if the access hit the cache and
+    yellow if it missed. The colours are computed with NumPy and pushed to
+    the surface in one surfarray blit.
+    """
+    SIDE = 64
+    SCALE = 2
+    RECENT_FRAMES = 30 # Recency is relative to the accesses of the last frames drawn
+    MIN_WINDOW = 64
+
+    def __init__(self, x, y):
+        self.rect = pygame.Rect(x, y, self.SIDE * self.SCALE, self.SIDE * self.SCALE)
+        self.font = text_cache.font("Arial", 14, bold=True)
+        self.small_font = text_cache.font("Consolas", 12)
+        self.grid = pygame.Surface((self.SIDE, self.SIDE))
+        self.counter = None
+        self.marks = deque(maxlen=self.RECENT_FRAMES)
+
+    @property
+    def area(self):
+        # The title sits above the grid
+        return pygame.Rect(self.rect.x - 2, self.rect.y - 20, REG_WIDTH, self.rect.height + 22)
+
+    def track(self, cpu):
+        """
+        Starts counting the accesses of cpu, a CPU just created by the
+        session (start, RESET, LOAD); drawing never hooks the cache. False
+        if not possible.
+        """
+        self.counter = None
+        self.marks.clear()
+        if np is None or not hasattr(cpu.cache, 'read'): # e.g. worker.RemoteCPU
+            return False
+        self.counter = AccessCounter(cpu).start()
+        return True
+
+    def counting(self, cpu):
+        """True while the accesses of cpu are being counted."""
+        return self.counter is not None and self.counter.cpu is cpu and self.counter.attached()
+
+    def view_state(self, cpu):
+        return (self.counting(cpu), cpu, cpu.cycle_count)
+
+    def colors(self):
+        """(64, 64, 3) uint8 array indexed [x][y], as surfarray wants it."""
+        counter = self.counter
+        cells = self.SIDE * self.SIDE
+        reads = np.frombuffer(counter.reads, dtype=np.uint64, count=cells).astype(np.float32)
+        writes = np.frombuffer(counter.writes, dtype=np.uint64, count=cells).astype(np.float32)
+        last = np.frombuffer(counter.last, dtype=np.uint64, count=cells).astype(np.float64)
+        hit = np.frombuffer(counter.hit, dtype=np.uint8, count=cells)
+
+        now = counter.now()
+        self.marks.append(now)
+        window = max(self.MIN_WINDOW, now - self.marks[0])
+        glow = np.clip(1 - (now - last) / window, 0, 1) * (last > 0) * 255
+
+        rgb = np.zeros((cells, 3), dtype=np.float32)
+        for channel, counts in ((0, writes), (2, reads)):
+            top = counts.max()
+            if top:
+                rgb[:, channel] = (40 + 180 * np.log1p(counts) / np.log1p(top)) * (counts > 0)
+        rgb[:, 1] += glow
+        rgb[:, 0] += glow * (hit == 0)
+        grid = np.clip(rgb, 0, 255).astype(np.uint8).reshape(self.SIDE, self.SIDE, 3)
+        return grid.transpose(1, 0, 2)
+
+    def draw(self, screen, cpu):
+        title = text_cache.render(self.font, "Acessos à Memória", COLOR_TEXT)
+        screen.blit(title, (self.rect.x, self.rect.y - 20))
+        pygame.draw.rect(screen, COLOR_REGISTER_BORDER, self.rect.inflate(4, 4), 1)
+        if not self.counting(cpu):
+            note = text_cache.render(self.small_font, "indisponível", COLOR_INACTIVE)
+            screen.blit(note, note.get_rect(center=self.rect.center))
+            return
+        pygame.surfarray.blit_array(self.grid, self.colors())
+        screen.blit(pygame.transform.scale(self.grid, self.rect.size), self.rect)
+
 class GUI:
     def __init__(self):
         pygame.init()
         self.screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
         pygame.display.set_caption("Simulador MIC-1 - Modo Gráfico")
         pygame.scrap.init()
-        self.font = pygame.font.SysFont("Consolas", 16)
-        self.value_font = pygame.font.SysFont("Consolas", 14)
-        self.title_font = pygame.font.SysFont("Arial", 20, bold=True)
+        text_cache.clear()
+        self.font = text_cache.font("Consolas", 16)
+        self.value_font = text_cache.font("Consolas", 14)
+        self.title_font = text_cache.font("Arial", 20, bold=True)
         self.clock = pygame.time.Clock()
         
-        btn_y = SCREEN_HEIGHT - 60
+        btn_y = SCREEN_HEIGHT - 80 # Between the history log and the status bar
         self.buttons = [
             Button(50, btn_y, 100, 40, "PASSO", "STEP"),
             Button(170, btn_y, 120, 40, "EXECUTAR", "RUN"),
             Button(310, btn_y, 100, 40, "REINICIAR", "RESET"),
+            Button(430, btn_y, 120, 40, "ATE BREAK", "RUN_BREAK"),
+            Button(570, btn_y, 140, 40, "VEL: 1 CICLO", "SPEED"),
             Button(800, btn_y, 100, 40, "CARREGAR", "LOAD")
         ]
         
         self.editor = Editor(800, 50, 350, 600)
-        # Adjusted height to prevent overlap with buttons
-        self.history_log = HistoryLog(50, 550, 700, 180) 
+        # Below the explanation panel (its title needs 20px) and above the buttons
+        self.history_log = HistoryLog(50, 560, 700, 130)
         
         self.status_message = "Pronto. Digite o código e clique em CARREGAR."
         self.status_color = COLOR_TEXT
@@ -356,6 +767,19 @@ class GUI:
         # Glow Logic Removed
         self.prev_reg_values = {}
 
+        # Panels drawn by the GUI itself; the widgets above are panels too
+        self.registers_panel = Region((50, 50, REG_WIDTH, 280), self.draw_registers)
+        self.datapath_panel = Region((300, 50, REG_WIDTH, 180), self.draw_datapath)
+        self.heatmap = HeatmapView(300, 262)
+        self.cache_panel = Region((550, 50, 150, 50), self.draw_cache_box)
+        self.signals_panel = Region((50, 400, 700, 130), self.draw_signals)
+        self.status_panel = Region((0, 765, SCREEN_WIDTH, SCREEN_HEIGHT - 765), self.draw_status)
+        self.full_redraw = True
+
+    def invalidate(self):
+        """Redraws the whole screen on the next frame."""
+        self.full_redraw = True
+
     def get_explanation(self, mpc):
         explanations = {
             0: "Busca: PC envia endereço para MAR (Endereço de Memória).",
@@ -396,78 +820,61 @@ class GUI:
         pygame.draw.rect(self.screen, border_color, (x, y, w, h), 2)
         
         # Center text
-        label_surf = self.font.render(text, True, COLOR_TEXT)
+        label_surf = text_cache.render(self.font, text, COLOR_TEXT)
         label_rect = label_surf.get_rect(midtop=(x + w//2, y + 5))
         self.screen.blit(label_surf, label_rect)
         
         if value is not None:
             # Use ALU helper for signed conversion
-            from hardware import ALU
             signed_val = ALU.to_signed(value)
             val_str = f"{signed_val} (0x{value:04X})"
-            val_surf = self.value_font.render(val_str, True, COLOR_TEXT)
-            # Center and clamp
+            # Centered, scaled down if too wide
+            val_surf = text_cache.render_fit(self.value_font, val_str, COLOR_TEXT, w - 4)
             val_rect = val_surf.get_rect(midbottom=(x + w//2, y + h - 2))
-            if val_rect.width > w - 4:
-                # If still too wide, scale it down (simple scaling)
-                scale_factor = (w - 4) / val_rect.width
-                new_w = int(val_rect.width * scale_factor)
-                new_h = int(val_rect.height * scale_factor)
-                val_surf = pygame.transform.smoothscale(val_surf, (new_w, new_h))
-                val_rect = val_surf.get_rect(midbottom=(x + w//2, y + h - 2))
-            
             self.screen.blit(val_surf, val_rect)
 
-    def draw_cpu(self, cpu):
-        self.screen.fill(COLOR_BACKGROUND)
-        mouse_pos = pygame.mouse.get_pos()
-        
-        if hasattr(cpu, 'last_action_desc'):
-             self.history_log.add_log(cpu.last_action_desc)
-        
+    def draw_registers(self, cpu):
         x_left = 50
         y = 50
         regs_left = [('MAR', cpu.mar), ('MBR', cpu.mbr), ('PC', cpu.pc), ('SP', cpu.sp), ('AC', cpu.ac)]
         for name, reg in regs_left:
             val = reg.read()
-            is_active = name in cpu.signals['active_path']
+            is_active = cpu.is_active(name)
             self.draw_rect_with_text(x_left, y, REG_WIDTH, REG_HEIGHT, name, val, active=is_active)
             y += REG_HEIGHT + GAP_Y
 
+    def draw_datapath(self, cpu):
         x_right = 300
         y = 50
         regs_right = [('IR', cpu.ir), ('TIR', cpu.tir)]
         for name, reg in regs_right:
             val = reg.read()
-            is_active = name in cpu.signals['active_path']
+            is_active = cpu.is_active(name)
             self.draw_rect_with_text(x_right, y, REG_WIDTH, REG_HEIGHT, name, val, active=is_active)
             y += REG_HEIGHT + GAP_Y
             
-        alu_active = 'ALU' in cpu.signals['active_path']
+        alu_active = cpu.is_active('ALU')
         self.draw_rect_with_text(x_right, y + 20, REG_WIDTH, REG_HEIGHT, "ULA (ALU)", active=alu_active)
-        
+
+    def draw_cache_box(self, cache_status):
         x_mem = 550
         y_mem = 50
-        cache_status = cpu.cache.last_access_type
         color_cache = COLOR_CACHE_HIT if cache_status == "HIT" else (COLOR_CACHE_MISS if cache_status == "MISS" else COLOR_INACTIVE)
         pygame.draw.rect(self.screen, color_cache, (x_mem, y_mem, 150, 50))
         pygame.draw.rect(self.screen, COLOR_REGISTER_BORDER, (x_mem, y_mem, 150, 50), 2)
         status_text = f"CACHE: {cache_status}"
-        text_surf = self.font.render(status_text, True, COLOR_TEXT)
+        text_surf = text_cache.render(self.font, status_text, COLOR_TEXT)
         self.screen.blit(text_surf, (x_mem + 10, y_mem + 15))
-        
-        # Draw Memory View
-        last_access = cpu.mar.read() if cpu.signals['read_mem'] or cpu.signals['write_mem'] else None
-        self.memory_view.draw(self.screen, cpu.memory, last_access_addr=last_access)
-        
+
+    def draw_signals(self, signals, mpc):
         y_sig = 400
         x_sig = 50
-        signals_str = f"Leitura: {cpu.signals['read_mem']} | Escrita: {cpu.signals['write_mem']} | ULA: {cpu.signals['alu_op']}"
-        sig_surf = self.font.render(signals_str, True, COLOR_TEXT)
+        signals_str = f"Leitura: {signals['read_mem']} | Escrita: {signals['write_mem']} | ULA: {signals['alu_op']}"
+        sig_surf = text_cache.render(self.font, signals_str, COLOR_TEXT)
         self.screen.blit(sig_surf, (x_sig, y_sig))
         
-        mpc_str = f"MPC: {cpu.mpc}"
-        mpc_surf = self.title_font.render(mpc_str, True, COLOR_HIGHLIGHT)
+        mpc_str = f"MPC: {mpc}"
+        mpc_surf = text_cache.render(self.title_font, mpc_str, COLOR_HIGHLIGHT)
         self.screen.blit(mpc_surf, (x_sig, y_sig + 30))
         
         # --- Explanation Panel ---
@@ -475,42 +882,84 @@ class GUI:
         pygame.draw.rect(self.screen, (50, 50, 60), (x_sig, exp_y, 700, 60))
         pygame.draw.rect(self.screen, COLOR_REGISTER_BORDER, (x_sig, exp_y, 700, 60), 2)
         
-        explanation = self.get_explanation(cpu.mpc)
-        exp_surf = self.font.render(explanation, True, (255, 255, 200))
+        explanation = self.get_explanation(mpc)
+        exp_surf = text_cache.render(self.font, explanation, (255, 255, 200))
         self.screen.blit(exp_surf, (x_sig + 10, exp_y + 20))
-        
-        # --- History Log ---
-        # Title at y - 20, so rect.y must be > exp_y + 60 + 20 = 550
-        self.history_log.rect.y = exp_y + 90 # 560
-        self.history_log.rect.height = 130   # Ends at 690
-        self.history_log.max_logs = (self.history_log.rect.height - 25) // self.history_log.line_height
-        self.history_log.draw(self.screen)
-        
-        # --- Buttons ---
-        btn_y = 720
-        for i, btn in enumerate(self.buttons):
-            btn.rect.y = btn_y
-        
-        for btn in self.buttons:
-            btn.draw(self.screen, mouse_pos)
 
-        # Status Bar (Bottom)
-        status_y = 770
-        status_color = (255, 50, 50) if "Erro" in self.status_message else self.status_color
-        status_surf = self.font.render(f"Status: {self.status_message}", True, status_color)
-        self.screen.blit(status_surf, (x_sig, status_y))
+    def draw_status(self, message, color):
+        status_color = (255, 50, 50) if "Erro" in message else color
+        status_surf = text_cache.render(self.font, f"Status: {message}", status_color)
+        self.screen.blit(status_surf, (50, 770))
+
+    def draw_cpu(self, cpu):
+        """
+        Redraws the panels whose content changed and pushes only their
+        rectangles to the display (the whole screen after invalidate()).
+        """
+        full = self.full_redraw
+        if full:
+            self.full_redraw = False
+            self.screen.fill(COLOR_BACKGROUND)
+            for panel in self.panels():
+                panel.dirty = True
+        mouse_pos = pygame.mouse.get_pos()
         
-        # --- Editor ---
-        self.editor.draw(self.screen, current_pc=cpu.pc.read())
+        self.history_log.record(cpu)
+        self.history_log.step_search()
+        signals = cpu.signals
+
+        registers_state = (cpu.mar.read(), cpu.mbr.read(), cpu.pc.read(), cpu.sp.read(), cpu.ac.read(), cpu.active)
+        datapath_state = (cpu.ir.read(), cpu.tir.read(), cpu.active)
+        last_access = cpu.mar.read() if signals['read_mem'] or signals['write_mem'] else None
+        cache_status = cpu.cache.last_access_type
+        current_pc = cpu.pc.read()
+
+        rects = [
+            self.registers_panel.refresh(self.screen, registers_state, cpu),
+            self.datapath_panel.refresh(self.screen, datapath_state, cpu),
+            self.heatmap.refresh(self.screen, self.heatmap.view_state(cpu), cpu),
+            self.cache_panel.refresh(self.screen, cache_status, cache_status),
+            self.memory_view.refresh(self.screen, self.memory_view.view_state(cpu.memory, last_access),
+                                     cpu.memory, last_access),
+            self.signals_panel.refresh(self.screen, (signals['read_mem'], signals['write_mem'], signals['alu_op'], cpu.mpc),
+                                      signals, cpu.mpc),
+            self.history_log.refresh(self.screen, self.history_log.view_state()),
+            self.status_panel.refresh(self.screen, (self.status_message, self.status_color),
+                                      self.status_message, self.status_color),
+            self.editor.refresh(self.screen, self.editor.view_state(current_pc), current_pc),
+        ]
+        rects += [btn.refresh(self.screen, (btn.rect.collidepoint(mouse_pos), btn.text), mouse_pos)
+                  for btn in self.buttons]
+
+        if full:
+            pygame.display.flip()
+        else:
+            rects = [rect for rect in rects if rect is not None]
+            if rects:
+                pygame.display.update(rects)
+
+    def set_speed_label(self, label):
+        for btn in self.buttons:
+            if btn.action_name == "SPEED":
+                btn.text = f"VEL: {label}"
 
-        pygame.display.flip()
+    def panels(self):
+        return [self.registers_panel, self.datapath_panel, self.heatmap, self.cache_panel, self.memory_view, self.signals_panel,
+                self.history_log, self.status_panel, self.editor] + self.buttons
 
     def handle_events(self):
         for event in pygame.event.get():
             if event.type == pygame.QUIT:
                 return "QUIT"
+            if event.type in (pygame.VIDEOEXPOSE, pygame.WINDOWEXPOSED):
+                self.invalidate()
             
-            self.editor.handle_event(event)
+            if self.history_log.handle_event(event):
+                if self.history_log.searching:
+                    self.editor.active = False
+                continue
+            if self.editor.handle_event(event) == "BREAKPOINTS":
+                return "BREAKPOINTS"
             self.memory_view.handle_event(event)
             
             for btn in self.buttons:
@@ -522,5 +971,11 @@ class GUI:
                     return "STEP"
                 if event.key == pygame.K_r:
                     return "RUN"
+                if event.key == pygame.K_b:
+                    return "RUN_BREAK"
+                if event.key in (pygame.K_PLUS, pygame.K_EQUALS, pygame.K_KP_PLUS):
+                    return "SPEED_UP"
+                if event.key in (pygame.K_MINUS, pygame.K_KP_MINUS):
+                    return "SPEED_DOWN"
                     
         return None
@@ -1,6 +1,10 @@
 # hardware.py
+import random
+from array import array
 
 class Register:
+    __slots__ = ('name', '_value')
+
     def __init__(self, name, value=0):
         self.name = name
         self._value = value # Internal 16-bit value
@@ -21,9 +25,15 @@ class Register:
         self.value = val
 
 class Memory:
-    def __init__(self, size=4096):
+    def __init__(self, size=4096, buffer=None):
         self.size = size
-        self.data = [0] * size
+        if buffer is None:
+            self.data = array('H', bytes(2 * size)) # Unsigned 16-bit words
+        else:
+            # Words kept in place in an existing buffer (e.g. shared memory)
+            self.data = memoryview(buffer).cast('H')[:size]
+        self.on_write = None # Optional callback(addr), e.g. code cache invalidation
+        self.mutations = 0 # Writes that changed a stored value (see CPU.loops_forever)
 
     def read(self, addr):
         if 0 <= addr < self.size:
@@ -32,102 +42,328 @@ class Memory:
 
     def write(self, addr, val):
         if 0 <= addr < self.size:
-            self.data[addr] = val & 0xFFFF
+            val &= 0xFFFF
+            if self.data[addr] != val:
+                self.data[addr] = val
+                self.mutations += 1
+            if self.on_write is not None:
+                self.on_write(addr)
+
+    def load(self, image, base=0):
+        """Copies a sequence of words into memory starting at base."""
+        words = array('H', [val & 0xFFFF for val in image])
+        end = base + len(words)
+        if base < 0 or end > self.size:
+            raise ValueError(f"Image of {len(words)} words does not fit at address {base}")
+        self.data[base:end] = words
+        self.mutations += 1
+        if self.on_write is not None:
+            for addr in range(base, end):
+                self.on_write(addr)
+
+    def dump(self, base=0, count=None):
+        """Returns a list with count words starting at base (default: to the end)."""
+        end = self.size if count is None else min(self.size, base + count)
+        return self.data[base:end].tolist()
+
+    def view(self):
+        """Zero-copy view of the memory words."""
+        return memoryview(self.data)
 
 class Cache:
-    def __init__(self, memory, size=16):
+    """
+    Cache between the CPU and Memory.
+
+    size lines of block_size words, grouped in sets of `associativity` lines
+    (1 = direct mapped, size = fully associative). Replacement is 'lru',
+    'fifo' or 'random'; writes allocate a line and are either written
+    through to memory or kept in the line until it is evicted (write_back).
+    The default is the original 16-line direct-mapped, one-word,
+    write-through cache.
+
+    Addresses above the end of memory can still be cached: their words
+    exist only in the lines (memory ignores the writes and reads them as 0).
+    """
+    POLICIES = ('lru', 'fifo', 'random')
+
+    def __init__(self, memory, size=16, associativity=1, block_size=1,
+                 replacement='lru', write_back=False, seed=None):
+        if size <= 0 or block_size <= 0 or associativity <= 0 or size % associativity:
+            raise ValueError(f"Invalid cache geometry: {size} lines, {associativity}-way, "
+                             f"{block_size} words per block")
+        if replacement not in self.POLICIES:
+            raise ValueError(f"Unknown replacement policy: {replacement}")
         self.memory = memory
         self.size = size
-        # Cache lines: list of dicts {valid, tag, data}
-        self.lines = [{'valid': False, 'tag': 0, 'data': 0} for _ in range(size)]
+        self.associativity = associativity
+        self.block_size = block_size
+        self.num_sets = size // associativity
+        self.replacement = replacement
+        self.write_back = write_back
+        self.random = random.Random(seed)
+        self._direct = associativity == 1 and block_size == 1 # Fast path: line == set, one word
+
+        # Line state; line i belongs to set i // associativity
+        self.valid = bytearray(size)
+        self.dirty = bytearray(size)
+        self.tags = array('L', [0] * size)
+        self.data = array('H', bytes(2 * size * block_size)) # block_size words per line
+        self.stamps = array('Q', [0] * size) # Last use (LRU) or fill time (FIFO)
+        self.clock = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.writebacks = 0
         self.last_access_type = "NONE" # "HIT" or "MISS"
+        self.on_write = None # Optional callback(addr), called on every write
+
+    def _locate(self, addr):
+        """(set, tag, offset) of an address."""
+        block, offset = divmod(addr, self.block_size)
+        tag, index = divmod(block, self.num_sets)
+        return index, tag, offset
+
+    def line_address(self, line):
+        """First address of the block held by a line."""
+        return (self.tags[line] * self.num_sets + line // self.associativity) * self.block_size
+
+    def _find(self, index, tag):
+        """Line holding the block, or None."""
+        ways = self.associativity
+        if ways == 1:
+            if self.valid[index] and self.tags[index] == tag:
+                return index
+            return None
+        first = index * ways
+        valid = self.valid
+        tags = self.tags
+        for line in range(first, first + ways):
+            if valid[line] and tags[line] == tag:
+                return line
+        return None
+
+    def _touch(self, line):
+        if self.replacement == 'lru' and self.associativity > 1:
+            self.clock += 1
+            self.stamps[line] = self.clock
+
+    def _victim(self, index):
+        ways = self.associativity
+        first = index * ways
+        for line in range(first, first + ways):
+            if not self.valid[line]:
+                return line
+        if ways == 1:
+            return first
+        if self.replacement == 'random':
+            return first + self.random.randrange(ways)
+        stamps = self.stamps
+        return min(range(first, first + ways), key=stamps.__getitem__)
+
+    def _evict(self, line):
+        memory = self.memory
+        bs = self.block_size
+        base = self.line_address(line)
+        words = self.data[line * bs:(line + 1) * bs]
+        self.evictions += 1
+        if self.dirty[line]:
+            self.dirty[line] = 0
+            self.writebacks += 1
+            for offset, val in enumerate(words):
+                memory.write(base + offset, val)
+        if base + bs > memory.size:
+            # Words above the end of memory only lived in this line
+            start = max(0, memory.size - base)
+            if any(words[start:]):
+                memory.mutations += 1
 
-    def _get_index_tag(self, addr):
-        # Direct Mapping:
-        # Assuming 4096 words (12 bits address)
-        # Cache size 16 (4 bits index)
-        # Tag = remaining bits (12 - 4 = 8 bits)
-        index = addr % self.size
-        tag = addr // self.size
-        return index, tag
+    def _allocate(self, index, tag):
+        """Brings a block into its set (evicting a line if needed). Returns the line."""
+        line = self._victim(index)
+        if self.valid[line]:
+            self._evict(line)
+        bs = self.block_size
+        base = (tag * self.num_sets + index) * bs
+        memory = self.memory
+        if base + bs <= memory.size:
+            self.data[line * bs:(line + 1) * bs] = memory.data[base:base + bs]
+        else:
+            for offset in range(bs):
+                self.data[line * bs + offset] = memory.read(base + offset)
+        self.valid[line] = 1
+        self.dirty[line] = 0
+        self.tags[line] = tag
+        if self.replacement != 'random' and self.associativity > 1:
+            self.clock += 1
+            self.stamps[line] = self.clock
+        return line
+
+    def _fill_word(self, line, addr):
+        """_allocate() for direct-mapped one-word lines (the default), inlined."""
+        memory = self.memory
+        if self.valid[line]:
+            self.evictions += 1
+            old = self.tags[line] * self.size + line
+            if self.dirty[line]:
+                self.dirty[line] = 0
+                self.writebacks += 1
+                memory.write(old, self.data[line])
+            if old >= memory.size and self.data[line]:
+                memory.mutations += 1 # Words above the end of memory only lived in this line
+        self.valid[line] = 1
+        self.tags[line] = addr // self.size
+        self.data[line] = memory.read(addr)
+        return line
+
+    def peek(self, addr):
+        """Value a read would return, without touching the cache state."""
+        index, tag, offset = self._locate(addr)
+        line = self._find(index, tag)
+        if line is not None:
+            return self.data[line * self.block_size + offset]
+        return self.memory.read(addr)
 
     def read(self, addr):
-        index, tag = self._get_index_tag(addr)
-        line = self.lines[index]
+        if self._direct:
+            index = addr % self.size
+            if self.valid[index] and self.tags[index] == addr // self.size:
+                self.last_access_type = "HIT"
+                self.hits += 1
+                return self.data[index]
+            self.last_access_type = "MISS"
+            self.misses += 1
+            return self.data[self._fill_word(index, addr)]
 
-        if line['valid'] and line['tag'] == tag:
+        index, tag, offset = self._locate(addr)
+        line = self._find(index, tag)
+        if line is not None:
             self.last_access_type = "HIT"
-            return line['data']
+            self.hits += 1
+            self._touch(line)
         else:
             self.last_access_type = "MISS"
-            # Fetch from memory
-            data = self.memory.read(addr)
-            # Update cache
-            self.lines[index] = {'valid': True, 'tag': tag, 'data': data}
-            return data
+            self.misses += 1
+            # Fetch the block from memory
+            line = self._allocate(index, tag)
+        return self.data[line * self.block_size + offset]
 
     def write(self, addr, val):
-        # Write-Allocate Policy:
-        # 1. Check if address is in cache (Hit/Miss)
-        index, tag = self._get_index_tag(addr)
-        
-        if self.lines[index]['valid'] and self.lines[index]['tag'] == tag:
-            # HIT: Update cache and memory (Write-Through)
-            self.lines[index]['data'] = val
-            self.memory.write(addr, val)
-            self.last_access_type = "HIT"
+        val &= 0xFFFF
+        if self.write_back or addr >= self.memory.size:
+            # Memory will not see this value now (see Memory.mutations)
+            if self.peek(addr) != val:
+                self.memory.mutations += 1
+        if self._direct:
+            line = addr % self.size
+            if self.valid[line] and self.tags[line] == addr // self.size:
+                self.last_access_type = "HIT"
+                self.hits += 1
+            else:
+                # Write-Allocate
+                self.last_access_type = "MISS"
+                self.misses += 1
+                self._fill_word(line, addr)
+            self.data[line] = val
         else:
-            # MISS: Write-Allocate
-            # 1. Write to memory first (Write-Through)
-            self.memory.write(addr, val)
-            # 2. Bring block to cache (Allocate)
-            self.lines[index] = {'valid': True, 'tag': tag, 'data': val}
-            self.last_access_type = "MISS"
+            index, tag, offset = self._locate(addr)
+            line = self._find(index, tag)
+            if line is not None:
+                self.last_access_type = "HIT"
+                self.hits += 1
+                self._touch(line)
+            else:
+                self.last_access_type = "MISS"
+                self.misses += 1
+                line = self._allocate(index, tag)
+            self.data[line * self.block_size + offset] = val
+        if self.write_back:
+            self.dirty[line] = 1
+        else:
+            self.memory.write(addr, val) # Write-Through
+        if self.on_write is not None:
+            self.on_write(addr)
+
+    def flush(self):
+        """Writes every dirty line back to memory (lines stay valid)."""
+        memory = self.memory
+        bs = self.block_size
+        for line in range(self.size):
+            if self.valid[line] and self.dirty[line]:
+                base = self.line_address(line)
+                for offset in range(bs):
+                    memory.write(base + offset, self.data[line * bs + offset])
+                self.dirty[line] = 0
+                self.writebacks += 1
+
+    def stats(self):
+        accesses = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'writebacks': self.writebacks,
+            'hit_rate': self.hits / accesses if accesses else 0.0,
+        }
 
 class ALU:
+    """
+    N and Z are not stored: the ALU keeps its last result and derives the
+    flags from it when they are read (only conditional jumps need them).
+    """
     def __init__(self):
-        self.n_flag = False
-        self.z_flag = False
+        self.result = 1 # No result yet: N and Z clear
+
+    @property
+    def n_flag(self):
+        # If bit 15 is 1, it's negative in 2's complement
+        return (self.result & 0x8000) != 0
+
+    @property
+    def z_flag(self):
+        return self.result == 0
 
     def update_flags(self, result):
-        # Result is treated as 16-bit signed for flags usually, 
+        # Result is treated as 16-bit signed for flags usually,
         # but here we stick to simple checks on the 16-bit unsigned result
-        # If bit 15 is 1, it's negative in 2's complement
-        self.z_flag = (result == 0)
-        self.n_flag = (result & 0x8000) != 0
+        self.result = result
+
+    def set_flags(self, n, z):
+        """Sets N and Z directly (they cannot both be set)."""
+        self.result = 0 if z else (0x8000 if n else 1)
 
     def add(self, a, b):
         res = (a + b) & 0xFFFF
-        self.update_flags(res)
+        self.result = res
         return res
 
     def sub(self, a, b):
         # a - b
         # In 2's complement: a + (~b + 1)
         res = (a - b) & 0xFFFF
-        self.update_flags(res)
+        self.result = res
         return res
 
     def band(self, a, b):
         res = (a & b) & 0xFFFF
-        self.update_flags(res)
+        self.result = res
         return res
     
     def inv(self, a):
         res = (~a) & 0xFFFF
-        self.update_flags(res)
+        self.result = res
         return res
     
     def lshift(self, a):
         res = (a << 1) & 0xFFFF
-        self.update_flags(res)
+        self.result = res
         return res
     
     def rshift(self, a):
         # Arithmetic shift right usually preserves sign, but let's do logical for simplicity unless specified
         # Tanenbaum MIC-1 usually does simple shifts.
         res = (a >> 1) & 0xFFFF
-        self.update_flags(res)
+        self.result = res
         return res
 
     @staticmethod
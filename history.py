@@ -0,0 +1,115 @@
+# history.py
+# Execution history kept as a fixed-capacity ring buffer of compact
+# records: the cycle count and the MicroState fields of each observed
+# micro-instruction, in parallel arrays allocated once. Text entries (e.g.
+# "Execução rápida: ...") are kept aside by position. Entries are only
+# formatted (cpu.describe) when shown or searched; the oldest ones are
+# overwritten once the buffer is full.
+from array import array
+from functools import lru_cache
+
+from config import HISTORY_CAPACITY
+from cpu import MicroState, describe
+
+TEXT_ENTRY = 0xFFFF # mpc of an entry that is a text
+FLAG_N = 0x1
+FLAG_Z = 0x2
+
+@lru_cache(maxsize=65536)
+def _describe(fields):
+    return describe(MicroState(*fields))
+
+@lru_cache(maxsize=65536)
+def _describe_lower(fields):
+    return _describe(fields).lower()
+
+class History:
+    """
+    Ring buffer of execution entries. Entries are numbered from 0 in the
+    order they were added; the ones still held are first..count-1.
+    """
+    def __init__(self, capacity=HISTORY_CAPACITY):
+        if capacity < 1:
+            raise ValueError(f"Invalid history capacity: {capacity}")
+        self.capacity = capacity
+        self.cycles = array('Q', bytes(8 * capacity))
+        self.mpc = array('H', bytes(2 * capacity))
+        self.regs = [array('H', bytes(2 * capacity)) for _ in range(6)] # pc ac sp ir mar mbr
+        self.flags = bytearray(capacity)
+        self.texts = {} # Entry number -> text, for text entries
+        self.count = 0
+
+    def __len__(self):
+        return min(self.count, self.capacity)
+
+    @property
+    def first(self):
+        return self.count - len(self)
+
+    def _slot(self):
+        number = self.count
+        if number >= self.capacity:
+            self.texts.pop(number - self.capacity, None)
+        self.count = number + 1
+        return number % self.capacity
+
+    def add_state(self, cycle, state):
+        """Adds a micro-instruction (a cpu.MicroState) executed up to cycle."""
+        slot = self._slot()
+        self.cycles[slot] = cycle
+        self.mpc[slot] = state.mpc
+        pc, ac, sp, ir, mar, mbr = self.regs
+        pc[slot], ac[slot], sp[slot] = state.pc, state.ac, state.sp
+        ir[slot], mar[slot], mbr[slot] = state.ir, state.mar, state.mbr
+        self.flags[slot] = (FLAG_N if state.n else 0) | (FLAG_Z if state.z else 0)
+
+    def add_text(self, cycle, text):
+        number = self.count
+        slot = self._slot()
+        self.cycles[slot] = cycle
+        self.mpc[slot] = TEXT_ENTRY
+        self.texts[number] = text
+
+    def cycle(self, number):
+        return self.cycles[number % self.capacity]
+
+    def text(self, number):
+        """The entry formatted as the GUI shows it."""
+        if not self.first <= number < self.count:
+            raise IndexError(f"History entry {number} is not held")
+        slot = number % self.capacity
+        mpc = self.mpc[slot]
+        if mpc == TEXT_ENTRY:
+            return self.texts[number]
+        flags = self.flags[slot]
+        return _describe((mpc,) + tuple(reg[slot] for reg in self.regs) +
+                         (bool(flags & FLAG_N), bool(flags & FLAG_Z)))
+
+    def find(self, query, start, limit=None):
+        """
+        Searches backwards from entry start for an entry containing query
+        (case-insensitive). Looks at no more than limit entries. Returns
+        (entry number or None, where to continue; below first when done).
+        """
+        query = query.lower()
+        stop = self.first - 1
+        if limit is not None:
+            stop = max(stop, start - limit)
+        capacity, mpcs, flags, texts = self.capacity, self.mpc, self.flags, self.texts
+        pc, ac, sp, ir, mar, mbr = self.regs
+        for number in range(min(start, self.count - 1), stop, -1):
+            slot = number % capacity
+            mpc = mpcs[slot]
+            if mpc == TEXT_ENTRY:
+                text = texts[number].lower()
+            else:
+                f = flags[slot]
+                text = _describe_lower((mpc, pc[slot], ac[slot], sp[slot], ir[slot], mar[slot], mbr[slot],
+                                        bool(f & FLAG_N), bool(f & FLAG_Z)))
+            if query in text:
+                return number, number - 1
+        return None, stop
+
+    def clear(self):
+        self.texts.clear()
+        self.count = 0
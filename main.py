@@ -1,16 +1,154 @@
 # main.py
+import argparse
 import pygame
 import sys
+import time
 from cpu import CPU
 from hardware import Memory, Cache
 from gui import GUI
-from assembler import assemble
-from config import COLOR_CACHE_HIT, COLOR_CACHE_MISS, COLOR_TEXT
+from assembler import assemble_program
+from engine import FastEngine
+from runner import describe_break
+from worker import RemoteCPU
+from config import COLOR_CACHE_HIT, COLOR_CACHE_MISS, COLOR_TEXT, FPS
+
+# Speeds of EXECUTAR: micro-cycles per frame, None = as many as fit in the
+# frame budget. One cycle per frame runs at STEP_FPS so it can be followed.
+SPEEDS = (1, 10, 100, 1000, None)
+STEP_FPS = 10
+IDLE_FPS = 30
+# Share of each frame given to the simulation at full speed; the rest is
+# left for drawing and events so the window stays responsive
+FRAME_BUDGET = 0.6 / FPS
+MIN_BATCH = 1_000
+MAX_BATCH = 2_000_000
+
+class SpeedControl:
+    """Speed selected in the GUI and the adaptive batch size of full-speed runs."""
+    def __init__(self):
+        self.index = 0
+        self.batch = MIN_BATCH * 10
+
+    @property
+    def cycles_per_frame(self):
+        return SPEEDS[self.index]
+
+    @property
+    def label(self):
+        cycles = self.cycles_per_frame
+        if cycles is None:
+            return "MAXIMO"
+        return "1 CICLO" if cycles == 1 else f"{cycles} CICLOS"
+
+    @property
+    def frame_rate(self):
+        return STEP_FPS if self.cycles_per_frame == 1 else FPS
+
+    def change(self, step):
+        self.index = (self.index + step) % len(SPEEDS)
+
+    def run_frame(self, cpu, observer=None):
+        """
+        Runs the cycles of one frame at the selected speed. Returns the run
+        status. At a fixed speed observer sees every micro-instruction (see
+        CPU.run); at full speed it is not called.
+        """
+        if self.cycles_per_frame is not None:
+            return cpu.run(self.cycles_per_frame, observer=observer)
+        return self.run_budget(cpu)
+
+    def run_budget(self, cpu):
+        """
+        Runs whole instructions for about FRAME_BUDGET seconds. The batch
+        is rescaled from the last frame's rate, at most doubling or halving
+        each time so a slow frame does not make it swing.
+        """
+        start = time.perf_counter()
+        status = FastEngine(cpu).run(self.batch)
+        elapsed = time.perf_counter() - start
+        if status == "BUDGET" and elapsed > 0:
+            scale = min(2.0, max(0.5, FRAME_BUDGET / elapsed))
+            self.batch = min(MAX_BATCH, max(MIN_BATCH, int(self.batch * scale)))
+        return status
+
+def sync_breakpoints(session, editor, program, source):
+    """
+    Arms a PC breakpoint for every instruction on a line marked in the
+    editor. The line map is the one of the last assembly (of the lines in
+    source), so once the text was edited nothing is armed; returns False
+    then if lines are marked.
+    """
+    if program is None or editor.get_text() != source:
+        session.set_breakpoints(())
+        return program is None or not editor.breakpoints
+    session.set_breakpoints(addr for addr, line in enumerate(program.lines)
+                            if line in editor.breakpoints)
+    return True
+
+def show_stop(gui, cpu):
+    """Status message when a run stops by itself."""
+    if cpu.halted:
+        # Program ended (JUMP to itself or a loop that changes nothing)
+        gui.status_message = f"Programa finalizado apos {cpu.cycle_count} ciclos."
+    else:
+        gui.status_message = f"Parada: {describe_break(cpu.break_reason)}"
+    gui.status_color = COLOR_CACHE_HIT
+
+class LocalSession:
+    """Runs the CPU in the GUI process, a batch of cycles between frames."""
+    def __init__(self):
+        self.cpu = CPU()
+
+    def reset(self):
+        self.cpu = CPU()
+
+    def load(self, code):
+        cpu = CPU()
+        cpu.memory.load(code)
+        self.cpu = cpu
+
+    def step(self):
+        self.cpu.cycle()
+
+    def set_breakpoints(self, addrs):
+        self.cpu.breakpoints.clear()
+        self.cpu.breakpoints.update(addrs)
+
+    def run_frame(self, mode, speed, observer=None):
+        """
+        Runs one frame's worth of cycles for mode ("RUN" at the selected
+        speed, "RUN_BREAK" at full speed, None paused). Returns "HALTED" or
+        "BREAK" if the run stopped by itself. observer: see SpeedControl.run_frame.
+        """
+        if mode == "RUN":
+            status = speed.run_frame(self.cpu, observer)
+        elif mode == "RUN_BREAK":
+            status = speed.run_budget(self.cpu)
+        else:
+            return None
+        return status if status in ("HALTED", "BREAK") else None
+
+    def consistent(self):
+        return True
+
+    def close(self):
+        pass
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Simulador MIC-1 com interface grafica.")
+    parser.add_argument("--processo", action="store_true",
+                        help="executa a simulacao em um processo separado (memoria compartilhada)")
+    args = parser.parse_args(argv)
 
-def main():
     # 1. Initialize Components
-    cpu = CPU()
+    # The worker process is started before pygame is initialized
+    session = RemoteCPU() if args.processo else LocalSession()
     gui = GUI()
+    speed = SpeedControl()
+    gui.set_speed_label(speed.label)
+    gui.heatmap.track(session.cpu) # Every new CPU of the session (here, RESET, LOAD)
+    program = None # Last successful assembly (line map for breakpoints)
+    source = None # Editor lines it was assembled from
     
     # 2. Initial Setup
     # We don't load code automatically anymore, we wait for user to click LOAD
@@ -19,52 +157,78 @@ def main():
     # 3. Main Loop
     running = True
     auto_run = False
+    fast_run = False # Full speed until a breakpoint or the end of the program
     
     while running:
         # Handle Input
         action = gui.handle_events()
+        # Also while running: a line marked or unmarked takes effect at once
+        if action in ("STEP", "RUN", "RUN_BREAK", "BREAKPOINTS"):
+            if not sync_breakpoints(session, gui.editor, program, source):
+                gui.status_message = "Codigo alterado: clique em CARREGAR para usar os breakpoints."
+                gui.status_color = COLOR_CACHE_MISS
 
         if action == "QUIT":
             running = False
         elif action == "STEP":
-            cpu.cycle()
+            session.step()
         elif action == "RUN":
             auto_run = not auto_run
+            fast_run = False
+        elif action == "RUN_BREAK":
+            fast_run = not fast_run
+            auto_run = False
+        elif action in ("SPEED", "SPEED_UP", "SPEED_DOWN"):
+            speed.change(-1 if action == "SPEED_DOWN" else 1)
+            gui.set_speed_label(speed.label)
         elif action == "RESET":
-            # Reset CPU state
-            cpu = CPU()
-            # Reload current memory from last successful assembly? No, clear it.
-            # cpu.memory is already new from CPU() init
+            # Reset CPU state (memory is cleared too)
+            session.reset()
+            gui.heatmap.track(session.cpu)
             auto_run = False
+            fast_run = False
             gui.status_message = "Reiniciado. Clique em CARREGAR."
             gui.status_color = COLOR_TEXT
             # Force GUI to see new CPU immediately
-            gui.draw_cpu(cpu)
+            gui.draw_cpu(session.cpu)
 
         elif action == "LOAD":
             # Get code from editor
             code_lines = gui.editor.get_text()
             try:
-                machine_code = assemble(code_lines)
-                # Clear and Load Memory
-                cpu = CPU() # Reset CPU
-                for i, code in enumerate(machine_code):
-                    cpu.memory.write(i, code)
+                program = assemble_program(code_lines)
+                source = list(code_lines) # get_text() is the live list of the editor
+                # Reset the CPU and load memory
+                session.load(program.code)
+                gui.heatmap.track(session.cpu)
+                sync_breakpoints(session, gui.editor, program, source)
                 
                 gui.status_message = "Codigo Carregado com Sucesso!"
                 gui.status_color = COLOR_CACHE_HIT # Green
                 auto_run = False
+                fast_run = False
             except Exception as e:
                 gui.status_message = f"Erro: {str(e)}"
                 gui.status_color = COLOR_CACHE_MISS # Red
-            
-        if auto_run:
-            cpu.cycle()
+
+        mode = "RUN" if auto_run else ("RUN_BREAK" if fast_run else None)
+        # At fixed speeds every micro-instruction goes to the history, at
+        # full speed only the state each frame shows
+        if session.run_frame(mode, speed, gui.history_log.record) is not None:
+            auto_run = fast_run = False
+            show_stop(gui, session.cpu)
             
         # Draw
-        gui.draw_cpu(cpu)
-        gui.clock.tick(10 if auto_run else 30)
+        gui.draw_cpu(session.cpu)
+        if not session.consistent():
+            # The worker overwrote the memory while it was drawn
+            gui.memory_view.dirty = True
+        if auto_run:
+            gui.clock.tick(speed.frame_rate)
+        else:
+            gui.clock.tick(FPS if fast_run else IDLE_FPS)
 
+    session.close()
     pygame.quit()
     sys.exit()
 
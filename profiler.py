@@ -0,0 +1,233 @@
+# profiler.py
+# Execution profiler for MAC-1 programs. Counts instructions and micro-cycles
+# per address, opcode, MPC state and assembler label, and follows CALL/RETN
+# to attribute cycles to call stacks, exported as JSON or as folded stacks
+# (one "frame;frame;frame cycles" line per stack) for flamegraph tools.
+import argparse
+import bisect
+import json
+import sys
+from collections import Counter
+
+from assembler import assemble_program
+from decoder import MNEMONIC, OPCODE_MPC
+from engine import FastEngine, OPCODE_CYCLES, instruction_cycles
+import runner
+
+ROOT_FRAME = "main" # Frame of the code that was not reached through a CALL
+
+# Micro-instructions after MPC 90 for each Type F sub-opcode
+TYPE_F_PATHS = {
+    0x0: (100, 101, 102, 103), # PSHI
+    0x2: (105, 106, 107),      # POPI
+    0x4: (91, 92),             # PUSH
+    0x6: (94, 95),             # POP
+    0x8: (97, 98),             # RETN
+}
+
+def micro_path(word):
+    """MPC states the micro-stepper goes through to execute one instruction."""
+    opcode = word >> 12
+    if opcode == 0xF:
+        return (0, 1, 2, 90) + TYPE_F_PATHS.get((word >> 8) & 0xF, ())
+    start = OPCODE_MPC[opcode]
+    return (0, 1, 2) + tuple(range(start, start + OPCODE_CYCLES[opcode]))
+
+class Profiler:
+    """
+    Runs a CPU one instruction at a time (through FastEngine, so the state
+    and cycle counts are the micro-stepper's) and records where the cycles go.
+    `program` (from assembler.assemble_program) provides labels and source lines.
+    """
+    def __init__(self, cpu, program=None):
+        self.cpu = cpu
+        self.program = program
+        symbols = program.symbols if program is not None else {}
+        self.label_addrs = sorted(symbols.values())
+        self.label_names = {addr: label for label, addr in sorted(symbols.items(), reverse=True)}
+
+        self.instructions = 0
+        self.cycles = 0
+        self.pc_counts = Counter()
+        self.pc_cycles = Counter()
+        self.words = Counter() # Executed instruction words (opcode and MPC totals derive from them)
+        self.pc_words = {} # Address -> last instruction word executed there (as fetched, through the cache)
+        self.stack = [ROOT_FRAME]
+        self.stacks = Counter() # "frame;frame" -> cycles
+
+    def label_of(self, addr):
+        """Nearest label at or before addr, or None."""
+        i = bisect.bisect_right(self.label_addrs, addr)
+        if i == 0:
+            return None
+        return self.label_names[self.label_addrs[i - 1]]
+
+    def _frame(self, addr):
+        """Name of a call target: its label, label+offset or the address."""
+        i = bisect.bisect_right(self.label_addrs, addr)
+        if i == 0:
+            return f"0x{addr:03X}"
+        base = self.label_addrs[i - 1]
+        label = self.label_names[base]
+        return label if base == addr else f"{label}+{addr - base}"
+
+    def run(self, max_cycles):
+        """
+        Executes whole instructions until the program halts or at least
+        max_cycles micro-cycles were spent. Returns the status of the last
+        step ("HALTED", "BUDGET" or "BREAK").
+        """
+        cpu = self.cpu
+        while cpu.mpc != 0 and max_cycles > 0: # Finish a partly executed instruction
+            cpu.cycle()
+            max_cycles -= 1
+        step = FastEngine(cpu).run
+        peek = cpu.cache.peek
+        pc_counts = self.pc_counts
+        pc_cycles = self.pc_cycles
+        words = self.words
+        pc_words = self.pc_words
+        stacks = self.stacks
+        key = ";".join(self.stack)
+        spent = 0
+        status = "BUDGET"
+
+        while spent < max_cycles:
+            pc = cpu.pc.read()
+            word = peek(pc)
+            before = cpu.cycle_count
+            status = step(1)
+            cycles = cpu.cycle_count - before
+            if cycles == 0: # Already halted, or stopped at a breakpoint
+                break
+            spent += cycles
+            pc_counts[pc] += 1
+            pc_cycles[pc] += cycles
+            words[word] += 1
+            pc_words[pc] = word
+            stacks[key] += cycles
+
+            opcode = word >> 12
+            if opcode == 0xE: # CALL
+                self.stack.append(self._frame(word & 0xFFF))
+                key = ";".join(self.stack)
+            elif opcode == 0xF and (word >> 8) & 0xF == 0x8 and len(self.stack) > 1: # RETN
+                self.stack.pop()
+                key = ";".join(self.stack)
+            if status != "BUDGET":
+                break
+
+        self.instructions = sum(pc_counts.values())
+        self.cycles = sum(pc_cycles.values())
+        return status
+
+    # --- Aggregates ---
+    def by_opcode(self):
+        """mnemonic -> {count, cycles}"""
+        table = {}
+        for word, count in self.words.items():
+            entry = table.setdefault(MNEMONIC[word], {'count': 0, 'cycles': 0})
+            entry['count'] += count
+            entry['cycles'] += count * instruction_cycles(word)
+        return table
+
+    def by_mpc(self):
+        """MPC -> micro-instructions executed (each one is one cycle)."""
+        counts = Counter()
+        for word, count in self.words.items():
+            for mpc in micro_path(word):
+                counts[mpc] += count
+        return dict(sorted(counts.items()))
+
+    def by_label(self):
+        """label -> {count, cycles}; code before the first label is under None."""
+        table = {}
+        for pc, count in self.pc_counts.items():
+            entry = table.setdefault(self.label_of(pc), {'count': 0, 'cycles': 0})
+            entry['count'] += count
+            entry['cycles'] += self.pc_cycles[pc]
+        return table
+
+    def by_address(self):
+        """One row per executed address, hottest first."""
+        rows = []
+        lines = self.program.lines if self.program is not None else ()
+        for pc, count in self.pc_counts.items():
+            word = self.pc_words[pc]
+            rows.append({
+                'addr': pc,
+                'label': self.label_of(pc),
+                'line': lines[pc] + 1 if pc < len(lines) else None,
+                'instruction': MNEMONIC[word],
+                'count': count,
+                'cycles': self.pc_cycles[pc],
+            })
+        rows.sort(key=lambda row: (-row['cycles'], row['addr']))
+        return rows
+
+    def report(self):
+        return {
+            'instructions': self.instructions,
+            'cycles': self.cycles,
+            'addresses': self.by_address(),
+            'opcodes': self.by_opcode(),
+            'mpc': self.by_mpc(),
+            'labels': {str(label): entry for label, entry in self.by_label().items()},
+            'stacks': dict(self.stacks),
+        }
+
+    def write_json(self, path):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.report(), f, indent=2)
+
+    def folded(self):
+        """Folded stacks, one "frame;frame cycles" line each (flamegraph.pl, speedscope)."""
+        return [f"{stack} {cycles}" for stack, cycles in sorted(self.stacks.items())]
+
+    def write_folded(self, path):
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write("\n".join(self.folded()) + "\n")
+
+def format_profile(profiler, top=15):
+    total = profiler.cycles or 1
+    lines = [f"Instrucoes: {profiler.instructions}  Ciclos: {profiler.cycles}", ""]
+    lines.append(f"{'Endereco':>8}  {'Rotulo':<12} {'Instr':<5} {'Execucoes':>10} {'Ciclos':>10}      %")
+    for row in profiler.by_address()[:top]:
+        lines.append(f"{row['addr']:>8}  {row['label'] or '-':<12} {row['instruction']:<5} "
+                     f"{row['count']:>10} {row['cycles']:>10} {100 * row['cycles'] / total:6.1f}")
+    lines.append("")
+    lines.append(f"{'Rotulo':<21} {'Execucoes':>10} {'Ciclos':>10}      %")
+    labels = sorted(profiler.by_label().items(), key=lambda item: -item[1]['cycles'])
+    for label, entry in labels:
+        lines.append(f"{label or '-':<21} {entry['count']:>10} {entry['cycles']:>10} "
+                     f"{100 * entry['cycles'] / total:6.1f}")
+    return lines
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Perfil de execucao de um programa MAC-1.")
+    parser.add_argument("program", help="arquivo .asm")
+    parser.add_argument("--max-cycles", type=int, default=runner.DEFAULT_MAX_CYCLES)
+    parser.add_argument("--top", type=int, default=15, help="enderecos mais caros a listar")
+    parser.add_argument("--json", metavar="ARQUIVO", help="grava o perfil completo em JSON")
+    parser.add_argument("--folded", metavar="ARQUIVO", help="grava pilhas no formato folded (flamegraph)")
+    args = parser.parse_args(argv)
+
+    try:
+        with open(args.program, encoding='utf-8') as f:
+            program = assemble_program(f.read().splitlines())
+    except (OSError, ValueError) as e:
+        print(f"Erro: {e}", file=sys.stderr)
+        return 2
+
+    profiler = Profiler(runner.make_cpu(program.code), program)
+    status = profiler.run(args.max_cycles)
+    print(f"Status: {status}")
+    print("\n".join(format_profile(profiler, args.top)))
+    if args.json:
+        profiler.write_json(args.json)
+    if args.folded:
+        profiler.write_folded(args.folded)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,180 @@
+# runner.py
+# Headless batch runner: assembles a .asm file and executes it on the CPU
+# without importing pygame, printing the final machine state.
+import argparse
+import sys
+import time
+
+from assembler import assemble, assemble_program
+from cpu import CPU
+from engine import FastEngine
+from translator import TranslatingEngine
+from hardware import ALU, Cache
+
+DEFAULT_MAX_CYCLES = 1_000_000
+
+def load_program(path):
+    """Reads a .asm file and returns its machine code."""
+    with open(path, encoding='utf-8') as f:
+        return assemble(f.read().splitlines())
+
+def make_cpu(machine_code, cache_options=None):
+    """
+    Creates a fresh CPU with the program loaded at address 0.
+    cache_options are hardware.Cache keyword arguments (size, associativity, ...).
+    """
+    cpu = CPU(cache_options)
+    cpu.memory.load(machine_code)
+    return cpu
+
+ENGINES = ('micro', 'fast', 'block')
+
+# Micro-cycles the fast engines run between wall-clock checks
+TIME_SLICE_CYCLES = 200_000
+
+def run(cpu, max_cycles=DEFAULT_MAX_CYCLES, engine='micro', max_time=None):
+    """
+    Steps the CPU until the program halts (a JUMP to itself or a loop that
+    changes nothing, see CPU.loops_forever), the cycle budget is spent or
+    max_time seconds passed, or a breakpoint/watchpoint armed on the CPU is
+    hit (the reason is left in cpu.break_reason).
+    engine='fast' executes whole instructions (see engine.FastEngine) and
+    engine='block' runs translated basic blocks (see translator).
+    Returns "HALTED", "BUDGET", "TIMEOUT" or "BREAK".
+    """
+    if engine == 'micro':
+        return cpu.run(max_cycles, max_time)
+    if engine == 'fast':
+        return _run_engine(FastEngine(cpu), cpu, max_cycles, max_time)
+    executor = TranslatingEngine(cpu)
+    try:
+        return _run_engine(executor, cpu, max_cycles, max_time)
+    finally:
+        executor.block_cache.detach()
+
+def _run_engine(executor, cpu, max_cycles, max_time):
+    if max_time is None:
+        return executor.run(max_cycles)
+
+    deadline = time.perf_counter() + max_time
+    end = cpu.cycle_count + max_cycles
+    while cpu.cycle_count < end:
+        if time.perf_counter() >= deadline:
+            return "TIMEOUT"
+        status = executor.run(min(end - cpu.cycle_count, TIME_SLICE_CYCLES))
+        if status != "BUDGET":
+            return status
+    return "BUDGET"
+
+def parse_address(text, symbols=None):
+    """Parses a number ("500", "0x1F4") or a label of the program."""
+    if symbols and text.upper() in symbols:
+        return symbols[text.upper()]
+    try:
+        return int(text, 0)
+    except ValueError:
+        raise ValueError(f"Invalid address: {text}")
+
+def describe_break(reason):
+    kind, value = reason
+    if kind == "PC":
+        return f"breakpoint em PC {value}"
+    if kind == "MPC":
+        return f"breakpoint em MPC {value}"
+    if kind == "READ":
+        return f"leitura de Mem[{value}]"
+    return f"escrita em Mem[{value}]"
+
+def parse_region(text):
+    """Parses "500" or "500:510" (inclusive) into a (start, end) pair."""
+    if ':' in text:
+        start, end = text.split(':', 1)
+        start, end = int(start, 0), int(end, 0)
+    else:
+        start = end = int(text, 0)
+    if start > end:
+        raise ValueError(f"Invalid memory region: {text}")
+    return start, end
+
+def format_report(cpu, status, elapsed, regions=()):
+    lines = [f"Status: {status}"]
+    if status == "BREAK" and cpu.break_reason is not None:
+        lines[0] += f" ({describe_break(cpu.break_reason)})"
+    lines.append(f"Ciclos: {cpu.cycle_count}  Instrucoes: {cpu.instruction_count}  "
+                 f"Tempo: {elapsed:.3f}s")
+    regs = [('PC', cpu.pc), ('AC', cpu.ac), ('SP', cpu.sp), ('IR', cpu.ir),
+            ('MAR', cpu.mar), ('MBR', cpu.mbr)]
+    for name, reg in regs:
+        val = reg.read()
+        lines.append(f"{name:<4}= {ALU.to_signed(val):6} (0x{val:04X})")
+    lines.append(f"N={int(cpu.alu.n_flag)} Z={int(cpu.alu.z_flag)} MPC={cpu.mpc}")
+    stats = cpu.cache.stats()
+    lines.append(f"Cache: {stats['hits']} acertos, {stats['misses']} faltas "
+                 f"({100 * stats['hit_rate']:.1f}%), {stats['evictions']} substituicoes, "
+                 f"{stats['writebacks']} write-backs")
+    for start, end in regions:
+        for addr in range(start, end + 1):
+            val = cpu.cache.peek(addr) # With write-back the newest value may be only in the cache
+            lines.append(f"Mem[{addr:04}] = {ALU.to_signed(val):6} (0x{val:04X})")
+    return lines
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Executa um programa MAC-1 sem interface grafica.")
+    parser.add_argument("program", help="arquivo .asm")
+    parser.add_argument("--max-cycles", type=int, default=DEFAULT_MAX_CYCLES,
+                        help="limite de microinstrucoes (padrao: %(default)s)")
+    parser.add_argument("--max-time", type=float, default=None, metavar="SEGUNDOS",
+                        help="limite de tempo de execucao")
+    parser.add_argument("--engine", choices=ENGINES, default='micro',
+                        help="micro: passo a passo do microcodigo; fast: instrucao inteira por passo; "
+                             "block: blocos basicos traduzidos")
+    parser.add_argument("--break", dest="breaks", action="append", default=[], metavar="ENDERECO",
+                        help="para antes da instrucao no endereco ou rotulo (pode repetir)")
+    parser.add_argument("--break-mpc", action="append", type=int, default=[], metavar="MPC",
+                        help="para antes da microinstrucao (usa o modo micro)")
+    parser.add_argument("--watch", action="append", default=[], metavar="ENDERECO",
+                        help="para apos leitura ou escrita no endereco")
+    parser.add_argument("--watch-read", action="append", default=[], metavar="ENDERECO")
+    parser.add_argument("--watch-write", action="append", default=[], metavar="ENDERECO")
+    parser.add_argument("--cache-lines", type=int, default=16, metavar="N", help="linhas da cache")
+    parser.add_argument("--cache-ways", type=int, default=1, metavar="N",
+                        help="associatividade (1 = mapeamento direto)")
+    parser.add_argument("--cache-block", type=int, default=1, metavar="N", help="palavras por linha")
+    parser.add_argument("--cache-policy", choices=Cache.POLICIES, default='lru',
+                        help="politica de substituicao")
+    parser.add_argument("--write-back", action="store_true",
+                        help="escritas ficam na cache ate a linha ser substituida")
+    parser.add_argument("--mem", action="append", default=[], metavar="INICIO[:FIM]",
+                        help="regiao de memoria a imprimir (pode repetir)")
+    args = parser.parse_args(argv)
+
+    try:
+        with open(args.program, encoding='utf-8') as f:
+            program = assemble_program(f.read().splitlines())
+        regions = [parse_region(r) for r in args.mem]
+        cpu = make_cpu(program.code, {
+            'size': args.cache_lines, 'associativity': args.cache_ways,
+            'block_size': args.cache_block, 'replacement': args.cache_policy,
+            'write_back': args.write_back,
+        })
+        cpu.breakpoints.update(parse_address(a, program.symbols) for a in args.breaks)
+        cpu.micro_breakpoints.update(args.break_mpc)
+        for text in args.watch:
+            cpu.add_watchpoint(parse_address(text, program.symbols))
+        for text in args.watch_read:
+            cpu.add_watchpoint(parse_address(text, program.symbols), write=False)
+        for text in args.watch_write:
+            cpu.add_watchpoint(parse_address(text, program.symbols), read=False)
+    except (OSError, ValueError) as e:
+        print(f"Erro: {e}", file=sys.stderr)
+        return 2
+
+    start = time.perf_counter()
+    status = run(cpu, args.max_cycles, args.engine, args.max_time)
+    elapsed = time.perf_counter() - start
+
+    print("\n".join(format_report(cpu, status, elapsed, regions)))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
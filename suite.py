@@ -0,0 +1,193 @@
+# suite.py
+# Runs a directory of .asm programs across a process pool and checks the
+# final state of each one against its expectations.
+#
+# Expectations come from header comments in the program:
+#     ; EXPECT AC = 30
+#     ; EXPECT MEM[501] = 30
+#     ; EXPECT STATUS = HALTED
+#     ; MAX-CYCLES 200000
+# or from a sidecar JSON file with the same name (prog.asm -> prog.json):
+#     {"expect": {"AC": 30, "MEM[501]": 30}, "max_cycles": 200000}
+# Sidecar entries override header ones.
+import argparse
+import json
+import os
+import re
+import sys
+import time
+import xml.etree.ElementTree as ET
+from concurrent.futures import ProcessPoolExecutor
+
+import runner
+from assembler import assemble
+
+EXPECT_RE = re.compile(r';\s*EXPECT\s+(\S+)\s*=\s*(\S+)', re.IGNORECASE)
+MAX_CYCLES_RE = re.compile(r';\s*MAX-CYCLES\s+(\d+)', re.IGNORECASE)
+MEM_RE = re.compile(r'MEM\[(\w+)\]$')
+REGISTERS = ('PC', 'AC', 'SP', 'IR', 'MAR', 'MBR')
+
+def parse_expectations(lines):
+    """Reads EXPECT and MAX-CYCLES header comments. Returns (expect, max_cycles)."""
+    expect = {}
+    max_cycles = None
+    for line in lines:
+        match = EXPECT_RE.search(line)
+        if match:
+            expect[match.group(1).upper()] = match.group(2)
+            continue
+        match = MAX_CYCLES_RE.search(line)
+        if match:
+            max_cycles = int(match.group(1))
+    return expect, max_cycles
+
+def actual_value(cpu, status, target):
+    """Value of an expectation target (AC, MEM[501], STATUS, N, ...) in the final state."""
+    if target in REGISTERS:
+        return getattr(cpu, target.lower()).read()
+    if target == 'N':
+        return int(cpu.alu.n_flag)
+    if target == 'Z':
+        return int(cpu.alu.z_flag)
+    if target == 'STATUS':
+        return status
+    if target == 'CYCLES':
+        return cpu.cycle_count
+    match = MEM_RE.match(target)
+    if match:
+        return cpu.cache.peek(int(match.group(1), 0))
+    raise ValueError(f"Unknown expectation target: {target}")
+
+def expected_value(target, text):
+    """
+    Expected value as written in the program. Register, memory and flag
+    targets are 16-bit words (-1 means 0xFFFF); counters such as CYCLES are
+    compared as plain integers.
+    """
+    if target == 'STATUS':
+        return str(text).upper()
+    value = text if isinstance(text, int) else int(text, 0)
+    if target in REGISTERS or target in ('N', 'Z') or MEM_RE.match(target):
+        return value & 0xFFFF
+    return value
+
+def run_program(path, engine='micro', default_max_cycles=runner.DEFAULT_MAX_CYCLES, max_time=None):
+    """Assembles, runs and checks one program. Executed in a worker process."""
+    result = {
+        'name': os.path.splitext(os.path.basename(path))[0],
+        'path': path,
+        'passed': False,
+        'status': None,
+        'cycles': 0,
+        'instructions': 0,
+        'time': 0.0,
+        'failures': [],
+        'error': None,
+    }
+    start = time.perf_counter()
+    try:
+        with open(path, encoding='utf-8') as f:
+            lines = f.read().splitlines()
+        expect, max_cycles = parse_expectations(lines)
+        sidecar = os.path.splitext(path)[0] + '.json'
+        if os.path.exists(sidecar):
+            with open(sidecar, encoding='utf-8') as f:
+                spec = json.load(f)
+            expect.update({k.upper(): v for k, v in spec.get('expect', {}).items()})
+            max_cycles = spec.get('max_cycles', max_cycles)
+
+        cpu = runner.make_cpu(assemble(lines))
+        status = runner.run(cpu, max_cycles or default_max_cycles, engine, max_time)
+        result['status'] = status
+        result['cycles'] = cpu.cycle_count
+        result['instructions'] = cpu.instruction_count
+
+        for target, text in expect.items():
+            want = expected_value(target, text)
+            got = actual_value(cpu, status, target)
+            if got != want:
+                result['failures'].append(f"{target}: esperado {want}, obtido {got}")
+        result['passed'] = not result['failures']
+    except Exception as e:
+        result['error'] = f"{type(e).__name__}: {e}"
+    result['time'] = time.perf_counter() - start
+    return result
+
+def find_programs(directory):
+    return sorted(os.path.join(directory, name) for name in os.listdir(directory)
+                  if name.lower().endswith('.asm'))
+
+def run_suite(paths, engine='micro', jobs=None, max_cycles=runner.DEFAULT_MAX_CYCLES, max_time=None):
+    """Runs every program on a process pool; results keep the order of paths."""
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        futures = [pool.submit(run_program, path, engine, max_cycles, max_time) for path in paths]
+        return [future.result() for future in futures]
+
+def summary(results, elapsed):
+    return {
+        'total': len(results),
+        'passed': sum(r['passed'] for r in results),
+        'failed': sum(not r['passed'] and r['error'] is None for r in results),
+        'errors': sum(r['error'] is not None for r in results),
+        'time': elapsed,
+    }
+
+def write_json(path, results, elapsed):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({'summary': summary(results, elapsed), 'programs': results}, f, indent=2)
+
+def write_junit(path, results, elapsed):
+    totals = summary(results, elapsed)
+    suite = ET.Element('testsuite', name='mic1', tests=str(totals['total']),
+                       failures=str(totals['failed']), errors=str(totals['errors']),
+                       time=f"{elapsed:.3f}")
+    for r in results:
+        case = ET.SubElement(suite, 'testcase', classname='mic1', name=r['name'],
+                             time=f"{r['time']:.3f}")
+        ET.SubElement(case, 'properties').extend([
+            ET.Element('property', name='status', value=str(r['status'])),
+            ET.Element('property', name='cycles', value=str(r['cycles'])),
+            ET.Element('property', name='instructions', value=str(r['instructions'])),
+        ])
+        if r['error'] is not None:
+            ET.SubElement(case, 'error', message=r['error'])
+        elif r['failures']:
+            failure = ET.SubElement(case, 'failure', message=r['failures'][0])
+            failure.text = "\n".join(r['failures'])
+    ET.ElementTree(suite).write(path, encoding='utf-8', xml_declaration=True)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Executa e verifica um diretorio de programas .asm em paralelo.")
+    parser.add_argument("directory", help="diretorio com arquivos .asm")
+    parser.add_argument("--jobs", type=int, default=None, help="processos (padrao: numero de CPUs)")
+    parser.add_argument("--engine", choices=runner.ENGINES, default='fast')
+    parser.add_argument("--max-cycles", type=int, default=runner.DEFAULT_MAX_CYCLES)
+    parser.add_argument("--max-time", type=float, default=None, metavar="SEGUNDOS",
+                        help="limite de tempo por programa")
+    parser.add_argument("--json", metavar="ARQUIVO", help="grava relatorio JSON")
+    parser.add_argument("--junit", metavar="ARQUIVO", help="grava relatorio JUnit XML")
+    args = parser.parse_args(argv)
+
+    paths = find_programs(args.directory)
+    start = time.perf_counter()
+    results = run_suite(paths, args.engine, args.jobs, args.max_cycles, args.max_time)
+    elapsed = time.perf_counter() - start
+
+    for r in results:
+        outcome = "OK" if r['passed'] else ("ERRO" if r['error'] else "FALHOU")
+        print(f"{outcome:<7} {r['name']:<30} {r['status'] or '-':<7} "
+              f"{r['cycles']:>10} ciclos {r['time']:.3f}s")
+        for message in r['failures'] + ([r['error']] if r['error'] else []):
+            print(f"        {message}")
+    totals = summary(results, elapsed)
+    print(f"{totals['passed']}/{totals['total']} ok, {totals['failed']} falhas, "
+          f"{totals['errors']} erros em {elapsed:.2f}s")
+
+    if args.json:
+        write_json(args.json, results, elapsed)
+    if args.junit:
+        write_junit(args.junit, results, elapsed)
+    return 0 if totals['passed'] == totals['total'] else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,255 @@
+# tracefile.py
+# Streaming binary execution traces. One fixed-width record per
+# micro-instruction (or per instruction) is packed into a buffer and
+# written to the file in bulk, optionally through gzip, so runs of any
+# length can be analysed afterwards without holding them in memory.
+# Uncompressed traces are read through mmap, record by record or as
+# NumPy structured arrays that are views of the file.
+#
+# File layout: a 16-byte header (magic, record size, mode) followed by
+# records of RECORD (little endian):
+#     cycle u64, pc u16, ir u16, ac u16, sp u16, addr u16, mpc u8, flags u8
+# addr is MAR; flags tell whether the step read and/or wrote memory and
+# whether the last access hit the cache. mpc is the micro-instruction
+# executed; in instruction traces it is the entry of the microroutine of
+# the executed word (decoder.MPC[ir]).
+import argparse
+import gzip
+import mmap
+import struct
+import sys
+from collections import namedtuple
+
+import runner
+from cpu import MEM_READ
+from decoder import MPC, TEXT
+from engine import FastEngine
+
+MAGIC = b'MIC1TRC1'
+HEADER = struct.Struct('<8sHB5x')
+RECORD = struct.Struct('<QHHHHHBB')
+
+MODE_MICRO = 0       # One record per micro-instruction
+MODE_INSTRUCTION = 1 # One record per MAC-1 instruction
+MODES = {'micro': MODE_MICRO, 'instrucao': MODE_INSTRUCTION}
+
+FLAG_READ = 0x1
+FLAG_WRITE = 0x2
+FLAG_HIT = 0x4
+
+Record = namedtuple('Record', 'cycle pc ir ac sp addr mpc flags')
+
+# Records packed before each write to the file
+BUFFER_RECORDS = 65536
+
+def numpy_dtype():
+    """Structured dtype matching RECORD (requires NumPy)."""
+    import numpy as np
+    return np.dtype([('cycle', '<u8'), ('pc', '<u2'), ('ir', '<u2'), ('ac', '<u2'), ('sp', '<u2'),
+                     ('addr', '<u2'), ('mpc', 'u1'), ('flags', 'u1')])
+
+class TraceWriter:
+    def __init__(self, path, mode=MODE_MICRO, compress=False, buffer_records=BUFFER_RECORDS):
+        self.file = gzip.open(path, 'wb', compresslevel=6) if compress else open(path, 'wb')
+        self.file.write(HEADER.pack(MAGIC, RECORD.size, mode))
+        self.buffer = bytearray(RECORD.size * buffer_records)
+        self.offset = 0
+        self.count = 0
+
+    def write(self, cycle, pc, ir, ac, sp, addr, mpc, flags):
+        RECORD.pack_into(self.buffer, self.offset, cycle, pc, ir, ac, sp, addr, mpc, flags)
+        self.offset += RECORD.size
+        self.count += 1
+        if self.offset == len(self.buffer):
+            self.flush()
+
+    def flush(self):
+        if self.offset:
+            self.file.write(memoryview(self.buffer)[:self.offset])
+            self.offset = 0
+
+    def close(self):
+        self.flush()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+class TraceReader:
+    """
+    Reads a trace file. Plain files are memory-mapped; gzip files are
+    decompressed as a stream (as_array() then has to load them whole).
+    """
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            self.compressed = f.read(2) == b'\x1f\x8b'
+        self.file = gzip.open(path, 'rb') if self.compressed else open(path, 'rb')
+        header = self.file.read(HEADER.size)
+        magic, record_size, self.mode = HEADER.unpack(header) if len(header) == HEADER.size else (None, 0, 0)
+        if magic != MAGIC or record_size != RECORD.size:
+            self.file.close()
+            raise ValueError(f"Not a trace file: {path}")
+        self.map = None
+        if not self.compressed:
+            self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def __len__(self):
+        if self.map is None:
+            raise ValueError("Record count of a compressed trace is unknown until it is read")
+        return (len(self.map) - HEADER.size) // RECORD.size
+
+    def __iter__(self):
+        chunk_size = RECORD.size * BUFFER_RECORDS
+        if self.map is not None:
+            end = HEADER.size + len(self) * RECORD.size
+            for start in range(HEADER.size, end, chunk_size):
+                for fields in RECORD.iter_unpack(self.map[start:min(start + chunk_size, end)]):
+                    yield Record(*fields)
+            return
+        self.file.seek(HEADER.size)
+        while True:
+            chunk = self.file.read(chunk_size)
+            usable = len(chunk) - len(chunk) % RECORD.size
+            for fields in RECORD.iter_unpack(chunk[:usable]):
+                yield Record(*fields)
+            if len(chunk) < chunk_size:
+                return
+
+    def as_array(self, start=0, count=None):
+        """NumPy structured array of records; a view of the file when it is not compressed."""
+        import numpy as np
+        dtype = numpy_dtype()
+        if self.map is not None:
+            total = len(self)
+            count = total - start if count is None else min(count, total - start)
+            return np.frombuffer(self.map, dtype=dtype, count=max(count, 0),
+                                 offset=HEADER.size + start * RECORD.size)
+        self.file.seek(HEADER.size + start * RECORD.size)
+        data = self.file.read(-1 if count is None else count * RECORD.size)
+        return np.frombuffer(data, dtype=dtype, count=len(data) // RECORD.size)
+
+    def close(self):
+        if self.map is not None:
+            try:
+                self.map.close()
+            except BufferError: # Arrays from as_array() still use it; unmapped when they are freed
+                pass
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def record_micro(cpu, writer, max_cycles):
+    """Steps the micro-stepper, one record per micro-instruction. Returns "HALTED" or "BUDGET"."""
+    cache = cpu.cache
+    end = cpu.cycle_count + max_cycles
+    while cpu.cycle_count < end and not cpu.halted:
+        cpu.cycle()
+        flags = 0
+        if cpu.mem_op:
+            flags = FLAG_READ if cpu.mem_op == MEM_READ else FLAG_WRITE
+            if cache.last_access_type == "HIT":
+                flags |= FLAG_HIT
+        writer.write(cpu.cycle_count, cpu.pc.value, cpu.ir.value, cpu.ac.value, cpu.sp.value,
+                     cpu.mar.value, cpu.last_mpc, flags)
+    return "HALTED" if cpu.halted else "BUDGET"
+
+def record_instructions(cpu, writer, max_cycles):
+    """
+    Runs whole instructions (FastEngine), one record per instruction with
+    the state after it and the entry MPC of its microroutine; flags cover
+    all of its memory accesses, the fetch included. Returns "HALTED" or
+    "BUDGET".
+    """
+    cache = cpu.cache
+    read, write = cache.read, cache.write
+    accessed = [0]
+
+    def traced_read(addr):
+        accessed[0] |= FLAG_READ
+        return read(addr)
+
+    def traced_write(addr, val):
+        accessed[0] |= FLAG_WRITE
+        write(addr, val)
+
+    cache.read = traced_read
+    cache.write = traced_write
+    step = FastEngine(cpu).run
+    end = cpu.cycle_count + max_cycles
+    status = "BUDGET"
+    try:
+        while cpu.cycle_count < end:
+            accessed[0] = 0
+            before = cpu.cycle_count
+            status = step(1)
+            if cpu.cycle_count == before:
+                break
+            flags = accessed[0]
+            if cache.last_access_type == "HIT":
+                flags |= FLAG_HIT
+            writer.write(cpu.cycle_count, cpu.pc.value, cpu.ir.value, cpu.ac.value, cpu.sp.value,
+                         cpu.mar.value, MPC[cpu.ir.value], flags)
+            if status != "BUDGET":
+                break
+    finally:
+        vars(cache).pop('read', None)
+        vars(cache).pop('write', None)
+        cpu.update_watch_hooks()
+    return "HALTED" if cpu.halted else "BUDGET"
+
+def record(cpu, path, max_cycles=runner.DEFAULT_MAX_CYCLES, mode=MODE_MICRO, compress=False):
+    """Runs the CPU and streams its trace to path. Returns (status, records written)."""
+    with TraceWriter(path, mode, compress) as writer:
+        if mode == MODE_MICRO:
+            status = record_micro(cpu, writer, max_cycles)
+        else:
+            status = record_instructions(cpu, writer, max_cycles)
+    return status, writer.count
+
+def format_record(rec):
+    kind = ("L" if rec.flags & FLAG_READ else "-") + ("E" if rec.flags & FLAG_WRITE else "-")
+    cache = ("HIT " if rec.flags & FLAG_HIT else "MISS") if rec.flags & (FLAG_READ | FLAG_WRITE) else "    "
+    return (f"{rec.cycle:>10} MPC={rec.mpc:<3} PC={rec.pc:04X} IR={rec.ir:04X} AC={rec.ac:04X} "
+            f"SP={rec.sp:04X} MAR={rec.addr:04X} {kind} {cache} {TEXT[rec.ir]}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Grava e le traces binarios de execucao.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    rec = commands.add_parser("gravar", help="executa um programa gravando o trace")
+    rec.add_argument("program", help="arquivo .asm")
+    rec.add_argument("output", help="arquivo de trace")
+    rec.add_argument("--por", choices=MODES, default='micro',
+                     help="um registro por microinstrucao ou por instrucao")
+    rec.add_argument("--gzip", action="store_true", help="comprime o trace")
+    rec.add_argument("--max-cycles", type=int, default=runner.DEFAULT_MAX_CYCLES)
+    show = commands.add_parser("mostrar", help="imprime os registros de um trace")
+    show.add_argument("trace", help="arquivo de trace")
+    show.add_argument("--limite", type=int, default=50, help="registros a imprimir (0 = todos)")
+    args = parser.parse_args(argv)
+
+    try:
+        if args.command == "gravar":
+            cpu = runner.make_cpu(runner.load_program(args.program))
+            status, count = record(cpu, args.output, args.max_cycles, MODES[args.por], args.gzip)
+            print(f"Status: {status}  Registros: {count}")
+        else:
+            with TraceReader(args.trace) as reader:
+                for i, rec in enumerate(reader):
+                    if args.limite and i >= args.limite:
+                        break
+                    print(format_record(rec))
+    except (OSError, ValueError) as e:
+        print(f"Erro: {e}", file=sys.stderr)
+        return 2
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
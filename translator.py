@@ -0,0 +1,435 @@
+# translator.py
+# Basic-block translation for the instruction-level engine.
+# Straight-line runs of MAC-1 instructions are compiled once into Python
+# functions and executed directly, skipping fetch/decode dispatch on every
+# pass through a loop. Writes into translated code invalidate the block.
+from functools import lru_cache
+
+from engine import FastEngine, instruction_cycles
+from hardware import Cache
+
+MAX_BLOCK_LENGTH = 64
+
+# Conditional jumps and the flag test that makes them jump
+CONDITIONS = {
+    0x4: "not n and not z", # JPOS
+    0x5: "z",               # JZER
+    0xC: "n",               # JNEG
+    0xD: "not z",           # JNZE
+}
+
+@lru_cache(maxsize=4096)
+def _compile(source, start):
+    """Compiled block code; the same program on a new CPU is not compiled again."""
+    return compile(source, f"<block {start:04}>", "exec")
+
+def _accesses_data(word):
+    """Instructions that read or write memory after their fetch."""
+    opcode = word >> 12
+    if opcode == 0xF:
+        return (word >> 8) & 0xF in (0x0, 0x2, 0x4, 0x6, 0x8)
+    return opcode in (0x0, 0x1, 0x2, 0x3, 0x8, 0x9, 0xA, 0xB, 0xE)
+
+def _ends_block(word):
+    """Instructions that can change PC end a basic block."""
+    opcode = word >> 12
+    if opcode in (0x4, 0x5, 0x6, 0xC, 0xD, 0xE):
+        return True
+    return opcode == 0xF and (word >> 8) & 0xF == 0x8 # RETN
+
+class Block:
+    """A translated basic block covering addresses [start, end)."""
+    def __init__(self, start, end, count, cycles, halts, jumps, source, run):
+        self.start = start
+        self.end = end
+        self.count = count   # Instructions in the block
+        self.cycles = cycles # Micro-cycles for a full pass
+        self.halts = halts   # Ends with a JUMP to itself
+        self.jumps = jumps   # Ends with a (conditional) jump
+        self.source = source
+        self.run = run       # run(ac, sp, n, z, read, write) -> new state
+
+def translate(peek, start, limit, max_length=MAX_BLOCK_LENGTH, env=None):
+    """
+    Compiles the basic block starting at `start` into a Block.
+    `peek(addr)` returns the instruction word a fetch would read; `limit` is
+    the first address that cannot be translated (end of memory).
+
+    The generated function performs every fetch and data access in the same
+    order as the micro-stepper, so cache state stays exact. Without `env`
+    they all go through read()/write(). With the names of BlockCache.env (a
+    direct-mapped hardware.Cache), each access tests its line inline and
+    only a miss calls read()/write(): a hit in a direct-mapped line only
+    counts (the hits are added to the cache on return), reads or updates
+    the word and, for a store, updates memory as Cache.write would.
+    It returns (pc, ac, sp, n, z, mar, mbr, ir, instructions, cycles).
+    If a store hits the block itself, it returns right after that
+    instruction, since the rest of the block may have been overwritten.
+    """
+    words = []
+    addr = start
+    while addr < limit and len(words) < max_length:
+        word = peek(addr)
+        words.append(word)
+        addr += 1
+        if _ends_block(word):
+            break
+    for offset, word in enumerate(words[:-1]):
+        if word >> 12 == 0x1 and start <= word & 0xFFF < start + len(words):
+            del words[offset + 1:] # STOD into the block: the rest may be overwritten
+            break
+    end = start + len(words)
+
+    code = [f"def _block_{start:04}(ac, sp, n, z, read, write):"]
+    emit = code.append
+    if env is not None:
+        cache = env['cache']
+        line_size, sets, memory_size = cache.block_size, cache.num_sets, cache.memory.size
+        emit("    h = 0 # Inline hits")
+    has_result = False # Some instruction set the flags (kept in `fr`)
+    count = cycles = 0
+    halts = False
+    pc = None
+
+    def flags():
+        if has_result:
+            return "fr > 0x7FFF", "fr == 0"
+        return "n", "z"
+
+    def locate(addr):
+        """(line, tag, word index) expressions of a constant or variable address."""
+        if isinstance(addr, int):
+            block, offset = divmod(addr, line_size)
+            tag, line = divmod(block, sets)
+            return str(line), str(tag), str(line * line_size + offset)
+        if line_size == 1:
+            emit(f"    l = {addr} % {sets}")
+            emit(f"    t = {addr} // {sets}")
+            return "l", "t", "l"
+        emit(f"    b = {addr} // {line_size}")
+        emit(f"    l = b % {sets}")
+        emit(f"    t = b // {sets}")
+        emit(f"    x = l * {line_size} + {addr} % {line_size}")
+        return "l", "t", "x"
+
+    def emit_read(addr, target, last, comment=""):
+        """
+        A read of addr into target (None for a fetch). last: the final
+        access before the block returns, which leaves last_access_type.
+        """
+        assign = f"{target} = " if target else ""
+        if env is None:
+            emit(f"    {assign}read({addr}){comment}")
+            return
+        line, tag, index = locate(addr)
+        emit(f"    if valid[{line}] and tags[{line}] == {tag}:{comment}")
+        emit("        h += 1")
+        if target:
+            emit(f"        {target} = data[{index}]")
+        if last:
+            emit('        cache.last_access_type = "HIT"')
+        emit("    else:")
+        emit(f"        {assign}read({addr})")
+
+    def emit_write(addr, value, last):
+        if env is None:
+            emit(f"    write({addr}, {value})")
+            return
+        line, tag, index = locate(addr)
+        emit(f"    if valid[{line}] and tags[{line}] == {tag}:")
+        emit("        h += 1")
+        if cache.write_back:
+            emit(f"        if data[{index}] != {value}:")
+            emit("            memory.mutations += 1")
+            emit(f"        dirty[{line}] = 1")
+        elif isinstance(addr, int) and addr < memory_size:
+            emit(f"        if mem[{addr}] != {value}:")
+            emit(f"            mem[{addr}] = {value}")
+            emit("            memory.mutations += 1")
+        elif isinstance(addr, int):
+            # Above the end of memory the word only lives in the line
+            emit(f"        if data[{index}] != {value}:")
+            emit("            memory.mutations += 1")
+        else:
+            emit(f"        if {addr} < {memory_size}:")
+            emit(f"            if mem[{addr}] != {value}:")
+            emit(f"                mem[{addr}] = {value}")
+            emit("                memory.mutations += 1")
+            emit(f"        elif data[{index}] != {value}:")
+            emit("            memory.mutations += 1")
+        emit(f"        data[{index}] = {value}")
+        if not isinstance(addr, int):
+            emit(f"        if {addr} < {memory_size} and covering[{addr}]:")
+            emit(f"            invalidate({addr})")
+        elif addr < memory_size:
+            emit(f"        if covering[{addr}]:")
+            emit(f"            invalidate({addr})")
+        if last:
+            emit('        cache.last_access_type = "HIT"')
+        emit("    else:")
+        emit(f"        write({addr}, {value})")
+
+    def emit_return(values, indent="    "):
+        if env is not None:
+            emit(f"{indent}cache.hits += h")
+        emit(f"{indent}return {values}")
+
+    for offset, word in enumerate(words):
+        addr = start + offset
+        next_pc = (addr + 1) & 0xFFFF
+        opcode = word >> 12
+        arg = word & 0xFFF
+        count += 1
+        cycles += instruction_cycles(word)
+        last = offset == len(words) - 1
+        # Fetch: MAR <- PC, MBR <- Mem[MAR], IR <- MBR
+        emit_read(addr, None, last and not _accesses_data(word), f" # 0x{word:04X}")
+        mar, mbr = str(addr), str(word)
+        stored = None # Variable address written by this instruction
+        # Stores to a variable address are followed by a check that may
+        # return right after them, so they always leave last_access_type
+
+        if opcode == 0x0: # LODD
+            mar = str(arg)
+            emit_read(arg, "mbr", last)
+            emit("    ac = fr = mbr")
+            mbr = "mbr"
+            has_result = True
+        elif opcode == 0x1: # STOD
+            mar, mbr = str(arg), "ac"
+            emit_write(arg, "ac", last)
+        elif opcode in (0x2, 0x3): # ADDD / SUBD
+            mar, mbr = str(arg), "mbr"
+            op = "+" if opcode == 0x2 else "-"
+            emit_read(arg, "mbr", last)
+            emit(f"    ac = fr = (ac {op} mbr) & 0xFFFF")
+            has_result = True
+        elif opcode == 0x6: # JUMP
+            pc = str(arg)
+            halts = arg == addr
+        elif opcode == 0x7: # LOCO
+            emit(f"    ac = fr = {arg}")
+            has_result = True
+        elif opcode == 0x8: # LODL
+            mar, mbr = "mar", "mbr"
+            emit(f"    mar = (sp + {arg}) & 0xFFF")
+            emit_read("mar", "mbr", last)
+            emit("    ac = fr = mbr")
+            has_result = True
+        elif opcode == 0x9: # STOL
+            mar, mbr = "mar", "ac"
+            emit(f"    mar = (sp + {arg}) & 0xFFF")
+            emit_write("mar", "ac", True)
+            stored = "mar"
+        elif opcode in (0xA, 0xB): # ADDL / SUBL
+            mar, mbr = "mar", "mbr"
+            op = "+" if opcode == 0xA else "-"
+            emit(f"    mar = (sp + {arg}) & 0xFFF")
+            emit_read("mar", "mbr", last)
+            emit(f"    ac = fr = (ac {op} mbr) & 0xFFFF")
+            has_result = True
+        elif opcode in CONDITIONS:
+            if has_result:
+                emit("    n = fr > 0x7FFF")
+                emit("    z = fr == 0")
+                has_result = False
+            pc = f"({arg} if {CONDITIONS[opcode]} else {next_pc})"
+        elif opcode == 0xE: # CALL
+            mar, mbr = "sp", str(next_pc)
+            emit("    sp = (sp - 1) & 0xFFFF")
+            emit_write("sp", next_pc, last)
+            pc = str(arg)
+        elif opcode == 0xF:
+            sub_opcode = arg >> 8
+            if sub_opcode == 0x0: # PSHI
+                mar, mbr = "sp", "mbr"
+                emit("    sp = (sp - 1) & 0xFFFF")
+                emit_read("ac", "mbr", False)
+                emit_write("sp", "mbr", True)
+                stored = "sp"
+            elif sub_opcode == 0x2: # POPI
+                mar, mbr = "ac", "mbr"
+                emit_read("sp", "mbr", False)
+                emit_write("ac", "mbr", True)
+                emit("    sp = (sp + 1) & 0xFFFF")
+                stored = "ac"
+            elif sub_opcode == 0x4: # PUSH
+                mar, mbr = "sp", "ac"
+                emit("    sp = (sp - 1) & 0xFFFF")
+                emit_write("sp", "ac", True)
+                stored = "sp"
+            elif sub_opcode == 0x6: # POP
+                mar, mbr = "mar", "mbr"
+                emit("    mar = sp")
+                emit_read("mar", "mbr", last)
+                emit("    ac = mbr")
+                emit("    sp = (sp + 1) & 0xFFFF")
+            elif sub_opcode == 0x8: # RETN
+                mar, mbr = "mar", "mbr"
+                emit("    mar = sp")
+                emit_read("mar", "mbr", last)
+                emit("    sp = (sp + 1) & 0xFFFF")
+                pc = "mbr"
+            elif sub_opcode == 0xA: # SWAP
+                emit("    ac, sp = sp, ac")
+            elif sub_opcode == 0xC: # INSP
+                emit(f"    sp = (sp + {arg & 0xFF}) & 0xFFFF")
+            elif sub_opcode == 0xE: # DESP
+                emit(f"    sp = (sp - {arg & 0xFF}) & 0xFFFF")
+
+        if stored is not None and not last:
+            # Self-modifying code: leave before running stale instructions
+            n_expr, z_expr = flags()
+            emit(f"    if {start} <= {stored} < {end}:")
+            emit_return(f"{next_pc}, ac, sp, {n_expr}, {z_expr}, {mar}, {mbr}, {word}, {count}, {cycles}",
+                        "        ")
+
+    if pc is None:
+        pc = str(next_pc)
+    n_expr, z_expr = flags()
+    emit_return(f"{pc}, ac, sp, {n_expr}, {z_expr}, {mar}, {mbr}, {word}, {count}, {cycles}")
+
+    source = "\n".join(code)
+    namespace = dict(env) if env is not None else {}
+    exec(_compile(source, start), namespace)
+    run = namespace[f"_block_{start:04}"]
+    jumps = (words[-1] >> 12) in (0x4, 0x5, 0x6, 0xC, 0xD)
+    return Block(start, end, count, cycles, halts, jumps, source, run)
+
+class BlockCache:
+    """
+    Translated blocks of one CPU, keyed by start address.
+    Hooks the CPU's cache writes (every store of the program goes through
+    the cache) to drop any block whose code was overwritten; call detach()
+    when done. With a direct-mapped hardware.Cache, env holds the names the
+    blocks use to access it inline (see translate).
+    """
+    def __init__(self, cpu, max_length=MAX_BLOCK_LENGTH):
+        self.cpu = cpu
+        self.size = cpu.memory.size
+        self.max_length = max_length
+        self.blocks = {}
+        self.covering = [None] * self.size # Blocks translated from each address
+        self.translations = 0
+        self.invalidations = 0
+        cache = cpu.cache
+        self.env = None
+        if isinstance(cache, Cache) and cache.associativity == 1:
+            self.env = {'cache': cache, 'valid': cache.valid, 'tags': cache.tags, 'data': cache.data,
+                        'dirty': cache.dirty, 'memory': cache.memory, 'mem': cache.memory.data,
+                        'covering': self.covering, 'invalidate': self.invalidate}
+        cache.on_write = self.invalidate
+
+    def detach(self):
+        if self.cpu.cache.on_write == self.invalidate:
+            self.cpu.cache.on_write = None
+
+    def wrapped(self):
+        """True if the cache or memory accesses are wrapped, which inline accesses would skip."""
+        # Not vars(cache): building the instance dict slows every later attribute access
+        cache = self.cpu.cache
+        return self.env is not None and (getattr(cache.read, '__func__', None) is not Cache.read or
+                                         getattr(cache.write, '__func__', None) is not Cache.write or
+                                         cache.memory.on_write is not None)
+
+    def lookup(self, pc):
+        """Block starting at pc, translated on first use. None outside memory."""
+        block = self.blocks.get(pc)
+        if block is None and pc < self.size:
+            block = translate(self.cpu.cache.peek, pc, self.size, self.max_length, self.env)
+            self.blocks[pc] = block
+            self.translations += 1
+            for addr in range(block.start, block.end):
+                if self.covering[addr] is None:
+                    self.covering[addr] = [block]
+                else:
+                    self.covering[addr].append(block)
+        return block
+
+    def invalidate(self, addr):
+        if not 0 <= addr < self.size:
+            return
+        blocks = self.covering[addr]
+        if blocks:
+            for block in blocks[:]:
+                self._drop(block)
+
+    def _drop(self, block):
+        if self.blocks.get(block.start) is block:
+            del self.blocks[block.start]
+            self.invalidations += 1
+        for addr in range(block.start, block.end):
+            blocks = self.covering[addr]
+            if blocks and block in blocks:
+                blocks.remove(block)
+                if not blocks:
+                    self.covering[addr] = None
+
+class TranslatingEngine(FastEngine):
+    """
+    FastEngine that runs translated basic blocks. Falls back to FastEngine
+    outside memory (until pc is back inside it) and to single instructions
+    when a whole block no longer fits in the cycle budget, so budgets
+    behave as in FastEngine, and to
+    plain FastEngine while breakpoints or watchpoints are armed or the
+    cache accesses are wrapped (e.g. cachesim.AccessCounter), since inline
+    hits would bypass the wrapper.
+    """
+    def __init__(self, cpu, block_cache=None):
+        super().__init__(cpu)
+        self.block_cache = block_cache or BlockCache(cpu)
+
+    def run(self, max_cycles):
+        cpu = self.cpu
+        if cpu.debug_armed or self.block_cache.wrapped():
+            # Blocks neither check breakpoints nor call wrapped reads on a hit
+            return FastEngine.run(self, max_cycles)
+        max_cycles -= self.finish_instruction(max_cycles)
+        if cpu.mpc != 0:
+            return "BUDGET"
+
+        if cpu.halted:
+            return "HALTED"
+
+        blocks = self.block_cache.blocks
+        lookup = self.block_cache.lookup
+        read = cpu.cache.read
+        write = cpu.cache.write
+        loops_forever = cpu.loops_forever
+        pc, ac, sp, ir, mar, mbr, n, z = self.load_state()
+        cycles = 0
+        count = 0
+        status = "BUDGET"
+
+        while cycles < max_cycles:
+            block = blocks.get(pc) or lookup(pc)
+            if block is None or cycles + block.cycles > max_cycles:
+                self.store_state(pc, ac, sp, ir, mar, mbr, n, z, cycles, count)
+                max_cycles -= cycles
+                cycles = count = 0
+                before = cpu.cycle_count
+                if block is None:
+                    # Outside memory: interpret until pc is back inside it
+                    status = FastEngine.run(self, max_cycles, self.block_cache.size)
+                else:
+                    # Interpret one instruction
+                    status = FastEngine.run(self, 1)
+                max_cycles -= cpu.cycle_count - before
+                pc, ac, sp, ir, mar, mbr, n, z = self.load_state()
+                if status == "HALTED":
+                    break
+                status = "BUDGET"
+                continue
+
+            pc, ac, sp, n, z, mar, mbr, ir, done, spent = block.run(ac, sp, n, z, read, write)
+            count += done
+            cycles += spent
+            if done == block.count and block.jumps and pc < block.end:
+                # Taken jump back into or before the block
+                if block.halts or loops_forever(pc, ac, sp, n, z):
+                    status = "HALTED"
+                    break
+
+        self.store_state(pc, ac, sp, ir, mar, mbr, n, z, cycles, count)
+        cpu.halted = status == "HALTED"
+        return status
@@ -0,0 +1,454 @@
+# worker.py
+# Runs the simulator in a separate process, so the simulation gets a core
+# of its own and the GUI process only renders. Commands (step, run, pause,
+# breakpoints, reset, load) go to the worker over a pipe; stops at the end of the
+# program or at a breakpoint come back the same way, and so do the states
+# of every micro-instruction run at a fixed speed, for the history.
+#
+# The worker publishes the registers and the 4096 memory words into
+# multiprocessing.shared_memory, alternating between two slots. Each slot
+# starts with a sequence number that is odd while the slot is being
+# written (a seqlock): the reader takes the latest slot and retries if the
+# number was odd or changed, so it gets a consistent state without locks.
+# The memory words are then used in place (hardware.Memory over the slot),
+# never copied. A slot is only rewritten two publications after it stopped
+# being the latest, and publications are at least PUBLISH_INTERVAL apart,
+# which leaves a frame plenty of time to draw from it.
+import multiprocessing
+import struct
+import time
+from array import array
+from collections import namedtuple
+from multiprocessing import shared_memory
+
+from cpu import CPU, MEM_READ, MEM_WRITE, PATH_BITS, MicroState, describe
+from engine import FastEngine
+from hardware import Memory
+
+MEMORY_WORDS = 4096
+
+# Index of the latest slot
+CONTROL = struct.Struct('<I4x')
+# Slot header: seq, cycle_count, instruction_count, fast_instructions, pc ac
+# sp ir tir mar mbr mpc last_mpc, active, mem_op, alu_op, flags, cache access
+SLOT_HEADER = struct.Struct('<IQQQ9HI4B2x')
+SEQ = struct.Struct('<I')
+SLOT_SIZE = SLOT_HEADER.size + 2 * MEMORY_WORDS
+BLOCK_SIZE = CONTROL.size + 2 * SLOT_SIZE
+
+PublishedState = namedtuple('PublishedState', 'seq cycle_count instruction_count fast_instructions '
+                                              'pc ac sp ir tir mar mbr '
+                                              'mpc last_mpc active mem_op alu_op flags access')
+
+NO_MPC = 0xFFFF # last_mpc of a CPU that has not run yet
+ALU_OPS = (None, 'ADD', 'SUB')
+ACCESS_TYPES = ("NONE", "HIT", "MISS")
+FLAG_N = 0x1
+FLAG_Z = 0x2
+FLAG_HALTED = 0x4
+FLAG_FAST = 0x8 # Reached by whole-instruction runs (FastEngine), fast_instructions of them
+
+# Fields of each traced micro-instruction (StepTracer)
+TRACE_FIELDS = ('last_mpc', 'pc', 'ac', 'sp', 'ir', 'mar', 'mbr', 'flags')
+
+# Cycles per slice when running at full speed (commands are read between slices)
+RUN_SLICE = 100_000
+PUBLISH_INTERVAL = 1 / 120
+
+# The GUI side gives up on a worker that does not publish its first state
+# within STARTUP_TIMEOUT seconds, or whose slots stay mid-write for
+# READ_ATTEMPTS reads in a row
+STARTUP_TIMEOUT = 10.0
+READ_ATTEMPTS = 100_000
+
+def slot_offset(index):
+    return CONTROL.size + index * SLOT_SIZE
+
+class StatePublisher:
+    """Worker side: writes the CPU state into the slot that is not the latest."""
+    def __init__(self, buf):
+        self.buf = buf
+        self.latest = 0
+        self.seqs = [0, 0]
+        self.published_at = 0.0
+
+    def publish(self, cpu, fast_instructions=None):
+        """
+        fast_instructions: instructions run by FastEngine since the last
+        publication, if that is how the CPU got to its state.
+        """
+        buf = self.buf
+        index = self.latest ^ 1
+        offset = slot_offset(index)
+        seq = self.seqs[index] + 1 # Odd: being written
+        SEQ.pack_into(buf, offset, seq)
+        alu = cpu.alu
+        flags = (FLAG_N if alu.n_flag else 0) | (FLAG_Z if alu.z_flag else 0) | \
+                (FLAG_HALTED if cpu.halted else 0) | (FLAG_FAST if fast_instructions is not None else 0)
+        access = cpu.cache.last_access_type
+        SLOT_HEADER.pack_into(
+            buf, offset, seq, cpu.cycle_count, cpu.instruction_count, fast_instructions or 0,
+            cpu.pc.value, cpu.ac.value, cpu.sp.value, cpu.ir.value, cpu.tir.value,
+            cpu.mar.value, cpu.mbr.value, cpu.mpc,
+            NO_MPC if cpu.last_mpc is None else cpu.last_mpc,
+            cpu.active, cpu.mem_op,
+            ALU_OPS.index(cpu.alu_op) if cpu.alu_op in ALU_OPS else 0,
+            flags, ACCESS_TYPES.index(access) if access in ACCESS_TYPES else 0)
+        start = offset + SLOT_HEADER.size
+        buf[start:start + 2 * MEMORY_WORDS] = memoryview(cpu.memory.data).cast('B')
+        SEQ.pack_into(buf, offset, seq + 1)
+        self.seqs[index] = seq + 1
+        CONTROL.pack_into(buf, 0, index)
+        self.latest = index
+        self.published_at = time.perf_counter()
+
+class StepTracer:
+    """
+    Worker side: observer of CPU.run that keeps the cycle count and the
+    TRACE_FIELDS of every micro-instruction, sent to the GUI once per tick.
+    """
+    def __init__(self):
+        self.cycles = array('Q')
+        self.steps = array('H')
+
+    def __call__(self, cpu):
+        alu = cpu.alu
+        self.cycles.append(cpu.cycle_count)
+        self.steps.extend((cpu.last_mpc, cpu.pc.value, cpu.ac.value, cpu.sp.value, cpu.ir.value,
+                           cpu.mar.value, cpu.mbr.value,
+                           (FLAG_N if alu.n_flag else 0) | (FLAG_Z if alu.z_flag else 0)))
+
+    def send(self, conn, generation):
+        if self.cycles:
+            conn.send(("trace", generation, self.cycles.tobytes(), self.steps.tobytes()))
+            self.cycles = array('Q')
+            self.steps = array('H')
+
+def serve(conn, shm_name, cache_options=None):
+    """Worker process: executes commands from conn until "quit"."""
+    shm = shared_memory.SharedMemory(name=shm_name)
+    publisher = StatePublisher(shm.buf)
+    cpu = CPU(cache_options)
+    publisher.publish(cpu)
+    cycles = None   # Cycles per tick when running at a fixed speed
+    free_run = False
+    period = 0.0
+    next_tick = 0.0
+    fast = None # Instructions run by FastEngine since the last publication, while only it ran
+    tracer = None # StepTracer of a fixed-speed run that keeps the history
+    generation = 0 # CPUs started by reset/load, to tell their traces apart
+    try:
+        while True:
+            if free_run:
+                timeout = 0
+            elif cycles is not None:
+                timeout = max(0.0, next_tick - time.perf_counter())
+            else:
+                timeout = None
+            if conn.poll(timeout):
+                command, *args = conn.recv()
+                if command == "quit":
+                    break
+                if command in ("reset", "load"):
+                    cpu = CPU(cache_options)
+                    generation += 1
+                    if command == "load":
+                        cpu.memory.load(args[0])
+                    cycles, free_run = None, False
+                    fast = None
+                elif command == "step":
+                    cpu.cycle()
+                    fast = None
+                elif command == "run":
+                    rate, trace, breakpoints = args[1], args[2], args[3]
+                    cpu.breakpoints.clear()
+                    cpu.breakpoints.update(breakpoints)
+                    tracer = StepTracer() if trace and args[0] is not None else None
+                    cycles, free_run = args[0], args[0] is None
+                    period = 1 / rate
+                    next_tick = time.perf_counter()
+                elif command == "pause":
+                    cycles, free_run = None, False
+                elif command == "breakpoints":
+                    cpu.breakpoints.clear()
+                    cpu.breakpoints.update(args[0])
+                publisher.publish(cpu, fast)
+                continue
+
+            if free_run:
+                before = cpu.instruction_count
+                status = FastEngine(cpu).run(RUN_SLICE)
+                fast = (fast or 0) + cpu.instruction_count - before
+                if status == "BUDGET" and time.perf_counter() - publisher.published_at < PUBLISH_INTERVAL:
+                    continue
+            elif cycles is not None:
+                status = cpu.run(cycles, observer=tracer)
+                fast = None
+                if tracer is not None:
+                    # Before the state is published: the GUI has the steps up to any state it reads
+                    tracer.send(conn, generation)
+                next_tick = max(next_tick + period, time.perf_counter() - period)
+            else:
+                continue
+            publisher.publish(cpu, fast)
+            if fast is not None:
+                fast = 0
+            if status in ("HALTED", "BREAK"):
+                cycles, free_run = None, False
+                conn.send(("stop", status, cpu.break_reason))
+    finally:
+        # The views of the slots must go before the block can be closed
+        del publisher
+        shm.close()
+
+class _RegisterView:
+    """Register of the published state (read() only, like hardware.Register)."""
+    def __init__(self, remote, field):
+        self.remote = remote
+        self.field = field
+
+    def read(self):
+        return getattr(self.remote.state, self.field)
+
+    @property
+    def value(self):
+        return self.read()
+
+class _CacheView:
+    def __init__(self, remote):
+        self.remote = remote
+
+    @property
+    def last_access_type(self):
+        return ACCESS_TYPES[self.remote.state.access]
+
+class RemoteCPU:
+    """
+    A CPU running in a worker process. Has the attributes the GUI draws
+    (registers, memory, signals, mpc...), taken from the state published in
+    shared memory at the last update(), and the same commands as
+    main.LocalSession.
+    """
+    def __init__(self, cache_options=None):
+        context = multiprocessing.get_context('spawn') # No pygame/SDL state in the worker
+        self.shm = shared_memory.SharedMemory(create=True, size=BLOCK_SIZE)
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(target=serve, args=(child_conn, self.shm.name, cache_options),
+                                       daemon=True)
+        self.process.start()
+        child_conn.close()
+        self.memories = [Memory(MEMORY_WORDS, self.shm.buf[slot_offset(i) + SLOT_HEADER.size:
+                                                           slot_offset(i) + SLOT_SIZE])
+                         for i in range(2)]
+        self.memory = self.memories[0]
+        self.breakpoints = set()
+        self.break_reason = None
+        self.request = None # Run command in effect in the worker
+        for name in ('pc', 'ac', 'sp', 'ir', 'tir', 'mar', 'mbr'):
+            setattr(self, name, _RegisterView(self, name))
+        self.cache = _CacheView(self)
+        self.state = None
+        self.generation = -1
+        self.new_generation()
+        deadline = time.perf_counter() + STARTUP_TIMEOUT
+        try:
+            while not self.update():
+                self.check_alive()
+                if time.perf_counter() > deadline:
+                    raise RuntimeError(f"Simulation worker published no state within {STARTUP_TIMEOUT} s")
+                time.sleep(0.001)
+        except BaseException:
+            self.close()
+            raise
+
+    @property
+    def cpu(self):
+        return self
+
+    def check_alive(self):
+        """Raises RuntimeError if the worker process is gone."""
+        if not self.process.is_alive():
+            raise RuntimeError(f"Simulation worker exited (exit code {self.process.exitcode})")
+
+    # --- Published state ---
+    def update(self):
+        """
+        Takes the latest consistent state published by the worker. False if
+        nothing was published yet. Raises RuntimeError if no consistent
+        state could be read in READ_ATTEMPTS tries.
+        """
+        buf = self.shm.buf
+        for _ in range(READ_ATTEMPTS):
+            index = CONTROL.unpack_from(buf, 0)[0]
+            offset = slot_offset(index)
+            seq = SEQ.unpack_from(buf, offset)[0]
+            if seq == 0:
+                return False
+            if seq & 1:
+                continue
+            state = PublishedState(*SLOT_HEADER.unpack_from(buf, offset))
+            if SEQ.unpack_from(buf, offset)[0] == seq:
+                self.state = state
+                self.memory = self.memories[index]
+                self.index = index
+                return True
+        self.check_alive()
+        raise RuntimeError(f"No consistent state from the simulation worker after {READ_ATTEMPTS} reads")
+
+    def consistent(self):
+        """True while the memory of the last update() has not been overwritten."""
+        return SEQ.unpack_from(self.shm.buf, slot_offset(self.index))[0] == self.state.seq
+
+    @property
+    def cycle_count(self):
+        return self.state.cycle_count
+
+    @property
+    def instruction_count(self):
+        return self.state.instruction_count
+
+    @property
+    def mpc(self):
+        return self.state.mpc
+
+    @property
+    def halted(self):
+        return bool(self.state.flags & FLAG_HALTED)
+
+    @property
+    def active(self):
+        return self.state.active
+
+    @property
+    def signals(self):
+        state = self.state
+        return {
+            'read_mem': state.mem_op == MEM_READ,
+            'write_mem': state.mem_op == MEM_WRITE,
+            'alu_op': ALU_OPS[state.alu_op],
+            'active_path': [name for name, bit in PATH_BITS.items() if state.active & bit]
+        }
+
+    def is_active(self, name):
+        return (self.state.active & PATH_BITS[name]) != 0
+
+    @property
+    def last_mpc(self):
+        return None if self.state.last_mpc == NO_MPC else self.state.last_mpc
+
+    def snapshot(self):
+        state = self.state
+        return MicroState(self.last_mpc, state.pc, state.ac, state.sp, state.ir, state.mar, state.mbr,
+                          bool(state.flags & FLAG_N), bool(state.flags & FLAG_Z))
+
+    @property
+    def last_action_desc(self):
+        if self.state.flags & FLAG_FAST:
+            return f"Execução rápida: {self.state.fast_instructions} instruções"
+        if self.last_mpc is None:
+            return "CPU Inicializada"
+        return describe(self.snapshot())
+
+    # --- Commands ---
+    def send(self, *command):
+        self.check_alive()
+        self.conn.send(command)
+
+    def reset(self):
+        self.request = None
+        self.new_generation()
+        self.send("reset")
+
+    def load(self, code):
+        self.request = None
+        self.new_generation()
+        self.send("load", list(code))
+
+    def new_generation(self):
+        """Counted like in serve(): traces of earlier CPUs are dropped."""
+        self.generation += 1
+        self.trace_cycles = array('Q')
+        self.trace_steps = array('H')
+
+    def step(self):
+        self.send("step")
+
+    def set_breakpoints(self, addrs):
+        """Breakpoints of the next run; a run in progress gets them at once."""
+        self.breakpoints = set(addrs)
+        if self.request is not None:
+            self.send("breakpoints", tuple(self.breakpoints))
+
+    def run_frame(self, mode, speed, observer=None):
+        """
+        Keeps the worker running as asked by mode ("RUN" at the selected
+        speed, "RUN_BREAK" at full speed, None paused) and takes the state
+        it published. Returns "HALTED" or "BREAK" if it stopped by itself.
+        observer: as in main.SpeedControl.run_frame; it is called with this
+        object showing each micro-instruction the worker ran up to the
+        published state.
+        """
+        self.check_alive()
+        if mode is None:
+            request = None
+        else:
+            cycles = speed.cycles_per_frame if mode == "RUN" else None
+            request = (cycles, speed.frame_rate, observer is not None)
+        if request != self.request:
+            if request is None:
+                self.send("pause")
+            else:
+                self.send("run", *request, tuple(self.breakpoints))
+            self.request = request
+        status = self.receive()
+        self.update()
+        # The traces of the steps up to the state read were sent before it
+        status = self.receive() or status
+        if observer is not None:
+            self.replay(observer)
+        return status
+
+    def receive(self):
+        """Takes the messages of the worker: keeps traces, returns the status of a stop."""
+        status = None
+        while self.conn.poll():
+            kind, *args = self.conn.recv()
+            if kind == "trace":
+                if args[0] == self.generation:
+                    self.trace_cycles.frombytes(args[1])
+                    self.trace_steps.frombytes(args[2])
+            else:
+                status, self.break_reason = args
+                self.request = None
+        return status
+
+    def replay(self, observer):
+        """Calls observer for each traced step up to the published state."""
+        published = self.state
+        cycles, steps = self.trace_cycles, self.trace_steps
+        width = len(TRACE_FIELDS)
+        done = 0
+        try:
+            for done, cycle in enumerate(cycles):
+                if cycle > published.cycle_count:
+                    break
+                step = dict(zip(TRACE_FIELDS, steps[done * width:(done + 1) * width]))
+                self.state = published._replace(cycle_count=cycle, **step)
+                observer(self)
+            else:
+                done = len(cycles)
+        finally:
+            self.state = published
+        del cycles[:done]
+        del steps[:done * width]
+
+    def close(self):
+        if self.process.is_alive():
+            self.send("quit")
+            self.process.join(1)
+        if self.process.is_alive():
+            self.process.terminate()
+        self.conn.close()
+        self.memories = self.memory = None
+        self.shm.close()
+        self.shm.unlink()